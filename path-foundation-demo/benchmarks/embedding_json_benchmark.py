@@ -0,0 +1,144 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compares V2 embedding response serialization paths.
+
+  asdict: PatchEmbeddingV2 per patch, dataclasses.asdict, json.dumps, gzip.
+  mapping: embedding_instance_response_v2(EmbeddingMatrixV2), json.dumps,
+    gzip.
+  writer: embedding_response_v2_to_json_chunks streamed through iter_gzip.
+
+Each path is timed to JSON bytes and to gzip bytes; uncompressed output of
+every path is checked to be byte identical.
+
+  python benchmarks/embedding_json_benchmark.py --patches=1000,10000,100000
+"""
+
+import dataclasses
+import gzip
+import json
+import os
+import sys
+import time
+from typing import Any, Mapping, Sequence
+
+from absl import app
+from absl import flags
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# pylint: disable=g-import-not-at-top
+from data_models import embedding_converter
+from data_models import embedding_json
+from data_models import embedding_response
+from data_models import patch_coordinate
+# pylint: enable=g-import-not-at-top
+
+_PATCHES = flags.DEFINE_list(
+    'patches', ['1000', '10000', '100000'], 'Patch counts to benchmark.'
+)
+_DIMENSIONS = flags.DEFINE_integer('dimensions', 384, 'Embedding dimensions.')
+_MAX_ASDICT_PATCHES = flags.DEFINE_integer(
+    'max_asdict_patches',
+    10000,
+    'Skip the (slow) asdict path above this many patches.',
+)
+
+
+def _asdict_json(matrix: embedding_response.EmbeddingMatrixV2) -> bytes:
+  results = [
+      embedding_response.PatchEmbeddingV2(
+          embedding_vector=row.tolist(), patch_coordinate=coord
+      )
+      for row, coord in zip(matrix.embeddings, matrix.patch_coordinates)
+  ]
+  response = {
+      'predictions': [{
+          'result': {
+              'patch_embeddings': [dataclasses.asdict(r) for r in results]
+          }
+      }]
+  }
+  return json.dumps(response).encode('utf-8')
+
+
+def _mapping_json(matrix: embedding_response.EmbeddingMatrixV2) -> bytes:
+  return json.dumps(
+      embedding_converter.embedding_response_v2_to_json(
+          [embedding_response.embedding_instance_response_v2(matrix)]
+      )
+  ).encode('utf-8')
+
+
+def _writer_chunks(matrix: embedding_response.EmbeddingMatrixV2):
+  return embedding_converter.embedding_response_v2_to_json_chunks([matrix])
+
+
+def _time(function, *args) -> Mapping[str, Any]:
+  start = time.perf_counter()
+  result = function(*args)
+  return result, time.perf_counter() - start
+
+
+def main(argv: Sequence[str]) -> None:
+  del argv
+  results = []
+  for patches in (int(p) for p in _PATCHES.value):
+    embeddings = (
+        np.random.default_rng(0)
+        .standard_normal((patches, _DIMENSIONS.value))
+        .astype(np.float32)
+    )
+    index = np.arange(patches, dtype=np.int64)
+    matrix = embedding_response.EmbeddingMatrixV2(
+        embeddings=embeddings,
+        patch_coordinates=patch_coordinate.PatchCoordinateArray(
+            224 * (index % 1000), 224 * (index // 1000)
+        ),
+    )
+    timings = {}
+    outputs = {}
+    paths = [('mapping', _mapping_json)]
+    if patches <= _MAX_ASDICT_PATCHES.value:
+      paths.insert(0, ('asdict', _asdict_json))
+    for name, function in paths:
+      outputs[name], json_seconds = _time(function, matrix)
+      _, gzip_seconds = _time(gzip.compress, outputs[name])
+      timings[name] = {
+          'json_seconds': json_seconds,
+          'json_and_gzip_seconds': json_seconds + gzip_seconds,
+      }
+    outputs['writer'], json_seconds = _time(
+        lambda m: b''.join(_writer_chunks(m)), matrix
+    )
+    _, stream_seconds = _time(
+        lambda m: b''.join(embedding_json.iter_gzip(_writer_chunks(m))), matrix
+    )
+    timings['writer'] = {
+        'json_seconds': json_seconds,
+        'json_and_gzip_seconds': stream_seconds,
+    }
+    if len({output for output in outputs.values()}) != 1:
+      raise ValueError(f'Serialized responses differ for {patches} patches.')
+    results.append({
+        'patches': patches,
+        'json_bytes': len(outputs['writer']),
+        'timings': timings,
+    })
+  print(json.dumps({'dimensions': _DIMENSIONS.value, 'results': results},
+                   indent=2))
+
+
+if __name__ == '__main__':
+  app.run(main)
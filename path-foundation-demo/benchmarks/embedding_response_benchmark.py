@@ -0,0 +1,150 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measures memory used to build and serialize an embedding response.
+
+Compares the per patch list path (tolist per embedding, PatchEmbeddingV2 list,
+dataclasses.asdict) with the EmbeddingMatrixV2 path. For each path reports
+the number of allocated blocks and bytes held by the result (tracemalloc),
+peak traced bytes and wall time, for building the response alone and
+including json.dumps.
+
+  python benchmarks/embedding_response_benchmark.py --patches=10000
+"""
+
+import dataclasses
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Mapping, Sequence
+
+from absl import app
+from absl import flags
+from ez_wsi_dicomweb import patch_embedding_endpoints
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# pylint: disable=g-import-not-at-top
+from data_models import embedding_response
+from data_models import patch_coordinate
+# pylint: enable=g-import-not-at-top
+
+_PATCHES = flags.DEFINE_integer('patches', 10000, 'Patches in the response.')
+_DIMENSIONS = flags.DEFINE_integer('dimensions', 384, 'Embedding dimensions.')
+
+_EndpointJsonKeys = patch_embedding_endpoints.EndpointJsonKeys
+
+
+def _per_patch_lists(
+    embeddings: np.ndarray,
+    coordinates: Sequence[patch_coordinate.PatchCoordinate],
+) -> Mapping[str, Any]:
+  """Response built the way the predictor did before EmbeddingMatrixV2."""
+  results = [
+      embedding_response.PatchEmbeddingV2(
+          embedding_vector=np.array(embedding).tolist(),
+          patch_coordinate=coord,
+      )
+      for embedding, coord in zip(embeddings, coordinates)
+  ]
+  return {
+      _EndpointJsonKeys.RESULT: {
+          _EndpointJsonKeys.PATCH_EMBEDDINGS: [
+              dataclasses.asdict(result) for result in results
+          ]
+      }
+  }
+
+
+def _embedding_matrix(
+    embeddings: np.ndarray,
+    coordinates: Sequence[patch_coordinate.PatchCoordinate],
+) -> Mapping[str, Any]:
+  return embedding_response.embedding_instance_response_v2(
+      embedding_response.EmbeddingMatrixV2(
+          embeddings=embeddings, patch_coordinates=coordinates
+      )
+  )
+
+
+def _measure(
+    build: Callable[..., Mapping[str, Any]],
+    embeddings: np.ndarray,
+    coordinates: Sequence[patch_coordinate.PatchCoordinate],
+    serialize: bool,
+) -> Mapping[str, Any]:
+  """Returns allocation and timing metrics for one response build."""
+
+  def _run():
+    response = build(embeddings, coordinates)
+    if serialize:
+      response = json.dumps(response)
+    return response
+
+  # Timed without tracemalloc, which slows allocation heavy code.
+  start = time.perf_counter()
+  _run()
+  elapsed = time.perf_counter() - start
+  tracemalloc.start()
+  response = _run()
+  snapshot = tracemalloc.take_snapshot()
+  _, peak_bytes = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  del response
+  stats = snapshot.statistics('filename')
+  return {
+      'seconds': elapsed,
+      'peak_bytes': peak_bytes,
+      'allocated_blocks': sum(stat.count for stat in stats),
+      'allocated_bytes': sum(stat.size for stat in stats),
+  }
+
+
+def main(argv: Sequence[str]) -> None:
+  del argv
+  embeddings = (
+      np.random.default_rng(0)
+      .standard_normal((_PATCHES.value, _DIMENSIONS.value))
+      .astype(np.float32)
+  )
+  coordinates = [
+      patch_coordinate.create_patch_coordinate(224 * (i % 100), 224 * (i // 100))
+      for i in range(_PATCHES.value)
+  ]
+  if json.dumps(_per_patch_lists(embeddings, coordinates)) != json.dumps(
+      _embedding_matrix(embeddings, coordinates)
+  ):
+    raise ValueError('Responses differ.')
+  results = {
+      'patches': _PATCHES.value,
+      'dimensions': _DIMENSIONS.value,
+      'embedding_matrix_bytes': embeddings.nbytes,
+  }
+  for name, build in (
+      ('per_patch_lists', _per_patch_lists),
+      ('embedding_matrix', _embedding_matrix),
+  ):
+    results[name] = {
+        'build': _measure(build, embeddings, coordinates, serialize=False),
+        'build_and_json_dumps': _measure(
+            build, embeddings, coordinates, serialize=True
+        ),
+    }
+  print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+  app.run(main)
@@ -0,0 +1,95 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compares cached IccLut transforms against per-patch LittleCMS transforms.
+
+The per-patch path mirrors ez-wsi: a transform is built for the request and
+applied to each patch through a PIL image. Reports wall time for both paths
+and the maximum per-channel difference between their outputs.
+
+  python benchmarks/icc_transform_benchmark.py --patches=1000
+"""
+
+import json
+import os
+import sys
+import time
+from typing import Sequence
+
+from absl import app
+from absl import flags
+from ez_wsi_dicomweb import dicom_slide
+import numpy as np
+from PIL import Image
+from PIL import ImageCms
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import icc_transform  # pylint: disable=g-import-not-at-top
+
+_PATCHES = flags.DEFINE_integer('patches', 1000, 'Number of 224x224 patches.')
+_TARGET = flags.DEFINE_enum(
+    'target',
+    'SRGB',
+    [t.value for t in icc_transform.TargetColorSpace if t.value != 'NONE'],
+    'Target color space.',
+)
+_SEED = flags.DEFINE_integer('seed', 0, 'Random seed for patch pixels.')
+
+
+def main(argv: Sequence[str]) -> None:
+  del argv
+  target = icc_transform.TargetColorSpace(_TARGET.value)
+  # AdobeRGB source profile stands in for a scanner profile.
+  source_profile = dicom_slide.get_adobergb_icc_profile_bytes()
+  patches = np.random.default_rng(_SEED.value).integers(
+      0, 256, (_PATCHES.value, 224, 224, 3), dtype=np.uint8
+  )
+
+  start = time.time()
+  transform = icc_transform.build_transform(source_profile, target)
+  reference = np.empty_like(patches)
+  for index, patch in enumerate(patches):
+    with Image.fromarray(patch) as img:
+      reference[index] = np.asarray(ImageCms.applyTransform(img, transform))
+  per_patch_seconds = time.time() - start
+
+  lut_cache = icc_transform.IccLutCache()
+  start = time.time()
+  lut = lut_cache.get(source_profile, target)
+  compile_seconds = time.time() - start
+  start = time.time()
+  transformed = lut.apply(patches)
+  lut_apply_seconds = time.time() - start
+
+  error = np.abs(transformed.astype(np.int16) - reference.astype(np.int16))
+  print(
+      json.dumps(
+          {
+              'patches': _PATCHES.value,
+              'target': target.value,
+              'per_patch_seconds': per_patch_seconds,
+              'lut_compile_seconds': compile_seconds,
+              'lut_apply_seconds': lut_apply_seconds,
+              'speedup_excluding_compile': per_patch_seconds
+              / max(lut_apply_seconds, 1e-9),
+              'max_color_error': int(error.max()),
+              'mean_color_error': float(error.mean()),
+          },
+          indent=2,
+      )
+  )
+
+
+if __name__ == '__main__':
+  app.run(main)
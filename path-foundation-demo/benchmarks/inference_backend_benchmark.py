@@ -0,0 +1,154 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmarks CPU inference backends on a shared patch set.
+
+Every backend embeds the same patches. Reported per backend: patches/sec,
+p50/p99 batch latency, and cosine similarity of each embedding to the
+reference embeddings (TF backend unless --reference_embeddings is given).
+
+Thread pools are process wide; run once per --intra_op_threads /
+--inter_op_threads setting to compare thread configurations.
+
+  python benchmarks/inference_backend_benchmark.py --model_dir=./model \
+    --backends=TF,XLA,TFLITE,TFLITE_DYNAMIC_RANGE --patches=512
+"""
+
+import json
+import os
+import sys
+import time
+from typing import Sequence
+
+from absl import app
+from absl import flags
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import inference_backends  # pylint: disable=g-import-not-at-top
+
+_MODEL_DIR = flags.DEFINE_string('model_dir', './model', 'SavedModel dir.')
+_BACKENDS = flags.DEFINE_list(
+    'backends',
+    [b.value for b in inference_backends.Backend],
+    'Backends to benchmark.',
+)
+_PATCHES = flags.DEFINE_integer('patches', 512, 'Number of patches.')
+_BATCH_SIZE = flags.DEFINE_integer('batch_size', 64, 'Patches per call.')
+_PATCHES_NPY = flags.DEFINE_string(
+    'patches_npy',
+    '',
+    'Optional uint8 (patch, 224, 224, 3) .npy; random pixels if unset.',
+)
+_REFERENCE_EMBEDDINGS = flags.DEFINE_string(
+    'reference_embeddings',
+    '',
+    'Optional .npy reference embeddings; TF backend output if unset.',
+)
+_INTRA_OP_THREADS = flags.DEFINE_integer('intra_op_threads', 0, 'Intra op.')
+_INTER_OP_THREADS = flags.DEFINE_integer('inter_op_threads', 0, 'Inter op.')
+_OUTPUT = flags.DEFINE_string('output', '', 'Optional JSON results path.')
+
+
+def _load_patches() -> np.ndarray:
+  if _PATCHES_NPY.value:
+    patches = np.load(_PATCHES_NPY.value)[: _PATCHES.value]
+  else:
+    patches = np.random.default_rng(0).integers(
+        0, 256, (_PATCHES.value, 224, 224, 3), dtype=np.uint8
+    )
+  return patches.astype(np.float32) / np.float32(255)
+
+
+def _cosine_similarity(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+  a = a / np.maximum(np.linalg.norm(a, axis=1, keepdims=True), 1e-12)
+  b = b / np.maximum(np.linalg.norm(b, axis=1, keepdims=True), 1e-12)
+  return np.sum(a * b, axis=1)
+
+
+def _run(backend: inference_backends.InferenceBackend, images: np.ndarray):
+  """Returns embeddings and per batch latencies after warm-up calls."""
+  batch_size = _BATCH_SIZE.value
+  # Warm up every batch shape used so XLA compilation is not timed.
+  backend(images[:batch_size])
+  if len(images) % batch_size:
+    backend(images[-(len(images) % batch_size) :])
+  embeddings = []
+  latencies = []
+  for start in range(0, len(images), batch_size):
+    batch_start = time.perf_counter()
+    embeddings.append(backend(images[start : start + batch_size]))
+    latencies.append(time.perf_counter() - batch_start)
+  return np.concatenate(embeddings, axis=0), np.array(latencies)
+
+
+def main(argv: Sequence[str]) -> None:
+  del argv
+  images = _load_patches()
+  reference = None
+  if _REFERENCE_EMBEDDINGS.value:
+    reference = np.load(_REFERENCE_EMBEDDINGS.value)[: len(images)]
+  results = []
+  for backend_name in _BACKENDS.value:
+    config = inference_backends.BackendConfig(
+        backend=inference_backends.Backend(backend_name.upper()),
+        intra_op_threads=_INTRA_OP_THREADS.value,
+        inter_op_threads=_INTER_OP_THREADS.value,
+    )
+    load_start = time.perf_counter()
+    backend = inference_backends.create_backend(_MODEL_DIR.value, config)
+    load_seconds = time.perf_counter() - load_start
+    embeddings, latencies = _run(backend, images)
+    if reference is None:
+      if config.backend != inference_backends.Backend.TF:
+        reference, _ = _run(
+            inference_backends.create_backend(
+                _MODEL_DIR.value,
+                inference_backends.BackendConfig(
+                    intra_op_threads=_INTRA_OP_THREADS.value,
+                    inter_op_threads=_INTER_OP_THREADS.value,
+                ),
+            ),
+            images,
+        )
+      else:
+        reference = embeddings
+    similarity = _cosine_similarity(embeddings, reference)
+    results.append({
+        'backend': backend.name,
+        'load_seconds': load_seconds,
+        'patches_per_second': len(images) / float(latencies.sum()),
+        'p50_batch_latency_seconds': float(np.percentile(latencies, 50)),
+        'p99_batch_latency_seconds': float(np.percentile(latencies, 99)),
+        'min_cosine_similarity': float(similarity.min()),
+        'mean_cosine_similarity': float(similarity.mean()),
+    })
+  report = json.dumps(
+      {
+          'patches': len(images),
+          'batch_size': _BATCH_SIZE.value,
+          'intra_op_threads': _INTRA_OP_THREADS.value,
+          'inter_op_threads': _INTER_OP_THREADS.value,
+          'results': results,
+      },
+      indent=2,
+  )
+  if _OUTPUT.value:
+    with open(_OUTPUT.value, 'wt') as outfile:
+      outfile.write(report)
+  print(report)
+
+
+if __name__ == '__main__':
+  app.run(main)
@@ -0,0 +1,137 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmarks DicomPatchReader against a DICOMweb series.
+
+Reads a grid of 224x224 patches from the series with cold and warm decoded
+frame caches, and compares the pixels with patches read through ez-wsi's
+DicomSlide.get_patch. Meant to run against the synthetic DICOMweb server of
+wsi-viewer-local, which makes runs deterministic and offline:
+
+  python ../wsi-viewer-local/scripts/synthetic_dicomweb.py --latency-ms=10
+  python benchmarks/patch_fetch_benchmark.py \
+      --series_url=http://127.0.0.1:8043/dicomWeb/studies/<study>/series/<series>
+"""
+
+import json
+import os
+import sys
+import time
+from typing import Sequence
+
+from absl import app
+from absl import flags
+from ez_wsi_dicomweb import credential_factory
+from ez_wsi_dicomweb import dicom_slide
+from ez_wsi_dicomweb import dicom_web_interface
+from ez_wsi_dicomweb.ml_toolkit import dicom_path
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# pylint: disable=g-import-not-at-top
+import frame_cache
+import frame_decode_pool
+import patch_reader
+from data_models import patch_coordinate
+# pylint: enable=g-import-not-at-top
+
+_SERIES_URL = flags.DEFINE_string(
+    'series_url', None, 'DICOMweb series URL.', required=True
+)
+_GRID = flags.DEFINE_integer(
+    'grid', 8, 'Patches per side of the grid read around the level centre.'
+)
+_FETCH_THREADS = flags.DEFINE_integer(
+    'fetch_threads', 16, 'Threads fetching encoded frames.'
+)
+_DECODE_WORKERS = flags.DEFINE_integer(
+    'decode_workers', 0, 'Frame decode processes; 0 uses all CPUs.'
+)
+_REPEATS = flags.DEFINE_integer('repeats', 3, 'Cold cache repeats.')
+
+
+def _timed(fn):
+  start = time.time()
+  value = fn()
+  return value, time.time() - start
+
+
+def main(argv: Sequence[str]) -> None:
+  del argv
+  slide = dicom_slide.DicomSlide(
+      dwi=dicom_web_interface.DicomWebInterface(
+          credential_factory.NoAuthCredentialsFactory()
+      ),
+      path=dicom_path.FromString(_SERIES_URL.value),
+  )
+  level = slide.native_level
+  size = patch_coordinate.PATCH_SIZE
+  grid = min(_GRID.value, level.width // size, level.height // size)
+  x_origin = (level.width - grid * size) // 2
+  y_origin = (level.height - grid * size) // 2
+  coordinates = [
+      patch_coordinate.create_patch_coordinate(
+          x_origin + column * size, y_origin + row * size
+      )
+      for row in range(grid)
+      for column in range(grid)
+  ]
+
+  decode_pool = frame_decode_pool.FrameDecodePool(_DECODE_WORKERS.value)
+  try:
+    cold_seconds = []
+    for _ in range(_REPEATS.value):
+      reader = patch_reader.DicomPatchReader(
+          decode_pool,
+          cache=frame_cache.DecodedFrameCache(),
+          fetch_threads=_FETCH_THREADS.value,
+      )
+      patches, seconds = _timed(
+          lambda: reader.read_patches(slide, level, coordinates)  # pylint: disable=cell-var-from-loop
+      )
+      cold_seconds.append(seconds)
+    _, warm_seconds = _timed(
+        lambda: reader.read_patches(slide, level, coordinates)
+    )
+  finally:
+    decode_pool.shutdown()
+  reference, ez_wsi_seconds = _timed(
+      lambda: np.stack([
+          slide.get_patch(
+              level, coord.x_origin, coord.y_origin, coord.width, coord.height
+          ).image_bytes()
+          for coord in coordinates
+      ])
+  )
+  error = np.abs(patches.astype(np.int16) - reference.astype(np.int16))
+  print(
+      json.dumps(
+          {
+              'patches': len(coordinates),
+              'transfer_syntax_uid': level.transfer_syntax_uid,
+              'cold_seconds': [round(s, 3) for s in cold_seconds],
+              'cold_patches_per_second': round(
+                  len(coordinates) / max(min(cold_seconds), 1e-9), 2
+              ),
+              'warm_seconds': round(warm_seconds, 3),
+              'ez_wsi_get_patch_seconds': round(ez_wsi_seconds, 3),
+              'max_abs_error_vs_ez_wsi': int(error.max()),
+          },
+          indent=2,
+      )
+  )
+
+
+if __name__ == '__main__':
+  app.run(main)
@@ -14,19 +14,31 @@
 
 """Converts Embedding Requests and Responses to json and vice versa."""
 
+import base64
+import binascii
 import dataclasses
 import json
-from typing import Any, List, Mapping, Sequence
+import os
+from typing import Any, Iterator, List, Mapping, Sequence, Union
 
 from ez_wsi_dicomweb import patch_embedding_endpoints
+import numpy as np
 
 import pete_errors
+from data_models import embedding_json
 from data_models import embedding_request
 from data_models import embedding_response
 from data_models import patch_coordinate as patch_coordinate_module
 
 _EndpointJsonKeys = patch_embedding_endpoints.EndpointJsonKeys
 
+# Instance key for a region tiled into patches, used in place of
+# patch_coordinates.
+PATCH_REGION = 'patch_region'
+STRIDE = 'stride'
+# Maximum number of patches a single patch region may expand to.
+_MAX_REGION_PATCHES = int(os.environ.get('PETE_MAX_REGION_PATCHES', '10000'))
+
 
 class ValidationError(Exception):
   pass
@@ -51,11 +63,144 @@ def validate_int(val: Any) -> int:
   return val
 
 
-def _get_patch_coord(patch_coordinates: Sequence[Mapping[str, Any]]):
-  """Returns patch coodianates."""
-  result = []
+_PATCH_COORDINATE_KEYS = frozenset((
+    _EndpointJsonKeys.X_ORIGIN,
+    _EndpointJsonKeys.Y_ORIGIN,
+    _EndpointJsonKeys.WIDTH,
+    _EndpointJsonKeys.HEIGHT,
+))
+
+
+class _NotVectorizableError(Exception):
+  """Coordinates need per patch validation, e.g. to report an error."""
+
+
+def _validate_int_array(values: Any) -> np.ndarray:
+  """Returns 1D int64 array; raises if values are not all JSON ints."""
+  array = np.asarray(values)
+  if array.ndim == 1 and not array.size:
+    return np.zeros(0, dtype=np.int64)
+  if array.ndim != 1 or array.dtype.kind not in ('i', 'u'):
+    raise ValidationError('coordinate values are not int')
+  return array.astype(np.int64, copy=False)
+
+
+def _validate_patch_size_array(values: np.ndarray) -> None:
+  if np.any(values != patch_coordinate_module.PATCH_SIZE):
+    raise pete_errors.PatchDimensionsDoNotMatchEndpointInputDimensionsError(
+        'Patch coordinate width and height must be', ' 224x224.'
+    )
+
+
+def _get_patch_coord_array_from_dicts(
+    patch_coordinates: List[Any],
+) -> patch_coordinate_module.PatchCoordinateArray:
+  """Parses list of coordinate dicts with validation vectorized over patches.
+
+  Raises:
+    _NotVectorizableError: Any coordinate is not a well formed dict of ints;
+      caller validates patches individually to report the error.
+  """
+  if not patch_coordinates or not all(
+      type(c) is dict and c.keys() <= _PATCH_COORDINATE_KEYS  # pylint: disable=unidiomatic-typecheck
+      for c in patch_coordinates
+  ):
+    raise _NotVectorizableError()
+  size = patch_coordinate_module.PATCH_SIZE
+  try:
+    x = _validate_int_array(
+        [c[_EndpointJsonKeys.X_ORIGIN] for c in patch_coordinates]
+    )
+    y = _validate_int_array(
+        [c[_EndpointJsonKeys.Y_ORIGIN] for c in patch_coordinates]
+    )
+    width = _validate_int_array(
+        [c.get(_EndpointJsonKeys.WIDTH, size) for c in patch_coordinates]
+    )
+    height = _validate_int_array(
+        [c.get(_EndpointJsonKeys.HEIGHT, size) for c in patch_coordinates]
+    )
+  except (KeyError, ValidationError, ValueError, OverflowError) as exp:
+    raise _NotVectorizableError() from exp
+  if np.any(width != size) or np.any(height != size):
+    raise _NotVectorizableError()
+  return patch_coordinate_module.PatchCoordinateArray(x, y)
+
+
+def _decode_int32_column(value: str, key: str) -> np.ndarray:
+  try:
+    data = base64.b64decode(value, validate=True)
+  except (binascii.Error, ValueError) as exp:
+    raise _InvalidCoordinateError(f'{key} is not base64 encoded.') from exp
+  if len(data) % 4:
+    raise _InvalidCoordinateError(f'{key} is not packed int32 values.')
+  return np.frombuffer(data, dtype='<i4').astype(np.int64)
+
+
+def _get_columnar_patch_coord(
+    patch_coordinates: Mapping[str, Any],
+) -> patch_coordinate_module.PatchCoordinateArray:
+  """Returns coordinates from parallel x_origin and y_origin columns.
+
+  Columns are JSON int lists or base64 encoded little endian int32 values.
+  Optional scalar width and height must be 224.
+  """
+  if not set(patch_coordinates).issubset(_PATCH_COORDINATE_KEYS) or not {
+      _EndpointJsonKeys.X_ORIGIN,
+      _EndpointJsonKeys.Y_ORIGIN,
+  }.issubset(patch_coordinates):
+    raise _InvalidCoordinateError(
+        'Columnar patch coordinates have invalid keys; expecting:'
+        f' {_EndpointJsonKeys.X_ORIGIN}, {_EndpointJsonKeys.Y_ORIGIN},'
+        f' {_EndpointJsonKeys.WIDTH}, {_EndpointJsonKeys.HEIGHT}'
+    )
+  columns = []
+  for key in (_EndpointJsonKeys.X_ORIGIN, _EndpointJsonKeys.Y_ORIGIN):
+    value = patch_coordinates[key]
+    if isinstance(value, str):
+      columns.append(_decode_int32_column(value, key))
+      continue
+    try:
+      columns.append(_validate_int_array(value))
+    except (ValidationError, ValueError, OverflowError) as exp:
+      raise _InvalidCoordinateError(
+          f'{key} is not a list of int or base64 encoded int32.'
+      ) from exp
+  x, y = columns
+  if x.shape != y.shape:
+    raise _InvalidCoordinateError(
+        f'{_EndpointJsonKeys.X_ORIGIN} and {_EndpointJsonKeys.Y_ORIGIN}'
+        ' lengths differ.'
+    )
+  if not x.size:
+    raise _InvalidCoordinateError('empty patch_coordinates')
+  for key in (_EndpointJsonKeys.WIDTH, _EndpointJsonKeys.HEIGHT):
+    try:
+      value = validate_int(
+          patch_coordinates.get(key, patch_coordinate_module.PATCH_SIZE)
+      )
+    except ValidationError as exp:
+      raise _InvalidCoordinateError(f'{key} is not int.') from exp
+    _validate_patch_size_array(np.asarray([value]))
+  return patch_coordinate_module.PatchCoordinateArray(x, y)
+
+
+def _get_patch_coord(patch_coordinates: Any):
+  """Returns patch coodianates.
+
+  Accepts a list of coordinate dicts or a columnar dict of coordinate arrays.
+  Well formed lists are validated as arrays; otherwise coordinates are
+  validated one at a time so the first invalid coordinate is reported.
+  """
+  if isinstance(patch_coordinates, dict):
+    return _get_columnar_patch_coord(patch_coordinates)
   if not isinstance(patch_coordinates, list):
     raise _InvalidCoordinateError('patch_coordinates is not list')
+  try:
+    return _get_patch_coord_array_from_dicts(patch_coordinates)
+  except _NotVectorizableError:
+    pass
+  result = []
   for patch_coordinate in patch_coordinates:
     try:
       pc = patch_coordinate_module.create_patch_coordinate(**patch_coordinate)
@@ -88,6 +233,49 @@ def _get_patch_coord(patch_coordinates: Sequence[Mapping[str, Any]]):
   return result
 
 
+def _get_patch_region(
+    patch_region: Any,
+) -> patch_coordinate_module.PatchRegion:
+  """Returns patch region; patches are generated on access."""
+  if not isinstance(patch_region, dict):
+    raise _InvalidCoordinateError('Patch region is not dict.')
+  expected_keys = {
+      _EndpointJsonKeys.X_ORIGIN,
+      _EndpointJsonKeys.Y_ORIGIN,
+      _EndpointJsonKeys.WIDTH,
+      _EndpointJsonKeys.HEIGHT,
+  }
+  if not expected_keys.issubset(patch_region) or not set(
+      patch_region
+  ).issubset(expected_keys | {STRIDE}):
+    keys = ', '.join(
+        f.name for f in dataclasses.fields(patch_coordinate_module.PatchRegion)
+    )
+    raise _InvalidCoordinateError(
+        f'Patch region dict has invalid keys; expecting: {keys}'
+    )
+  try:
+    region = patch_coordinate_module.PatchRegion(
+        x_origin=validate_int(patch_region[_EndpointJsonKeys.X_ORIGIN]),
+        y_origin=validate_int(patch_region[_EndpointJsonKeys.Y_ORIGIN]),
+        width=validate_int(patch_region[_EndpointJsonKeys.WIDTH]),
+        height=validate_int(patch_region[_EndpointJsonKeys.HEIGHT]),
+        stride=validate_int(
+            patch_region.get(STRIDE, patch_coordinate_module.PATCH_SIZE)
+        ),
+    )
+  except ValidationError as exp:
+    raise _InvalidCoordinateError(
+        f'Invalid patch region; {json.dumps(patch_region, sort_keys=True)}'
+    ) from exp
+  if len(region) > _MAX_REGION_PATCHES:
+    raise pete_errors.TooManyPatchesError(
+        f'Patch region contains {len(region)} patches; maximum:'
+        f' {_MAX_REGION_PATCHES}.'
+    )
+  return region
+
+
 def embedding_response_v1_to_json(
     response: embedding_response.EmbeddingResponseV1,
 ) -> Mapping[str, Any]:
@@ -107,12 +295,77 @@ def embedding_response_v1_to_json(
   return {_EndpointJsonKeys.PREDICTIONS: json_response}
 
 
+def embedding_response_v1_to_json_chunks(
+    response: embedding_response.EmbeddingResponseV1,
+) -> Iterator[bytes]:
+  """Yields JSON of embedding_response_v1_to_json(response) in chunks.
+
+  Bytes are identical to json.dumps of embedding_response_v1_to_json; patch
+  embeddings are written directly instead of through dataclasses.asdict.
+  """
+  error_response = None
+  if response.error_response:
+    error_response = {'error_code': response.error_response.error_code.value}
+  embedding_result = None
+  if response.embedding_result is not None:
+    embedding_result = [
+        {
+            'dicom_study_uid': result.dicom_study_uid,
+            'dicom_series_uid': result.dicom_series_uid,
+            'instance_uids': result.instance_uids,
+            'patch_embeddings': embedding_json.PatchEmbeddingRows(
+                [
+                    patch_embedding.embeddings
+                    for patch_embedding in result.patch_embeddings
+                ],
+                [
+                    json.dumps(dataclasses.asdict(patch.patch_coordinate))
+                    for patch in result.patch_embeddings
+                ],
+                vector_key='embeddings',
+            ),
+        }
+        for result in response.embedding_result
+    ]
+  return embedding_json.iter_json({
+      _EndpointJsonKeys.PREDICTIONS: {
+          'model_version': response.model_version,
+          'error_response': error_response,
+          'embedding_result': embedding_result,
+      }
+  })
+
+
 def embedding_response_v2_to_json(
     json_response: Sequence[Mapping[str, Any]],
 ) -> Mapping[str, Any]:
   return {_EndpointJsonKeys.PREDICTIONS: json_response}
 
 
+def embedding_response_v2_to_json_chunks(
+    results: Sequence[
+        Union[embedding_response.EmbeddingMatrixV2, Mapping[str, Any]]
+    ],
+) -> Iterator[bytes]:
+  """Yields V2 response JSON written directly from embedding matrices.
+
+  Args:
+    results: Per instance EmbeddingMatrixV2 or JSON-serializable instance
+      response, e.g. instance_error_response_v2.
+
+  Bytes are identical to json.dumps of embedding_response_v2_to_json over
+  embedding_instance_response_v2 of each matrix.
+  """
+  return embedding_json.iter_json(
+      embedding_response_v2_to_json([
+          embedding_response.embedding_instance_json_v2(result)
+          if isinstance(result, embedding_response.EmbeddingMatrixV2)
+          else result
+          for result in results
+      ])
+  )
+
+
 def validate_str_list(val: Any) -> List[str]:
   if not isinstance(val, List):
     raise ValidationError('not list')
@@ -314,13 +567,17 @@ class EmbeddingConverterV2:
     instances = []
     for instance in _validate_instance_list(json_metadata):
       try:
-        patch_coordinates = _get_patch_coord(
-            instance.get(_EndpointJsonKeys.PATCH_COORDINATES)
-        )
+        if PATCH_REGION in instance:
+          patch_coordinates = _get_patch_region(instance.get(PATCH_REGION))
+        else:
+          patch_coordinates = _get_patch_coord(
+              instance.get(_EndpointJsonKeys.PATCH_COORDINATES)
+          )
       except _InvalidCoordinateError as exp:
         instance_error_msg = _generate_instance_metadata_error_string(
             instance,
             _EndpointJsonKeys.PATCH_COORDINATES,
+            PATCH_REGION,
         )
         raise pete_errors.InvalidRequestFieldError(
             f'Invalid patch coordinate; {exp}; {instance_error_msg}'
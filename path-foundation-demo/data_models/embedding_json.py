@@ -0,0 +1,219 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Streaming JSON writer for embedding responses.
+
+Writes response JSON directly from embedding matrices and coordinate arrays,
+without building a dict per patch. Output bytes are identical to json.dumps
+with default arguments on the equivalent dict/list response: floats are
+formatted with repr (shortest round trip of the float64 value), non-finite
+values as NaN / Infinity, separators ', ' and ': ', ASCII only.
+
+Embedding rows are formatted in blocks by the C JSON encoder and emitted as
+chunks of roughly _CHUNK_BYTES, which can be passed through iter_gzip and
+streamed to the client in a single pass.
+
+Does not depend on ez-wsi so the proxy server can use it.
+"""
+
+import json
+from typing import (
+    Any,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Union,
+)
+import zlib
+
+import numpy as np
+
+EMBEDDING_VECTOR = 'embedding_vector'
+PATCH_COORDINATE = 'patch_coordinate'
+
+# Approximate size of chunks yielded by iter_json.
+_CHUNK_BYTES = 1 << 16
+# Embedding rows formatted per json.dumps call.
+_ROWS_PER_BLOCK = 1024
+_ROW_SEPARATOR = '], ['
+
+
+def _float_rows_json(
+    rows: Union[np.ndarray, Sequence[Sequence[float]]],
+) -> List[str]:
+  """Returns JSON of each row, e.g. '[0.5, 1.0]'; one encoder call."""
+  if isinstance(rows, np.ndarray):
+    rows = rows.tolist()
+  if not rows:
+    return []
+  # Floats never contain '], [' so the encoded list of rows splits exactly.
+  encoded = json.dumps(rows)
+  return [f'[{row}]' for row in encoded[2:-2].split(_ROW_SEPARATOR)]
+
+
+def coordinates_json(
+    x_origins: np.ndarray,
+    y_origins: np.ndarray,
+    heights: np.ndarray,
+    widths: np.ndarray,
+) -> List[str]:
+  """Returns JSON of PatchCoordinate dataclasses given as arrays."""
+  return [
+      f'{{"x_origin": {x}, "y_origin": {y}, "height": {h}, "width": {w}}}'
+      for x, y, h, w in zip(
+          x_origins.tolist(),
+          y_origins.tolist(),
+          heights.tolist(),
+          widths.tolist(),
+      )
+  ]
+
+
+class PatchEmbeddingRows:
+  """JSON list of {embedding, patch coordinate} objects written from arrays.
+
+  Placed in a response tree passed to iter_json in place of the list of
+  patch embedding dicts.
+  """
+
+  def __init__(
+      self,
+      embeddings: Union[np.ndarray, Sequence[Sequence[float]]],
+      patch_coordinates_json: Sequence[str],
+      vector_key: str = EMBEDDING_VECTOR,
+      coordinate_first: bool = False,
+  ):
+    """Constructor.
+
+    Args:
+      embeddings: Embedding per patch; (patch, dim) matrix or float lists.
+      patch_coordinates_json: JSON of each patch coordinate.
+      vector_key: Key of embedding in each object.
+      coordinate_first: Write patch coordinate key before embedding key.
+    """
+    if len(embeddings) != len(patch_coordinates_json):
+      raise ValueError('Embedding and patch coordinate counts differ.')
+    self._embeddings = embeddings
+    self._coordinates = patch_coordinates_json
+    vector_key = json.dumps(vector_key)
+    coordinate_key = json.dumps(PATCH_COORDINATE)
+    # str.format template; {0} is the embedding and {1} the coordinate.
+    if coordinate_first:
+      self._template = '{{%s: {1}, %s: {0}}}' % (coordinate_key, vector_key)
+    else:
+      self._template = '{{%s: {0}, %s: {1}}}' % (vector_key, coordinate_key)
+
+  def iter_json(self) -> Iterator[str]:
+    yield '['
+    template = self._template
+    for start in range(0, len(self._coordinates), _ROWS_PER_BLOCK):
+      end = start + _ROWS_PER_BLOCK
+      block = ', '.join(
+          template.format(row, coordinate)
+          for row, coordinate in zip(
+              _float_rows_json(self._embeddings[start:end]),
+              self._coordinates[start:end],
+          )
+      )
+      yield block if not start else f', {block}'
+    yield ']'
+
+
+def _iter_ndarray_json(value: np.ndarray) -> Iterator[str]:
+  if value.ndim < 2:
+    yield json.dumps(value.tolist())
+    return
+  yield '['
+  for start in range(0, value.shape[0], _ROWS_PER_BLOCK):
+    block = json.dumps(value[start : start + _ROWS_PER_BLOCK].tolist())[1:-1]
+    yield block if not start else f', {block}'
+  yield ']'
+
+
+def _key_json(key: Any) -> str:
+  """Returns a mapping key as json.dumps writes it, always a JSON string."""
+  if isinstance(key, str):
+    return json.dumps(key)
+  if key is None or isinstance(key, (bool, int, float)):
+    return f'"{json.dumps(key)}"'
+  raise TypeError(
+      'keys must be str, int, float, bool or None, not'
+      f' {key.__class__.__name__}'
+  )
+
+
+def _iter_value_json(value: Any) -> Iterator[str]:
+  """Yields JSON fragments of value; json.dumps formatting."""
+  if isinstance(value, PatchEmbeddingRows):
+    yield from value.iter_json()
+  elif isinstance(value, np.ndarray):
+    yield from _iter_ndarray_json(value)
+  elif isinstance(value, Mapping):
+    yield '{'
+    for index, (key, item) in enumerate(value.items()):
+      yield f'{_key_json(key)}: ' if not index else f', {_key_json(key)}: '
+      yield from _iter_value_json(item)
+    yield '}'
+  elif isinstance(value, (list, tuple)):
+    yield '['
+    for index, item in enumerate(value):
+      if index:
+        yield ', '
+      yield from _iter_value_json(item)
+    yield ']'
+  else:
+    yield json.dumps(value)
+
+
+def iter_json(value: Any, chunk_bytes: int = _CHUNK_BYTES) -> Iterator[bytes]:
+  """Yields UTF-8 JSON of value in chunks; equal to json.dumps(value).
+
+  value may contain PatchEmbeddingRows and numpy arrays in addition to
+  JSON-serializable dict, list and scalar values.
+  """
+  buffer = []
+  size = 0
+  for fragment in _iter_value_json(value):
+    buffer.append(fragment)
+    size += len(fragment)
+    if size >= chunk_bytes:
+      yield ''.join(buffer).encode('utf-8')
+      buffer = []
+      size = 0
+  if buffer:
+    yield ''.join(buffer).encode('utf-8')
+
+
+def dumps(value: Any) -> bytes:
+  """Returns UTF-8 JSON of value; equal to json.dumps(value).encode()."""
+  return b''.join(iter_json(value))
+
+
+def iter_gzip(
+    chunks: Iterable[bytes], compresslevel: Optional[int] = 9
+) -> Iterator[bytes]:
+  """Yields gzip stream of chunks, compressed as they are produced."""
+  compressor = zlib.compressobj(
+      -1 if compresslevel is None else compresslevel,
+      zlib.DEFLATED,
+      zlib.MAX_WBITS | 16,
+  )
+  for chunk in chunks:
+    compressed = compressor.compress(chunk)
+    if compressed:
+      yield compressed
+  yield compressor.flush()
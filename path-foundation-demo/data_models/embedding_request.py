@@ -16,7 +16,7 @@
 
 import dataclasses
 import enum
-from typing import Any, List, Mapping, Union
+from typing import Any, List, Mapping, Sequence, Union
 from data_models import patch_coordinate
 
 
@@ -57,7 +57,8 @@ class DicomImageV2:
   bearer_token: str
   extensions: Mapping[str, Any]
   instance_uids: List[str]
-  patch_coordinates: List[patch_coordinate.PatchCoordinate]
+  # List of PatchCoordinate or a PatchRegion expanding to its patch grid.
+  patch_coordinates: Sequence[patch_coordinate.PatchCoordinate]
 
 
 @dataclasses.dataclass(frozen=True)
@@ -67,15 +68,21 @@ class GcsImageV2:
   image_file_uri: str
   bearer_token: str
   extensions: Mapping[str, Any]
-  patch_coordinates: List[patch_coordinate.PatchCoordinate]
+  # List of PatchCoordinate or a PatchRegion expanding to its patch grid.
+  patch_coordinates: Sequence[patch_coordinate.PatchCoordinate]
 
 
 @dataclasses.dataclass(frozen=True)
 class EmbeddedImageV2:
-  """An instance in a DICOM Embedding Request as described in the schema file."""
-  image_bytes: str
+  """An instance in a DICOM Embedding Request as described in the schema file.
+
+  image_bytes are base64 encoded when parsed from JSON; in process callers may
+  pass the raw compressed image bytes.
+  """
+  image_bytes: Union[str, bytes]
   extensions: Mapping[str, Any]
-  patch_coordinates: List[patch_coordinate.PatchCoordinate]
+  # List of PatchCoordinate or a PatchRegion expanding to its patch grid.
+  patch_coordinates: Sequence[patch_coordinate.PatchCoordinate]
 
 
 EmbeddingInstanceV2 = Union[DicomImageV2, GcsImageV2, EmbeddedImageV2]
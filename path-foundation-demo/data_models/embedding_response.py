@@ -16,15 +16,24 @@
 
 import dataclasses
 import enum
-from typing import Any, List, Mapping, Optional, Sequence
+import json
+from typing import Any, Iterator, List, Mapping, Optional, Sequence, Union
 
 from ez_wsi_dicomweb import patch_embedding_endpoints
+import numpy as np
 
 import pete_errors
+from data_models import embedding_json
 from data_models import patch_coordinate
 
 _MAX_ERROR_DESCRIPTION_LENGTH = 1024
 
+# Keys of a patch region instance result.
+_PATCH_REGION = 'patch_region'
+_GRID_ROWS = 'rows'
+_GRID_COLUMNS = 'columns'
+_EMBEDDING_GRID = 'embedding_grid'
+
 
 class ErrorCode(enum.Enum):
   """The error codes for PeteErrorResponse mapped from PeteErrors."""
@@ -76,12 +85,47 @@ class PatchEmbeddingV1:
 
 @dataclasses.dataclass(frozen=True)
 class PatchEmbeddingV2:
-  """A List of embeddings, instance uids, and patch coordinate."""
+  """A List of embeddings, instance uids, and patch coordinate.
+
+  embedding_vector may be a row of an EmbeddingMatrixV2; rows are views and
+  are not copied until the response is serialized.
+  """
 
-  embedding_vector: List[float]
+  embedding_vector: Union[List[float], np.ndarray]
   patch_coordinate: patch_coordinate.PatchCoordinate
 
 
+@dataclasses.dataclass(frozen=True)
+class EmbeddingMatrixV2:
+  """Embeddings for all patches of an instance as one (patch, dim) matrix."""
+
+  embeddings: np.ndarray
+  patch_coordinates: Sequence[patch_coordinate.PatchCoordinate]
+
+  def __post_init__(self):
+    if (
+        self.embeddings.ndim != 2
+        or self.embeddings.shape[0] != len(self.patch_coordinates)
+    ):
+      raise pete_errors.InvalidResponseError(
+          f'Embedding matrix shape {self.embeddings.shape} does not match'
+          f' {len(self.patch_coordinates)} patch coordinates.'
+      )
+
+  def __len__(self) -> int:
+    return len(self.patch_coordinates)
+
+  def __getitem__(self, index: int) -> PatchEmbeddingV2:
+    return PatchEmbeddingV2(
+        embedding_vector=self.embeddings[index],
+        patch_coordinate=self.patch_coordinates[index],
+    )
+
+  def __iter__(self) -> Iterator[PatchEmbeddingV2]:
+    for index in range(len(self)):
+      yield self[index]
+
+
 @dataclasses.dataclass(frozen=True)
 class EmbeddingResultV1:
   """The response when Pete is able to successfully complete a request."""
@@ -107,15 +151,148 @@ class EmbeddingResponseV1:
       )
 
 
+def _patch_coordinate_json(
+    coord: patch_coordinate.PatchCoordinate,
+) -> Mapping[str, int]:
+  # Same keys and order as dataclasses.asdict(coord).
+  return {
+      'x_origin': coord.x_origin,
+      'y_origin': coord.y_origin,
+      'height': coord.height,
+      'width': coord.width,
+  }
+
+
+def _embedding_vector_json(
+    vector: Union[List[float], np.ndarray],
+) -> List[float]:
+  if isinstance(vector, np.ndarray):
+    return vector.tolist()
+  return vector
+
+
+def embedding_region_response_v2(
+    region: patch_coordinate.PatchRegion, embeddings: np.ndarray
+) -> Mapping[str, Any]:
+  """Returns region embeddings as a dense (rows, columns, dim) grid."""
+  return {
+      patch_embedding_endpoints.EndpointJsonKeys.RESULT: {
+          _PATCH_REGION: dataclasses.asdict(region),
+          _GRID_ROWS: region.rows,
+          _GRID_COLUMNS: region.columns,
+          _EMBEDDING_GRID: embeddings.reshape(
+              region.rows, region.columns, -1
+          ).tolist(),
+      },
+  }
+
+
 def embedding_instance_response_v2(
-    results: Sequence[PatchEmbeddingV2],
+    results: Union[Sequence[PatchEmbeddingV2], EmbeddingMatrixV2],
+) -> Mapping[str, Any]:
+  """Returns a JSON-serializable embedding instance responses.
+
+  Produces the same structure as dataclasses.asdict on each PatchEmbeddingV2
+  without deep copying. An EmbeddingMatrixV2 is converted to Python floats
+  with a single tolist call; for a PatchRegion the result is a dense grid,
+  see embedding_region_response_v2.
+  """
+  if isinstance(results, EmbeddingMatrixV2) and isinstance(
+      results.patch_coordinates, patch_coordinate.PatchRegion
+  ):
+    return embedding_region_response_v2(
+        results.patch_coordinates, results.embeddings
+    )
+  if isinstance(results, EmbeddingMatrixV2) and isinstance(
+      results.patch_coordinates, patch_coordinate.PatchCoordinateArray
+  ):
+    size = patch_coordinate.PATCH_SIZE
+    patch_embeddings = [
+        {
+            'embedding_vector': vector,
+            'patch_coordinate': {
+                'x_origin': x,
+                'y_origin': y,
+                'height': size,
+                'width': size,
+            },
+        }
+        for vector, x, y in zip(
+            results.embeddings.tolist(),
+            results.patch_coordinates.x_origins.tolist(),
+            results.patch_coordinates.y_origins.tolist(),
+        )
+    ]
+  elif isinstance(results, EmbeddingMatrixV2):
+    patch_embeddings = [
+        {
+            'embedding_vector': vector,
+            'patch_coordinate': _patch_coordinate_json(coord),
+        }
+        for vector, coord in zip(
+            results.embeddings.tolist(), results.patch_coordinates
+        )
+    ]
+  else:
+    patch_embeddings = [
+        {
+            'embedding_vector': _embedding_vector_json(
+                patch_embedding.embedding_vector
+            ),
+            'patch_coordinate': _patch_coordinate_json(
+                patch_embedding.patch_coordinate
+            ),
+        }
+        for patch_embedding in results
+    ]
+  return {
+      patch_embedding_endpoints.EndpointJsonKeys.RESULT: {
+          patch_embedding_endpoints.EndpointJsonKeys.PATCH_EMBEDDINGS: (
+              patch_embeddings
+          )
+      },
+  }
+
+
+def _patch_coordinates_json(
+    coordinates: Sequence[patch_coordinate.PatchCoordinate],
+) -> List[str]:
+  if isinstance(coordinates, patch_coordinate.PatchCoordinateArray):
+    return embedding_json.coordinates_json(
+        *patch_coordinate.coordinate_arrays(coordinates)
+    )
+  return [json.dumps(_patch_coordinate_json(c)) for c in coordinates]
+
+
+def embedding_instance_json_v2(
+    results: EmbeddingMatrixV2,
 ) -> Mapping[str, Any]:
-  """Returns a JSON-serializable embedding instance responses."""
+  """Returns embedding instance response for embedding_json.iter_json.
+
+  Serializes to the same bytes as json.dumps of
+  embedding_instance_response_v2(results) without creating per patch
+  objects; embeddings are written directly from the matrix.
+  """
+  if isinstance(results.patch_coordinates, patch_coordinate.PatchRegion):
+    region = results.patch_coordinates
+    return {
+        patch_embedding_endpoints.EndpointJsonKeys.RESULT: {
+            _PATCH_REGION: dataclasses.asdict(region),
+            _GRID_ROWS: region.rows,
+            _GRID_COLUMNS: region.columns,
+            _EMBEDDING_GRID: results.embeddings.reshape(
+                region.rows, region.columns, -1
+            ),
+        },
+    }
   return {
       patch_embedding_endpoints.EndpointJsonKeys.RESULT: {
-          patch_embedding_endpoints.EndpointJsonKeys.PATCH_EMBEDDINGS: [
-              dataclasses.asdict(patch_embedding) for patch_embedding in results
-          ]
+          patch_embedding_endpoints.EndpointJsonKeys.PATCH_EMBEDDINGS: (
+              embedding_json.PatchEmbeddingRows(
+                  results.embeddings,
+                  _patch_coordinates_json(results.patch_coordinates),
+              )
+          )
       },
   }
 
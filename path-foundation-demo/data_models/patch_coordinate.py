@@ -14,10 +14,17 @@
 
 """Shared dataclasses across requests and responses for Pete."""
 
+import collections.abc
 import dataclasses
+from typing import List, Sequence, Tuple, Union
+
+import numpy as np
 
 import pete_errors
 
+# Width and height of patches input to the model.
+PATCH_SIZE = 224
+
 
 @dataclasses.dataclass(frozen=True)
 class PatchCoordinate:
@@ -29,7 +36,7 @@ class PatchCoordinate:
   width: int
 
   def __post_init__(self):
-    if (self.width != 224 or self.height != 224):
+    if (self.width != PATCH_SIZE or self.height != PATCH_SIZE):
       raise pete_errors.PatchDimensionsDoNotMatchEndpointInputDimensionsError(
           'Patch coordinate width and height must be', f' 224x224.'
       )
@@ -43,12 +50,153 @@ def create_patch_coordinate(
 ) -> PatchCoordinate:
   """Creates a patch coordinate."""
   if width == -1:
-    width = 224
+    width = PATCH_SIZE
   if height == -1:
-    height = 224
+    height = PATCH_SIZE
   return PatchCoordinate(
       x_origin=x_origin,
       y_origin=y_origin,
       width=width,
       height=height,
   )
+
+
+@dataclasses.dataclass(frozen=True)
+class PatchRegion(collections.abc.Sequence):
+  """Rectangle tiled into a grid of patches spaced stride pixels apart.
+
+  Behaves as a read only sequence of the PatchCoordinate in the grid, row
+  major; coordinates are computed on access and never stored. Only patches
+  fully within the rectangle are included.
+  """
+
+  x_origin: int
+  y_origin: int
+  width: int
+  height: int
+  stride: int = PATCH_SIZE
+
+  def __post_init__(self):
+    if self.width < PATCH_SIZE or self.height < PATCH_SIZE:
+      raise pete_errors.PatchDimensionsDoNotMatchEndpointInputDimensionsError(
+          f'Patch region width and height must be at least {PATCH_SIZE}.'
+      )
+    if self.stride < 1:
+      raise pete_errors.InvalidRequestFieldError(
+          'Patch region stride must be positive.'
+      )
+
+  @property
+  def rows(self) -> int:
+    return (self.height - PATCH_SIZE) // self.stride + 1
+
+  @property
+  def columns(self) -> int:
+    return (self.width - PATCH_SIZE) // self.stride + 1
+
+  @property
+  def covered_width(self) -> int:
+    """Width of region pixels covered by patches."""
+    return (self.columns - 1) * self.stride + PATCH_SIZE
+
+  @property
+  def covered_height(self) -> int:
+    """Height of region pixels covered by patches."""
+    return (self.rows - 1) * self.stride + PATCH_SIZE
+
+  def __len__(self) -> int:
+    return self.rows * self.columns
+
+  def __getitem__(
+      self, index: Union[int, slice]
+  ) -> Union[PatchCoordinate, List[PatchCoordinate]]:
+    if isinstance(index, slice):
+      return [self[i] for i in range(*index.indices(len(self)))]
+    if index < 0:
+      index += len(self)
+    if index < 0 or index >= len(self):
+      raise IndexError('patch region index out of range')
+    row, column = divmod(index, self.columns)
+    return PatchCoordinate(
+        x_origin=self.x_origin + column * self.stride,
+        y_origin=self.y_origin + row * self.stride,
+        height=PATCH_SIZE,
+        width=PATCH_SIZE,
+    )
+
+
+class PatchCoordinateArray(collections.abc.Sequence):
+  """Read only sequence of 224x224 PatchCoordinate held as origin arrays.
+
+  Coordinates are stored as parallel int64 x and y origin arrays; a
+  PatchCoordinate is only created when an element is accessed.
+  """
+
+  def __init__(self, x_origins: np.ndarray, y_origins: np.ndarray):
+    if x_origins.shape != y_origins.shape or x_origins.ndim != 1:
+      raise pete_errors.InvalidRequestFieldError(
+          'Patch coordinate x_origin and y_origin lengths differ.'
+      )
+    self._x_origins = np.array(x_origins, dtype=np.int64)
+    self._y_origins = np.array(y_origins, dtype=np.int64)
+    self._x_origins.flags.writeable = False
+    self._y_origins.flags.writeable = False
+
+  @property
+  def x_origins(self) -> np.ndarray:
+    return self._x_origins
+
+  @property
+  def y_origins(self) -> np.ndarray:
+    return self._y_origins
+
+  def __len__(self) -> int:
+    return self._x_origins.shape[0]
+
+  def __getitem__(
+      self, index: Union[int, slice]
+  ) -> Union[PatchCoordinate, 'PatchCoordinateArray']:
+    if isinstance(index, slice):
+      return PatchCoordinateArray(
+          self._x_origins[index], self._y_origins[index]
+      )
+    return PatchCoordinate(
+        x_origin=int(self._x_origins[index]),
+        y_origin=int(self._y_origins[index]),
+        height=PATCH_SIZE,
+        width=PATCH_SIZE,
+    )
+
+  def __eq__(self, other) -> bool:
+    if not isinstance(other, PatchCoordinateArray):
+      return NotImplemented
+    return np.array_equal(self._x_origins, other.x_origins) and np.array_equal(
+        self._y_origins, other.y_origins
+    )
+
+  def __repr__(self) -> str:
+    return f'PatchCoordinateArray(patches={len(self)})'
+
+
+def coordinate_arrays(
+    patch_coordinates: Sequence[PatchCoordinate],
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+  """Returns x origin, y origin, width and height arrays of coordinates.
+
+  Array backed collections are returned without iterating patches.
+  """
+  count = len(patch_coordinates)
+  if isinstance(patch_coordinates, PatchCoordinateArray):
+    size = np.full(count, PATCH_SIZE, dtype=np.int64)
+    return (
+        patch_coordinates.x_origins,
+        patch_coordinates.y_origins,
+        size,
+        size,
+    )
+  return (
+      np.fromiter((c.x_origin for c in patch_coordinates), np.int64, count),
+      np.fromiter((c.y_origin for c in patch_coordinates), np.int64, count),
+      np.fromiter((c.width for c in patch_coordinates), np.int64, count),
+      np.fromiter((c.height for c in patch_coordinates), np.int64, count),
+  )
@@ -0,0 +1,260 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Decodes compressed DICOM frames in a process pool into shared memory.
+
+Frame decoding (JPEG, JPEG 2000, JPEG-LS, JPEG XL) is CPU bound and holds the
+GIL for most of its runtime, so a thread pool does not scale past one core.
+FrameDecodePool fans decoding out to worker processes which write decoded
+pixels directly into a single shared memory block. The caller reads frames as
+a (frame, row, column, sample) numpy view over that block; no pixel data is
+pickled back to the parent process.
+"""
+
+import concurrent.futures
+import dataclasses
+import math
+import multiprocessing
+from multiprocessing import shared_memory
+import os
+import threading
+import time
+from typing import List, Optional, Sequence, Tuple
+
+from absl import logging
+from ez_wsi_dicomweb import dicom_frame_decoder
+import numpy as np
+
+import pete_errors
+
+# Minimum number of frames sent to a worker per task; amortizes IPC overhead.
+_MIN_FRAMES_PER_TASK = 4
+# Number of tasks generated per worker to balance uneven decode times.
+_TASKS_PER_WORKER = 4
+
+FrameShape = Tuple[int, int, int]
+
+
+def _decode_frames_into_shared_memory(
+    shm_name: str,
+    shape: Tuple[int, int, int, int],
+    start_index: int,
+    encoded_frames: Sequence[bytes],
+    transfer_syntax_uid: str,
+) -> List[int]:
+  """Decodes frames into a shared memory block; runs in worker process.
+
+  Args:
+    shm_name: Name of shared memory block holding decoded frames.
+    shape: Shape of decoded frame array (frames, rows, columns, samples).
+    start_index: Index in decoded frame array of the first encoded frame.
+    encoded_frames: Compressed frame bytes.
+    transfer_syntax_uid: DICOM transfer syntax of the encoded frames.
+
+  Returns:
+    Indexes of frames which could not be decoded.
+  """
+  shm = shared_memory.SharedMemory(name=shm_name)
+  try:
+    decoded_frames = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+    failed = []
+    for offset, frame_bytes in enumerate(encoded_frames):
+      index = start_index + offset
+      frame = dicom_frame_decoder.decode_dicom_compressed_frame_bytes(
+          frame_bytes, transfer_syntax_uid
+      )
+      if frame is None or frame.shape != shape[1:]:
+        failed.append(index)
+        continue
+      decoded_frames[index] = frame
+    # Release view before closing; exported buffers block SharedMemory.close.
+    del decoded_frames
+    return failed
+  finally:
+    shm.close()
+
+
+@dataclasses.dataclass(frozen=True)
+class DecodeStats:
+  """Throughput of a single decode call."""
+
+  frame_count: int
+  elapsed_seconds: float
+  workers: int
+
+  @property
+  def frames_per_second(self) -> float:
+    if self.elapsed_seconds <= 0:
+      return 0.0
+    return self.frame_count / self.elapsed_seconds
+
+
+class DecodedFrames:
+  """Decoded frames held in shared memory.
+
+  The block is released by close() or when used as a context manager. Numpy
+  views returned by frames must not be referenced after the block is closed.
+  """
+
+  def __init__(
+      self,
+      shm: shared_memory.SharedMemory,
+      shape: Tuple[int, int, int, int],
+      failed_indexes: Sequence[int],
+      stats: DecodeStats,
+  ):
+    self._shm = shm
+    self._frames = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+    self._failed_indexes = frozenset(failed_indexes)
+    self._stats = stats
+
+  @property
+  def frames(self) -> np.ndarray:
+    """Returns (frame, row, column, sample) view of decoded pixels."""
+    if self._frames is None:
+      raise pete_errors.InternalBugError('Decoded frames accessed after close.')
+    return self._frames
+
+  @property
+  def failed_indexes(self) -> frozenset[int]:
+    """Returns indexes of frames which could not be decoded."""
+    return self._failed_indexes
+
+  @property
+  def stats(self) -> DecodeStats:
+    return self._stats
+
+  def close(self) -> None:
+    if self._frames is None:
+      return
+    self._frames = None
+    self._shm.close()
+    self._shm.unlink()
+
+  def __enter__(self) -> 'DecodedFrames':
+    return self
+
+  def __exit__(self, *args) -> None:
+    self.close()
+
+
+class FrameDecodePool:
+  """Decodes DICOM frames across a pool of worker processes."""
+
+  def __init__(self, max_workers: Optional[int] = None):
+    """Constructor.
+
+    Args:
+      max_workers: Number of decode processes; defaults to the number of CPUs.
+        A value of 1 decodes frames in the calling process.
+    """
+    if max_workers is None or max_workers < 1:
+      max_workers = os.cpu_count() or 1
+    self._max_workers = max_workers
+    self._executor = None
+    self._lock = threading.Lock()
+
+  @property
+  def max_workers(self) -> int:
+    return self._max_workers
+
+  def _get_executor(self) -> concurrent.futures.ProcessPoolExecutor:
+    with self._lock:
+      if self._executor is None:
+        # Created lazily from a request thread of a server process that runs
+        # TensorFlow and HTTP thread pools; forking it could copy held locks
+        # into the workers, which only need the module level decode function.
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self._max_workers,
+            mp_context=multiprocessing.get_context('forkserver'),
+        )
+      return self._executor
+
+  def shutdown(self) -> None:
+    with self._lock:
+      if self._executor is not None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self._executor = None
+
+  def decode(
+      self,
+      encoded_frames: Sequence[bytes],
+      transfer_syntax_uid: str,
+      frame_shape: FrameShape,
+  ) -> DecodedFrames:
+    """Decodes frames into a shared memory block.
+
+    Args:
+      encoded_frames: Compressed frame bytes.
+      transfer_syntax_uid: DICOM transfer syntax of the encoded frames.
+      frame_shape: Shape of a decoded frame (rows, columns, samples).
+
+    Returns:
+      DecodedFrames; caller is responsible for closing.
+
+    Raises:
+      ImageError: Transfer syntax cannot be decoded.
+    """
+    if not dicom_frame_decoder.can_decompress_dicom_transfer_syntax(
+        transfer_syntax_uid
+    ):
+      raise pete_errors.ImageError(
+          f'Unsupported transfer syntax: {transfer_syntax_uid}'
+      )
+    frame_count = len(encoded_frames)
+    shape = (frame_count, *frame_shape)
+    shm = shared_memory.SharedMemory(
+        create=True, size=max(1, math.prod(shape))
+    )
+    start_time = time.time()
+    try:
+      chunk_size = max(
+          _MIN_FRAMES_PER_TASK,
+          math.ceil(frame_count / (self._max_workers * _TASKS_PER_WORKER)),
+      )
+      if self._max_workers < 2 or frame_count <= chunk_size:
+        workers = 1
+        failed = _decode_frames_into_shared_memory(
+            shm.name, shape, 0, encoded_frames, transfer_syntax_uid
+        )
+      else:
+        executor = self._get_executor()
+        futures = [
+            executor.submit(
+                _decode_frames_into_shared_memory,
+                shm.name,
+                shape,
+                start,
+                encoded_frames[start : start + chunk_size],
+                transfer_syntax_uid,
+            )
+            for start in range(0, frame_count, chunk_size)
+        ]
+        workers = min(self._max_workers, len(futures))
+        failed = []
+        for future in futures:
+          failed.extend(future.result())
+    except BaseException:
+      shm.close()
+      shm.unlink()
+      raise
+    stats = DecodeStats(frame_count, time.time() - start_time, workers)
+    logging.info(
+        'Decoded %d frames in %.3f sec (%.1f frames/sec, %d workers).',
+        stats.frame_count,
+        stats.elapsed_seconds,
+        stats.frames_per_second,
+        stats.workers,
+    )
+    return DecodedFrames(shm, shape, failed, stats)
@@ -0,0 +1,162 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""ICC profile transforms compiled to cached 3D lookup tables.
+
+Building a LittleCMS transform per patch or per request is expensive, and
+applying it through PIL requires an image object per patch. An IccLut runs the
+transform once over every 8-bit RGB value and stores the result as a
+256x256x256 table packed into uint32 words (64 MiB). Tables are cached per
+(source profile, target color space) and applied to whole decoded frames or
+patch batches with a single NumPy gather; the output is identical to applying
+the LittleCMS transform directly.
+"""
+
+import collections
+import enum
+import hashlib
+import io
+import os
+import threading
+from typing import Callable, Mapping
+
+from ez_wsi_dicomweb import dicom_slide
+import numpy as np
+from PIL import Image
+from PIL import ImageCms
+
+import pete_errors
+
+# Number of compiled transforms retained; each table is 64 MiB.
+_MAX_CACHED_LUTS = int(os.environ.get('ICC_LUT_CACHE_SIZE', '4'))
+# Pixels transformed per block; bounds temporary index memory.
+_PIXELS_PER_BLOCK = 1 << 22
+
+
+class TargetColorSpace(enum.Enum):
+  NONE = 'NONE'
+  SRGB = 'SRGB'
+  ADOBERGB = 'ADOBERGB'
+  ROMMRGB = 'ROMMRGB'
+  DISPLAYP3 = 'DISPLAYP3'
+
+
+_TARGET_PROFILE_BYTES: Mapping[TargetColorSpace, Callable[[], bytes]] = {
+    TargetColorSpace.SRGB: dicom_slide.get_srgb_icc_profile_bytes,
+    TargetColorSpace.ADOBERGB: dicom_slide.get_adobergb_icc_profile_bytes,
+    TargetColorSpace.ROMMRGB: dicom_slide.get_rommrgb_icc_profile_bytes,
+    TargetColorSpace.DISPLAYP3: dicom_slide.get_displayp3_icc_profile_bytes,
+}
+
+
+def build_transform(
+    source_icc_profile_bytes: bytes, target: TargetColorSpace
+) -> ImageCms.ImageCmsTransform:
+  """Returns LittleCMS transform from source profile to target color space.
+
+  Raises:
+    InvalidIccProfileTransformError: Profile cannot be read or transformed.
+  """
+  try:
+    return ImageCms.buildTransform(
+        ImageCms.getOpenProfile(io.BytesIO(source_icc_profile_bytes)),
+        ImageCms.getOpenProfile(io.BytesIO(_TARGET_PROFILE_BYTES[target]())),
+        'RGB',
+        'RGB',
+        renderingIntent=ImageCms.Intent.PERCEPTUAL,
+    )
+  except (ImageCms.PyCMSError, OSError, KeyError) as exp:
+    raise pete_errors.InvalidIccProfileTransformError(
+        f'Unable to create ICC profile transform to {target.value}.'
+    ) from exp
+
+
+class IccLut:
+  """ICC profile transform evaluated for every 8-bit RGB value."""
+
+  def __init__(self, transform_id: str, transform: ImageCms.ImageCmsTransform):
+    self._transform_id = transform_id
+    rgb = np.arange(1 << 24, dtype=np.uint32).view(np.uint8).reshape(-1, 4)
+    # Little endian word layout: byte 0 = blue, 1 = green, 2 = red.
+    samples = np.ascontiguousarray(rgb[:, 2::-1]).reshape(4096, 4096, 3)
+    with Image.fromarray(samples, mode='RGB') as img:
+      transformed = np.asarray(ImageCms.applyTransform(img, transform))
+    table = np.zeros((1 << 24, 4), dtype=np.uint8)
+    table[:, :3] = transformed.reshape(-1, 3)
+    self._table = table.view(np.uint32).ravel()
+
+  @property
+  def transform_id(self) -> str:
+    """Identifies source profile and target; used in frame cache keys."""
+    return self._transform_id
+
+  def _apply_block(self, src: np.ndarray, dst: np.ndarray) -> None:
+    """Transforms (N, 3) uint8 src into (N, 3) uint8 dst."""
+    index = src[:, 0].astype(np.uint32) << 16
+    index |= src[:, 1].astype(np.uint32) << 8
+    index |= src[:, 2]
+    dst[...] = self._table[index].view(np.uint8).reshape(-1, 4)[:, :3]
+
+  def apply(self, pixels: np.ndarray, inplace: bool = False) -> np.ndarray:
+    """Transforms RGB pixels (..., 3) uint8; other sample counts unchanged."""
+    if pixels.shape[-1] != 3:
+      return pixels
+    if inplace and pixels.flags.c_contiguous:
+      out = pixels
+    else:
+      out = np.empty(pixels.shape, dtype=np.uint8)
+    src = pixels.reshape(-1, 3)
+    dst = out.reshape(-1, 3)
+    for start in range(0, src.shape[0], _PIXELS_PER_BLOCK):
+      end = start + _PIXELS_PER_BLOCK
+      self._apply_block(src[start:end], dst[start:end])
+    if inplace and out is not pixels:
+      pixels[...] = out
+      return pixels
+    return out
+
+
+class IccLutCache:
+  """Thread safe LRU of compiled IccLut keyed by source profile and target."""
+
+  def __init__(self, max_luts: int = _MAX_CACHED_LUTS):
+    self._max_luts = max(1, max_luts)
+    self._luts = collections.OrderedDict()
+    self._lock = threading.Lock()
+
+  def get(
+      self, source_icc_profile_bytes: bytes, target: TargetColorSpace
+  ) -> IccLut:
+    """Returns compiled LUT, compiling on first use.
+
+    Raises:
+      InvalidIccProfileTransformError: Profile cannot be read or transformed.
+    """
+    profile_hash = hashlib.sha256(source_icc_profile_bytes).hexdigest()
+    key = f'{profile_hash}:{target.value}'
+    with self._lock:
+      lut = self._luts.get(key)
+      if lut is not None:
+        self._luts.move_to_end(key)
+        return lut
+    lut = IccLut(key, build_transform(source_icc_profile_bytes, target))
+    with self._lock:
+      self._luts[key] = lut
+      while len(self._luts) > self._max_luts:
+        self._luts.popitem(last=False)
+    return lut
+
+
+# Process wide cache of compiled transforms.
+shared_lut_cache = IccLutCache()
@@ -0,0 +1,214 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Reads patches from embedded and file referenced (non-DICOM) images.
+
+An image, typically a large region extracted by the client, is decoded once
+and all requested patches, or a PatchRegion's grid, are gathered from it with
+vectorized indexing. Image sources:
+
+  EmbeddedImageV2: Base64 encoded (or raw) PNG, JPEG, TIFF, ... bytes.
+  GcsImageV2: gs:// URIs are downloaded from Cloud Storage. file:// URIs are
+    read from local disk when PETE_LOCAL_IMAGE_DIR is set and the file is
+    within that directory; otherwise they are rejected.
+"""
+
+import base64
+import binascii
+import dataclasses
+import io
+import os
+from typing import Optional, Union
+import urllib.parse
+import urllib.request
+
+from ez_wsi_dicomweb import credential_factory
+from google.api_core import exceptions as google_exceptions
+from google.cloud import storage
+import numpy as np
+from PIL import Image
+
+import icc_transform
+import patch_reader
+import pete_errors
+from data_models import embedding_request
+from data_models import patch_coordinate
+
+# Directory file:// image URIs may be read from; empty disables file URIs.
+_LOCAL_IMAGE_DIR = os.environ.get('PETE_LOCAL_IMAGE_DIR', '')
+
+_FILE_URI_SCHEME = 'file'
+_GCS_URI_SCHEME = 'gs'
+
+
+@dataclasses.dataclass(frozen=True)
+class DecodedImage:
+  """Decoded image pixels (row, column, sample) and embedded ICC profile."""
+
+  pixels: np.ndarray
+  icc_profile: Optional[bytes]
+
+
+def decode_image(image_bytes: bytes) -> DecodedImage:
+  """Decodes compressed image bytes to uint8 grayscale or RGB pixels.
+
+  Raises:
+    ImageError: Bytes are not a decodable image.
+    ImageDimensionError: Image exceeds PIL decompression limits.
+  """
+  try:
+    with Image.open(io.BytesIO(image_bytes)) as img:
+      icc_profile = img.info.get('icc_profile')
+      if img.mode not in ('L', 'RGB'):
+        img = img.convert('RGB')
+      return DecodedImage(np.asarray(img), icc_profile)
+  except Image.DecompressionBombError as exp:
+    raise pete_errors.ImageDimensionError(str(exp)) from exp
+  except (Image.UnidentifiedImageError, OSError, ValueError) as exp:
+    raise pete_errors.ImageError('Unable to decode image bytes.') from exp
+
+
+def _embedded_image_bytes(image_bytes: Union[str, bytes]) -> bytes:
+  if isinstance(image_bytes, bytes):
+    return image_bytes
+  try:
+    return base64.b64decode(image_bytes, validate=True)
+  except (binascii.Error, ValueError) as exp:
+    raise pete_errors.InvalidRequestFieldError(
+        'Embedded image bytes are not base64 encoded.'
+    ) from exp
+
+
+def _read_local_file(uri: str, local_image_dir: str) -> bytes:
+  """Returns bytes of file:// URI within local_image_dir."""
+  if not local_image_dir:
+    raise pete_errors.UnapprovedGcsBucketError(
+        'file:// image URIs are not enabled.'
+    )
+  path = os.path.realpath(
+      urllib.request.url2pathname(urllib.parse.urlparse(uri).path)
+  )
+  root = os.path.realpath(local_image_dir)
+  if os.path.commonpath([path, root]) != root:
+    raise pete_errors.UnapprovedGcsBucketError(
+        f'Image file is not within approved directory; {uri}'
+    )
+  try:
+    with open(path, 'rb') as infile:
+      return infile.read()
+  except OSError as exp:
+    raise pete_errors.ImageError(f'Unable to read image file; {uri}') from exp
+
+
+def _read_gcs_blob(uri: str, bearer_token: str) -> bytes:
+  """Returns bytes of gs:// URI."""
+  try:
+    if bearer_token:
+      client = storage.Client(
+          credentials=credential_factory.TokenPassthroughCredentialFactory(
+              bearer_token
+          ).get_credentials()
+      )
+    else:
+      client = storage.Client.create_anonymous_client()
+    blob = storage.Blob.from_string(uri, client=client)
+  except ValueError as exp:
+    raise pete_errors.GcsImagePathFormatError(
+        f'Invalid GCS URI: {uri}'
+    ) from exp
+  try:
+    return blob.download_as_bytes(raw_download=True)
+  except google_exceptions.GoogleAPICallError as exp:
+    raise pete_errors.HttpError(
+        f'Unable to download image; {uri}; {exp.message}'
+    ) from exp
+
+
+class ImagePatchReader:
+  """Reads patches from EmbeddedImageV2 and GcsImageV2 instances."""
+
+  def __init__(
+      self,
+      icc_target: icc_transform.TargetColorSpace = (
+          icc_transform.TargetColorSpace.NONE
+      ),
+      lut_cache: icc_transform.IccLutCache = icc_transform.shared_lut_cache,
+      local_image_dir: str = _LOCAL_IMAGE_DIR,
+  ):
+    """Constructor.
+
+    Args:
+      icc_target: Color space patches are transformed to; NONE returns pixels
+        in the image's native color space.
+      lut_cache: Cache of compiled ICC profile transforms.
+      local_image_dir: Directory file:// URIs may read from; empty disables.
+    """
+    self._icc_target = icc_target
+    self._lut_cache = lut_cache
+    self._local_image_dir = local_image_dir
+
+  def _image_bytes(
+      self,
+      instance: Union[
+          embedding_request.EmbeddedImageV2, embedding_request.GcsImageV2
+      ],
+  ) -> bytes:
+    if isinstance(instance, embedding_request.EmbeddedImageV2):
+      return _embedded_image_bytes(instance.image_bytes)
+    scheme = urllib.parse.urlparse(instance.image_file_uri).scheme.lower()
+    if scheme == _FILE_URI_SCHEME:
+      return _read_local_file(instance.image_file_uri, self._local_image_dir)
+    if scheme == _GCS_URI_SCHEME:
+      return _read_gcs_blob(instance.image_file_uri, instance.bearer_token)
+    raise pete_errors.GcsImagePathFormatError(
+        f'Unsupported image URI: {instance.image_file_uri}'
+    )
+
+  def read_patches(
+      self,
+      instance: Union[
+          embedding_request.EmbeddedImageV2, embedding_request.GcsImageV2
+      ],
+  ) -> np.ndarray:
+    """Returns pixels for instance patches (patch, row, column, sample).
+
+    Raises:
+      PeteError: Image cannot be read or decoded, or patch outside of image.
+    """
+    image = decode_image(self._image_bytes(instance))
+    if isinstance(instance.patch_coordinates, patch_coordinate.PatchRegion):
+      region = instance.patch_coordinates
+      image_height, image_width = image.pixels.shape[:2]
+      patch_reader.validate_patches_in_image(
+          [patch_reader.region_rectangle(region)], image_width, image_height
+      )
+      patches = patch_reader.crop_region_patches(
+          image.pixels[
+              region.y_origin : region.y_origin + region.covered_height,
+              region.x_origin : region.x_origin + region.covered_width,
+          ],
+          region,
+      )
+    else:
+      patches = patch_reader.crop_patches_from_image(
+          image.pixels, instance.patch_coordinates
+      )
+    if (
+        self._icc_target != icc_transform.TargetColorSpace.NONE
+        and image.icc_profile
+    ):
+      self._lut_cache.get(image.icc_profile, self._icc_target).apply(
+          patches, inplace=True
+      )
+    return patches
@@ -0,0 +1,227 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""CPU inference backends for the Path Foundation SavedModel.
+
+Backends share one interface: called with a float32 (patch, 224, 224, 3) batch
+they return a float32 (patch, embedding) matrix.
+
+  TF: SavedModel serving signature run eagerly by TensorFlow.
+  XLA: Serving signature wrapped in a jit compiled tf.function. Batches are
+    padded to power of two sizes to bound the number of compilations.
+  TFLITE: SavedModel converted to TensorFlow Lite.
+  TFLITE_DYNAMIC_RANGE: TFLite with dynamic range (int8 weight) quantization.
+
+TensorFlow thread pools are process wide and must be configured before the
+TensorFlow runtime initializes; see configure_threading.
+"""
+
+import abc
+import dataclasses
+import enum
+import os
+import threading
+
+from absl import logging
+import numpy as np
+import tensorflow as tf
+
+_SERVING_SIGNATURE = 'serving_default'
+_OUTPUT_KEY = 'output_0'
+
+
+class Backend(enum.Enum):
+  TF = 'TF'
+  XLA = 'XLA'
+  TFLITE = 'TFLITE'
+  TFLITE_DYNAMIC_RANGE = 'TFLITE_DYNAMIC_RANGE'
+
+
+@dataclasses.dataclass(frozen=True)
+class BackendConfig:
+  """Inference backend selection and threading.
+
+  Attributes:
+    backend: Backend used to run the model.
+    intra_op_threads: Threads used within an op; 0 lets TensorFlow decide.
+    inter_op_threads: Threads used to run independent ops; 0 lets TensorFlow
+      decide.
+  """
+
+  backend: Backend = Backend.TF
+  intra_op_threads: int = 0
+  inter_op_threads: int = 0
+
+  @classmethod
+  def from_env(cls) -> 'BackendConfig':
+    return cls(
+        backend=Backend(os.environ.get('PETE_INFERENCE_BACKEND', 'TF').upper()),
+        intra_op_threads=int(os.environ.get('PETE_INTRA_OP_THREADS', '0')),
+        inter_op_threads=int(os.environ.get('PETE_INTER_OP_THREADS', '0')),
+    )
+
+
+def configure_threading(config: BackendConfig) -> None:
+  """Sets TensorFlow thread pool sizes; no-op once the runtime started."""
+  try:
+    if config.intra_op_threads > 0:
+      tf.config.threading.set_intra_op_parallelism_threads(
+          config.intra_op_threads
+      )
+    if config.inter_op_threads > 0:
+      tf.config.threading.set_inter_op_parallelism_threads(
+          config.inter_op_threads
+      )
+  except RuntimeError:
+    logging.warning(
+        'TensorFlow runtime already initialized; thread pool sizes unchanged.'
+    )
+
+
+class InferenceBackend(metaclass=abc.ABCMeta):
+  """Runs the embedding model on a batch of normalized patches."""
+
+  @property
+  @abc.abstractmethod
+  def name(self) -> str:
+    """Backend name."""
+
+  @abc.abstractmethod
+  def __call__(self, images: np.ndarray) -> np.ndarray:
+    """Returns embeddings for float32 (patch, row, column, 3) images."""
+
+
+def _serving_signature(model_dir: str):
+  """Returns serving signature and the name of its single input."""
+  model = tf.saved_model.load(model_dir)
+  signature = model.signatures[_SERVING_SIGNATURE]
+  input_name = next(iter(signature.structured_input_signature[1]))
+  # Keep model alive; signatures hold weak references to their variables.
+  return model, signature, input_name
+
+
+class TfBackend(InferenceBackend):
+  """Runs the SavedModel serving signature."""
+
+  def __init__(self, model_dir: str):
+    self._model, self._signature, self._input_name = _serving_signature(
+        model_dir
+    )
+
+  @property
+  def name(self) -> str:
+    return Backend.TF.value
+
+  def __call__(self, images: np.ndarray) -> np.ndarray:
+    # convert_to_tensor wraps float32 input without an extra cast op.
+    result = self._signature(
+        **{self._input_name: tf.convert_to_tensor(images, dtype=tf.float32)}
+    )
+    return result[_OUTPUT_KEY].numpy()
+
+
+def _padded_batch_size(size: int) -> int:
+  return 1 << max(0, size - 1).bit_length()
+
+
+class XlaBackend(TfBackend):
+  """Runs the serving signature compiled with XLA."""
+
+  def __init__(self, model_dir: str):
+    super().__init__(model_dir)
+    signature = self._signature
+    input_name = self._input_name
+
+    @tf.function(jit_compile=True)
+    def _compiled(images):
+      return signature(**{input_name: images})[_OUTPUT_KEY]
+
+    self._compiled = _compiled
+
+  @property
+  def name(self) -> str:
+    return Backend.XLA.value
+
+  def __call__(self, images: np.ndarray) -> np.ndarray:
+    size = images.shape[0]
+    padded_size = _padded_batch_size(size)
+    if padded_size != size:
+      images = np.concatenate(
+          [images, np.zeros((padded_size - size, *images.shape[1:]),
+                            dtype=images.dtype)],
+          axis=0,
+      )
+    result = self._compiled(tf.convert_to_tensor(images, dtype=tf.float32))
+    return result.numpy()[:size]
+
+
+class TfLiteBackend(InferenceBackend):
+  """Runs the SavedModel converted to TensorFlow Lite."""
+
+  def __init__(
+      self, model_dir: str, quantize: bool = False, num_threads: int = 0
+  ):
+    converter = tf.lite.TFLiteConverter.from_saved_model(
+        model_dir, signature_keys=[_SERVING_SIGNATURE]
+    )
+    converter.target_spec.supported_ops = [
+        tf.lite.OpsSet.TFLITE_BUILTINS,
+        tf.lite.OpsSet.SELECT_TF_OPS,
+    ]
+    if quantize:
+      converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    self._quantize = quantize
+    self._interpreter = tf.lite.Interpreter(
+        model_content=converter.convert(),
+        num_threads=num_threads if num_threads > 0 else None,
+    )
+    self._input_index = self._interpreter.get_input_details()[0]['index']
+    self._output_index = self._interpreter.get_output_details()[0]['index']
+    self._batch_size = None
+    # Interpreters are not thread safe.
+    self._lock = threading.Lock()
+
+  @property
+  def name(self) -> str:
+    if self._quantize:
+      return Backend.TFLITE_DYNAMIC_RANGE.value
+    return Backend.TFLITE.value
+
+  def __call__(self, images: np.ndarray) -> np.ndarray:
+    with self._lock:
+      if self._batch_size != images.shape[0]:
+        self._interpreter.resize_tensor_input(
+            self._input_index, images.shape, strict=False
+        )
+        self._interpreter.allocate_tensors()
+        self._batch_size = images.shape[0]
+      self._interpreter.set_tensor(
+          self._input_index, np.ascontiguousarray(images, dtype=np.float32)
+      )
+      self._interpreter.invoke()
+      return self._interpreter.get_tensor(self._output_index).copy()
+
+
+def create_backend(model_dir: str, config: BackendConfig) -> InferenceBackend:
+  """Returns inference backend for SavedModel in model_dir."""
+  configure_threading(config)
+  if config.backend == Backend.TF:
+    return TfBackend(model_dir)
+  if config.backend == Backend.XLA:
+    return XlaBackend(model_dir)
+  return TfLiteBackend(
+      model_dir,
+      quantize=config.backend == Backend.TFLITE_DYNAMIC_RANGE,
+      num_threads=config.intra_op_threads,
+  )
@@ -0,0 +1,412 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Reads batches of patches from a DICOM pyramid level.
+
+All frames touched by a batch of patches are fetched once, decoded in a
+FrameDecodePool and patches are cropped from the decoded frames directly into
+a single (patch, row, column, sample) array suitable for model input. When
+ICC profile normalization is enabled the compiled IccLut is applied to all
+decoded frames at once. Decoded frames are kept in a DecodedFrameCache for
+reuse by subsequent requests.
+
+A PatchRegion is read as one rectangle of pixels and cut into its patch grid
+with strided views, without materializing per patch coordinates.
+"""
+
+import concurrent.futures
+from typing import Dict, List, Mapping, NamedTuple, Optional, Sequence, Union
+
+from ez_wsi_dicomweb import dicom_frame_decoder
+from ez_wsi_dicomweb import dicom_slide
+from ez_wsi_dicomweb import dicom_web_interface
+from ez_wsi_dicomweb import slide_level_map
+import numpy as np
+
+import frame_cache
+import frame_decode_pool
+import icc_transform
+import pete_errors
+from data_models import patch_coordinate
+
+_DEFAULT_FETCH_THREADS = 16
+
+
+class Rectangle(NamedTuple):
+  """Pixel rectangle read in place of a patch, e.g. a PatchRegion's extent."""
+
+  x_origin: int
+  y_origin: int
+  width: int
+  height: int
+
+
+_Rect = Union[patch_coordinate.PatchCoordinate, Rectangle]
+
+
+def region_rectangle(region: patch_coordinate.PatchRegion) -> Rectangle:
+  """Returns rectangle of pixels covered by region's patch grid."""
+  return Rectangle(
+      region.x_origin,
+      region.y_origin,
+      region.covered_width,
+      region.covered_height,
+  )
+
+
+def _frame_numbers_for_patch(
+    level: slide_level_map.Level, coord: _Rect
+) -> List[int]:
+  """Returns slide level frame numbers (1 based) overlapped by patch."""
+  frames_per_row = -(-level.width // level.frame_width)
+  first_column = coord.x_origin // level.frame_width
+  last_column = (coord.x_origin + coord.width - 1) // level.frame_width
+  first_row = coord.y_origin // level.frame_height
+  last_row = (coord.y_origin + coord.height - 1) // level.frame_height
+  return [
+      row * frames_per_row + column + 1
+      for row in range(first_row, last_row + 1)
+      for column in range(first_column, last_column + 1)
+  ]
+
+
+def validate_patches_in_image(
+    patch_coordinates: Sequence[_Rect],
+    image_width: int,
+    image_height: int,
+) -> None:
+  """Raises if any patch is not fully within image; checked as arrays.
+
+  Raises:
+    PatchOutsideOfImageDimensionsError: Describes first patch outside image.
+  """
+  if not patch_coordinates:
+    return
+  x, y, width, height = patch_coordinate.coordinate_arrays(patch_coordinates)
+  outside = (
+      (x < 0)
+      | (y < 0)
+      | (x + width > image_width)
+      | (y + height > image_height)
+  )
+  if not outside.any():
+    return
+  coord = patch_coordinates[int(np.argmax(outside))]
+  raise pete_errors.PatchOutsideOfImageDimensionsError(
+      'Patch dimensions fall outside of image dimensions; x_origin:'
+      f' {coord.x_origin}, y_origin: {coord.y_origin}, width:'
+      f' {coord.width}, height: {coord.height}, image width: {image_width},'
+      f' image height: {image_height}'
+  )
+
+
+def crop_patches_from_frames(
+    level: slide_level_map.Level,
+    frames: Mapping[int, np.ndarray],
+    patch_coordinates: Sequence[_Rect],
+) -> np.ndarray:
+  """Copies patch pixels out of decoded frames.
+
+  Args:
+    level: Pyramid level frames were read from.
+    frames: Map of slide level frame number to decoded frame (row, column,
+      sample). Frames missing from the map (e.g. sparse tiling) are rendered as
+      zero.
+    patch_coordinates: Patches to crop.
+
+  Returns:
+    Patch pixels (patch, row, column, sample).
+  """
+  if not patch_coordinates:
+    return np.zeros((0, 0, 0, level.samples_per_pixel), dtype=np.uint8)
+  height = patch_coordinates[0].height
+  width = patch_coordinates[0].width
+  patches = np.zeros(
+      (len(patch_coordinates), height, width, level.samples_per_pixel),
+      dtype=np.uint8,
+  )
+  for patch_index, coord in enumerate(patch_coordinates):
+    for frame_number in _frame_numbers_for_patch(level, coord):
+      frame = frames.get(frame_number)
+      if frame is None:
+        continue
+      frame_x, frame_y = level.get_frame_position(frame_number)
+      x0 = max(coord.x_origin, frame_x)
+      y0 = max(coord.y_origin, frame_y)
+      x1 = min(coord.x_origin + width, frame_x + level.frame_width)
+      y1 = min(coord.y_origin + height, frame_y + level.frame_height)
+      patches[
+          patch_index,
+          y0 - coord.y_origin : y1 - coord.y_origin,
+          x0 - coord.x_origin : x1 - coord.x_origin,
+      ] = frame[y0 - frame_y : y1 - frame_y, x0 - frame_x : x1 - frame_x]
+  return patches
+
+
+def crop_patches_from_image(
+    pixels: np.ndarray,
+    patch_coordinates: Sequence[patch_coordinate.PatchCoordinate],
+) -> np.ndarray:
+  """Returns patches (patch, row, column, sample) cropped from pixels.
+
+  Patches must share one size. Each patch is a strided window of pixels;
+  all windows are gathered by one fancy index which copies only patch pixels.
+
+  Raises:
+    PatchOutsideOfImageDimensionsError: Patch not fully within image.
+  """
+  if pixels.ndim == 2:
+    pixels = pixels[..., np.newaxis]
+  image_height, image_width, samples = pixels.shape
+  if not patch_coordinates:
+    return np.zeros((0, 0, 0, samples), dtype=pixels.dtype)
+  validate_patches_in_image(patch_coordinates, image_width, image_height)
+  height = patch_coordinates[0].height
+  width = patch_coordinates[0].width
+  x, y, _, _ = patch_coordinate.coordinate_arrays(patch_coordinates)
+  # (y, x, sample, row, column) -> (y, x, row, column, sample); views only.
+  windows = np.lib.stride_tricks.sliding_window_view(
+      pixels, (height, width), axis=(0, 1)
+  ).transpose(0, 1, 3, 4, 2)
+  return windows[y, x]
+
+
+def crop_region_patches(
+    pixels: np.ndarray, region: patch_coordinate.PatchRegion
+) -> np.ndarray:
+  """Cuts region pixels into its patch grid (patch, row, column, sample).
+
+  Args:
+    pixels: Pixels (row, column[, sample]) of the region's covered rectangle;
+      pixel (0, 0) is the region origin.
+    region: Region defining the patch grid.
+
+  Returns:
+    Patches in row major grid order, matching iteration order of region; a
+    writeable array which does not share memory with pixels.
+  """
+  if pixels.ndim == 2:
+    pixels = pixels[..., np.newaxis]
+  size = patch_coordinate.PATCH_SIZE
+  windows = np.lib.stride_tricks.sliding_window_view(
+      pixels[: region.covered_height, : region.covered_width],
+      (size, size),
+      axis=(0, 1),
+  )[:: region.stride, :: region.stride]
+  # (grid row, grid column, sample, row, column) -> (patch, row, column,
+  # sample). The reshape copies unless the grid is a single row, where it can
+  # return a read-only view of pixels; callers transform patches in place.
+  patches = windows.transpose(0, 1, 3, 4, 2).reshape(
+      -1, size, size, pixels.shape[-1]
+  )
+  if np.shares_memory(patches, pixels):
+    patches = patches.copy()
+  return patches
+
+
+def _frame_key(
+    slide: dicom_slide.DicomSlide,
+    level: slide_level_map.Level,
+    frame_number: int,
+    icc_transform: str,
+) -> Optional[frame_cache.FrameKey]:
+  """Returns cache key for slide level frame number; None if frame missing."""
+  instance = level.get_instance_by_frame(frame_number)
+  if instance is None:
+    return None
+  return frame_cache.FrameKey(
+      str(slide.path),
+      instance.path.instance_uid,
+      instance.instance_frame_number_from_wholes_slide_frame_number(
+          frame_number
+      ),
+      icc_transform,
+  )
+
+
+class DicomPatchReader:
+  """Reads patches from DICOM slides using a shared FrameDecodePool."""
+
+  def __init__(
+      self,
+      decode_pool: frame_decode_pool.FrameDecodePool,
+      cache: Optional[frame_cache.DecodedFrameCache] = None,
+      icc_target: icc_transform.TargetColorSpace = (
+          icc_transform.TargetColorSpace.NONE
+      ),
+      lut_cache: icc_transform.IccLutCache = icc_transform.shared_lut_cache,
+      fetch_threads: int = _DEFAULT_FETCH_THREADS,
+  ):
+    """Constructor.
+
+    Args:
+      decode_pool: Pool used to decode frames.
+      cache: Decoded frame cache; None disables caching.
+      icc_target: Color space patches are transformed to; NONE returns pixels
+        in the slide's native color space.
+      lut_cache: Cache of compiled ICC profile transforms.
+      fetch_threads: Number of threads used to fetch encoded frames.
+    """
+    self._decode_pool = decode_pool
+    self._cache = cache
+    self._icc_target = icc_target
+    self._lut_cache = lut_cache
+    self._fetch_threads = max(1, fetch_threads)
+
+  def _get_icc_lut(
+      self, slide: dicom_slide.DicomSlide
+  ) -> Optional[icc_transform.IccLut]:
+    """Returns compiled ICC transform for slide or None if not transformed."""
+    if self._icc_target == icc_transform.TargetColorSpace.NONE:
+      return None
+    icc_profile_bytes = slide.get_icc_profile_bytes()
+    if not icc_profile_bytes:
+      return None
+    return self._lut_cache.get(icc_profile_bytes, self._icc_target)
+
+  def _fetch_encoded_frames(
+      self,
+      slide: dicom_slide.DicomSlide,
+      level: slide_level_map.Level,
+      frame_numbers: Sequence[int],
+  ) -> List[bytes]:
+    """Returns encoded bytes for frames, fetched concurrently."""
+
+    def _fetch(frame_number: int) -> bytes:
+      instance = level.get_instance_by_frame(frame_number)
+      return slide.dwi.get_frame_image(
+          instance.path,
+          instance.instance_frame_number_from_wholes_slide_frame_number(
+              frame_number
+          ),
+          dicom_web_interface.TranscodeDicomFrame.DO_NOT_TRANSCODE,
+      )
+
+    if self._fetch_threads < 2 or len(frame_numbers) < 2:
+      return [_fetch(frame_number) for frame_number in frame_numbers]
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=min(self._fetch_threads, len(frame_numbers))
+    ) as pool:
+      return list(pool.map(_fetch, frame_numbers))
+
+  def _read_patches_with_ez_wsi(
+      self,
+      slide: dicom_slide.DicomSlide,
+      level: slide_level_map.Level,
+      patch_coordinates: Sequence[_Rect],
+      icc_lut: Optional[icc_transform.IccLut],
+  ) -> np.ndarray:
+    """Fallback for transfer syntaxes which require server transcoding."""
+    patches = np.stack([
+        slide.get_patch(
+            level, coord.x_origin, coord.y_origin, coord.width, coord.height
+        ).image_bytes()
+        for coord in patch_coordinates
+    ])
+    if icc_lut is not None:
+      icc_lut.apply(patches, inplace=True)
+    return patches
+
+  def _read_decoded_patches(
+      self,
+      slide: dicom_slide.DicomSlide,
+      level: slide_level_map.Level,
+      patch_coordinates: Sequence[_Rect],
+      icc_lut: Optional[icc_transform.IccLut],
+  ) -> np.ndarray:
+    """Reads patches from frames decoded locally or found in the cache."""
+    icc_transform_id = '' if icc_lut is None else icc_lut.transform_id
+    frame_keys = {}
+    for coord in patch_coordinates:
+      for frame_number in _frame_numbers_for_patch(level, coord):
+        if frame_number not in frame_keys:
+          frame_keys[frame_number] = _frame_key(
+              slide, level, frame_number, icc_transform_id
+          )
+    frames: Dict[int, np.ndarray] = {}
+    missing_frame_numbers = []
+    for frame_number, key in sorted(frame_keys.items()):
+      if key is None:
+        continue
+      frame = None if self._cache is None else self._cache.get(key)
+      if frame is None:
+        missing_frame_numbers.append(frame_number)
+      else:
+        frames[frame_number] = frame
+    if not missing_frame_numbers:
+      return crop_patches_from_frames(level, frames, patch_coordinates)
+    encoded_frames = self._fetch_encoded_frames(
+        slide, level, missing_frame_numbers
+    )
+    with self._decode_pool.decode(
+        encoded_frames,
+        level.transfer_syntax_uid,
+        (level.frame_height, level.frame_width, level.samples_per_pixel),
+    ) as decoded:
+      if decoded.failed_indexes:
+        raise pete_errors.ImageError(
+            f'Unable to decode {len(decoded.failed_indexes)} DICOM frames.'
+        )
+      if icc_lut is not None:
+        icc_lut.apply(decoded.frames, inplace=True)
+      try:
+        for index, frame_number in enumerate(missing_frame_numbers):
+          frames[frame_number] = decoded.frames[index]
+          if self._cache is not None:
+            self._cache.put(frame_keys[frame_number], frames[frame_number])
+        return crop_patches_from_frames(level, frames, patch_coordinates)
+      finally:
+        # Drop views into shared memory before the block is released.
+        frames.clear()
+
+  def read_patches(
+      self,
+      slide: dicom_slide.DicomSlide,
+      level: slide_level_map.Level,
+      patch_coordinates: Sequence[patch_coordinate.PatchCoordinate],
+  ) -> np.ndarray:
+    """Returns pixels for patches (patch, row, column, sample).
+
+    Args:
+      slide: Slide to read patches from.
+      level: Pyramid level patch coordinates are defined on.
+      patch_coordinates: Patches to read. A PatchRegion is read as a single
+        rectangle and cut into its patch grid.
+
+    Raises:
+      PatchOutsideOfImageDimensionsError: Patch not fully within level.
+      ImageError: Frame could not be decoded.
+      InvalidIccProfileTransformError: Slide ICC profile cannot be transformed.
+    """
+    region = None
+    if isinstance(patch_coordinates, patch_coordinate.PatchRegion):
+      region = patch_coordinates
+      patch_coordinates = [region_rectangle(region)]
+    validate_patches_in_image(patch_coordinates, level.width, level.height)
+    icc_lut = self._get_icc_lut(slide)
+    if dicom_frame_decoder.can_decompress_dicom_transfer_syntax(
+        level.transfer_syntax_uid
+    ):
+      patches = self._read_decoded_patches(
+          slide, level, patch_coordinates, icc_lut
+      )
+    else:
+      patches = self._read_patches_with_ez_wsi(
+          slide, level, patch_coordinates, icc_lut
+      )
+    if level.photometric_interpretation == 'MONOCHROME1':
+      np.subtract(np.iinfo(np.uint8).max, patches, out=patches)
+    if region is not None:
+      return crop_region_patches(patches[0], region)
+    return patches
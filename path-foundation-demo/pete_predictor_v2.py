@@ -15,46 +15,140 @@
 """Callable responsible for running Inference on provided patches."""
 
 import functools
-from typing import Any, Mapping
+import os
+from typing import Any, Iterator, List, Mapping, Optional
 
-from huggingface_hub import from_pretrained_keras
+from absl import logging
 from ez_wsi_dicomweb import credential_factory
 from ez_wsi_dicomweb import dicom_slide
-from ez_wsi_dicomweb import patch_embedding
 from ez_wsi_dicomweb import dicom_web_interface
-from ez_wsi_dicomweb import patch_embedding_endpoints
 from ez_wsi_dicomweb.ml_toolkit import dicom_path
 import numpy as np
-import tensorflow as tf
 
+import frame_cache
+import frame_decode_pool
+import icc_transform
+import image_reader
+import inference_backends
+import patch_reader
 from data_models import embedding_response
 from data_models import embedding_request
 from data_models import embedding_converter
-#from huggingface_hub import hf_hub_download
 from huggingface_hub import snapshot_download
 
 
 
-def _load_huggingface_model() -> tf.keras.Model:
-  snapshot_download("google/path-foundation", local_dir="./model")
-  return tf.keras.layers.TFSMLayer('./model', call_endpoint='serving_default') 
-  #return from_pretrained_keras("./model", compile=False)
+_MODEL_DIR = './model'
 
 
-def _endpoint_model(ml_model: tf.keras.Model, image: np.ndarray) -> np.ndarray:
-  """Function ez-wsi will use to run local ML model."""
-  result = ml_model.signatures['serving_default'](
-      tf.cast(tf.constant(image), tf.float32)
-  )
-  return result['output_0'].numpy()
+@functools.cache
+def _endpoint_model() -> inference_backends.InferenceBackend:
+  """Returns backend running the local ML model; downloaded on first use."""
+  snapshot_download("google/path-foundation", local_dir=_MODEL_DIR)
+  config = inference_backends.BackendConfig.from_env()
+  logging.info('Loading Path Foundation model with %s backend.', config)
+  return inference_backends.create_backend(_MODEL_DIR, config)
 
 
-# _ENDPOINT_MODEL = functools.partial(_endpoint_model, _load_huggingface_model())
+# Number of processes used to decode DICOM frames; 0 = one per CPU.
+_DECODE_WORKERS = int(os.environ.get('PETE_DECODE_WORKERS', '0'))
+# Color space patches are normalized to before inference; NONE disables.
+_ICC_PROFILE_NORMALIZATION = icc_transform.TargetColorSpace(
+    os.environ.get('PETE_ICC_PROFILE_NORMALIZATION', 'NONE').upper()
+)
+# Maximum number of patches passed to the model in a single call.
+_MAX_PATCHES_PER_MODEL_CALL = 100
+
+
+def _model_input(patches: np.ndarray) -> np.ndarray:
+  """Normalizes uint8 patches to float32 RGB in range [0, 1]."""
+  if patches.shape[-1] == 1:
+    patches = np.repeat(patches, 3, axis=-1)
+  elif patches.shape[-1] == 4:
+    patches = patches[..., :3]
+  return patches.astype(np.float32) / np.float32(255)
 
 
 class PetePredictor:
   """Callable responsible for generating embeddings."""
 
+  def __init__(
+      self,
+      decode_workers: int = _DECODE_WORKERS,
+      cache: Optional[frame_cache.DecodedFrameCache] = frame_cache.shared_cache,
+      icc_target: icc_transform.TargetColorSpace = _ICC_PROFILE_NORMALIZATION,
+      model: Optional[inference_backends.InferenceBackend] = None,
+  ):
+    self._model = model
+    self._decode_pool = frame_decode_pool.FrameDecodePool(decode_workers)
+    self._cache = cache
+    self._patch_reader = patch_reader.DicomPatchReader(
+        self._decode_pool, cache, icc_target
+    )
+    self._image_reader = image_reader.ImagePatchReader(icc_target)
+
+  def _read_dicom_patches(
+      self, instance: embedding_request.DicomImageV2
+  ) -> np.ndarray:
+    token = instance.bearer_token
+    if token:
+      cf = credential_factory.TokenPassthroughCredentialFactory(token)
+    else:
+      cf = credential_factory.NoAuthCredentialsFactory()
+    dwi = dicom_web_interface.DicomWebInterface(cf)
+    path = dicom_path.FromString(instance.series_path)
+    ds = dicom_slide.DicomSlide(dwi=dwi, path=path)
+    level = ds.get_instance_level(instance.instance_uids[0])
+    return self._patch_reader.read_patches(
+        ds, level, instance.patch_coordinates
+    )
+
+  def _embed_instances(
+      self, prediction_input: Mapping[str, Any]
+  ) -> List[embedding_response.EmbeddingMatrixV2]:
+    """Returns embedding matrix for each instance in request."""
+    embedding_json_converter = embedding_converter.EmbeddingConverterV2()
+    request = embedding_json_converter.json_to_embedding_request(prediction_input)
+
+    model = self._model if self._model is not None else _endpoint_model()
+
+    embedding_results = []
+    for instance in request.instances:
+      if isinstance(instance, embedding_request.DicomImageV2):
+        patches = self._read_dicom_patches(instance)
+      else:
+        # Embedded and file images are decoded once and patches cropped.
+        patches = self._image_reader.read_patches(instance)
+
+      # Embeddings stay in one matrix per instance until serialization.
+      embeddings = None
+      for start in range(0, len(patches), _MAX_PATCHES_PER_MODEL_CALL):
+        batch = model(
+            _model_input(patches[start : start + _MAX_PATCHES_PER_MODEL_CALL])
+        )
+        if embeddings is None:
+          embeddings = np.empty(
+              (len(patches), batch.shape[-1]), dtype=batch.dtype
+          )
+        embeddings[start : start + batch.shape[0]] = batch
+      embedding_results.append(
+          embedding_response.EmbeddingMatrixV2(
+              embeddings=embeddings,
+              patch_coordinates=instance.patch_coordinates,
+          )
+      )
+    if self._cache is not None:
+      stats = self._cache.stats()
+      logging.info(
+          'Decoded frame cache; hit ratio: %.3f, frames: %d, resident bytes:'
+          ' %d / %d',
+          stats.hit_ratio,
+          stats.frame_count,
+          stats.resident_bytes,
+          stats.max_bytes,
+      )
+    return embedding_results
+
   def predict(
       self,
       prediction_input: Mapping[str, Any],
@@ -71,36 +165,21 @@ class PetePredictor:
     Raises:
       ERROR_LOADING_DICOM: If the provided patches are not concated.
     """
-    embedding_json_converter = embedding_converter.EmbeddingConverterV2()
-    request = embedding_json_converter.json_to_embedding_request(prediction_input)
-    endpoint =  patch_embedding_endpoints.LocalEndpoint(_ENDPOINT_MODEL)
+    return embedding_converter.embedding_response_v2_to_json([
+        embedding_response.embedding_instance_response_v2(result)
+        for result in self._embed_instances(prediction_input)
+    ])
 
-    embedding_results = []
-    for instance in request.instances:
-      patches = []
-      if not isinstance(instance, embedding_request.DicomImageV2):
-        raise ValueError('unsupported')
-      token = instance.bearer_token
-      if token:
-        cf = credential_factory.TokenPassthroughCredentialFactory(token)
-      else:
-        cf = credential_factory.NoAuthCredentialsFactory()
-      dwi = dicom_web_interface.DicomWebInterface(cf)
-      path = dicom_path.FromString(instance.series_path)
-      ds = dicom_slide.DicomSlide(dwi=dwi, path=path)
-      level = ds.get_instance_level(instance.instance_uids[0])
-      for coor in instance.patch_coordinates:
-        patches.append(ds.get_patch(level, coor.x_origin, coor.y_origin, coor.width, coor.height))
-
-      patch_embeddings = []
-      for index, result in enumerate(patch_embedding.generate_patch_embeddings(endpoint, patches)):
-        embedding = np.array(result.embedding)
-        patch_embeddings.append(
-            embedding_response.PatchEmbeddingV2(
-                embedding_vector=embedding.tolist(),
-                patch_coordinate=instance.patch_coordinates[index],
-            ))
-      embedding_results.append(
-          embedding_response.embedding_instance_response_v2(patch_embeddings)
-      )
-    return embedding_converter.embedding_response_v2_to_json(embedding_results)
+  def predict_json(
+      self,
+      prediction_input: Mapping[str, Any],
+  ) -> Iterator[bytes]:
+    """Runs inference and yields the response JSON in chunks.
+
+    Inference completes before the first chunk is yielded. Bytes are
+    identical to json.dumps(self.predict(prediction_input)); embeddings are
+    written directly from the embedding matrices.
+    """
+    return embedding_converter.embedding_response_v2_to_json_chunks(
+        self._embed_instances(prediction_input)
+    )
@@ -0,0 +1,438 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Sampling profiler of Python stacks with Flask admin endpoints.
+
+A sampler thread reads every thread's stack (sys._current_frames) at a fixed
+rate and counts identical stacks; stacks of threads serving a request are
+rooted at the request's route ("POST /predict"), other threads at their
+thread name. The profiled code is not instrumented, so the cost is the
+sampler's own time, reported as overhead.
+
+Two modes, both per process (per gunicorn worker):
+
+  capture     POST /admin/profile?seconds=N&hz=R samples for N seconds in the
+              background and writes the stacks to PROFILE_DIR, shared by the
+              workers of a host, as GET /admin/profile/<id>.
+  continuous  With PROFILE_HZ > 0 a low rate sampler runs in every worker and
+              GET /admin/profile/routes reports its stacks per route.
+
+Results are collapsed stacks ("frame;frame;frame count" lines, the input of
+flamegraph.pl and speedscope) or, with ?format=svg, a flame graph. Endpoints
+exist only when PROFILER_TOKEN is set and need it in the X-Profiler-Token
+header. Requests with ?pid=<worker pid> are refused with 409 by other
+workers, so clients can retry until they reach the worker they want.
+"""
+
+import collections
+import hashlib
+import hmac
+import html
+import http
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from typing import Counter, Dict, List, Mapping, Optional, Tuple
+
+import flask
+
+_PROFILE_DIR = os.environ.get(
+    'PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'sampling-profiles')
+)
+_CAPTURE_HZ = 100
+_MAX_CAPTURE_HZ = 1000
+_MAX_CAPTURE_SECONDS = 600
+# Captures kept in PROFILE_DIR; older ones are deleted.
+_MAX_CAPTURES = 50
+_MAX_DEPTH = 128
+# Distinct stacks kept per route by the continuous sampler.
+_MAX_STACKS_PER_ROUTE = 20000
+_TRUNCATED = '[other stacks]'
+_NO_ROUTE = '(not in a request)'
+_TOKEN_HEADER = 'X-Profiler-Token'
+_CAPTURE_ID = re.compile(r'^[0-9]+-[0-9]+-[0-9a-f]{8}$')
+
+Stacks = Counter[Tuple[str, ...]]
+
+
+def _frame_label(code, labels: Dict[object, str]) -> str:
+  label = labels.get(code)
+  if label is None:
+    label = (
+        f'{code.co_name} ({os.path.basename(code.co_filename)}:'
+        f'{code.co_firstlineno})'
+    ).replace(';', ':')
+    labels[code] = label
+  return label
+
+
+class SamplingProfiler:
+  """Samples the stacks of all threads of the process."""
+
+  def __init__(
+      self,
+      continuous_hz: float = 0.0,
+      profile_dir: str = _PROFILE_DIR,
+  ):
+    """Constructor.
+
+    Args:
+      continuous_hz: Rate of the continuous per route sampler; 0 disables it.
+        It starts with the first request of each process, so it runs in every
+        forked worker.
+      profile_dir: Directory captures are written to.
+    """
+    self.continuous_hz = max(0.0, continuous_hz)
+    self.profile_dir = profile_dir
+    self._routes: Dict[int, str] = {}
+    self._labels: Dict[object, str] = {}
+    self._sampler_idents = set()
+    self._lock = threading.Lock()
+    self._continuous: Dict[str, Stacks] = {}
+    self._continuous_samples = 0
+    self._continuous_seconds = 0.0
+    self._continuous_started = 0.0
+    self._started_pid = None
+    self._capture_running = False
+
+  def begin_request(self, route: str) -> None:
+    self._routes[threading.get_ident()] = route
+
+  def end_request(self) -> None:
+    self._routes.pop(threading.get_ident(), None)
+
+  def sample(self) -> List[Tuple[str, ...]]:
+    """Returns the stack of each other thread, root first, rooted at its route."""
+    names = {t.ident: t.name for t in threading.enumerate()}
+    stacks = []
+    for ident, frame in sys._current_frames().items():  # pylint: disable=protected-access
+      if ident in self._sampler_idents:
+        continue
+      frames = []
+      while frame is not None and len(frames) < _MAX_DEPTH:
+        frames.append(_frame_label(frame.f_code, self._labels))
+        frame = frame.f_back
+      root = self._routes.get(ident) or f'{_NO_ROUTE} {names.get(ident, ident)}'
+      frames.append(root)
+      stacks.append(tuple(reversed(frames)))
+    return stacks
+
+  def _run(self, hz: float, seconds: Optional[float], on_sample) -> float:
+    """Calls on_sample(stacks) hz times a second; returns sampling seconds."""
+    self._sampler_idents.add(threading.get_ident())
+    interval = 1.0 / hz
+    deadline = None if seconds is None else time.monotonic() + seconds
+    busy = 0.0
+    next_sample = time.monotonic()
+    try:
+      while deadline is None or next_sample < deadline:
+        start = time.monotonic()
+        on_sample(self.sample())
+        busy += time.monotonic() - start
+        if deadline is None:
+          self._continuous_seconds = busy
+        next_sample += interval
+        delay = next_sample - time.monotonic()
+        if delay > 0:
+          time.sleep(delay)
+        else:
+          next_sample = time.monotonic()  # Sampler falling behind: skip ticks
+    finally:
+      self._sampler_idents.discard(threading.get_ident())
+    return busy
+
+  def capture(self, seconds: float, hz: float = _CAPTURE_HZ) -> Stacks:
+    """Samples for seconds in the calling thread; returns stack counts."""
+    stacks: Stacks = collections.Counter()
+    self._run(hz, seconds, stacks.update)
+    return stacks
+
+  def start_capture(self, seconds: float, hz: float = _CAPTURE_HZ) -> Optional[str]:
+    """Starts a background capture; returns its id, None if one is running."""
+    with self._lock:
+      if self._capture_running:
+        return None
+      self._capture_running = True
+    capture_id = (
+        f'{os.getpid()}-{int(time.time())}-{os.urandom(4).hex()}'
+    )
+    threading.Thread(
+        target=self._write_capture,
+        args=(capture_id, seconds, hz),
+        name='sampling-profiler-capture',
+        daemon=True,
+    ).start()
+    return capture_id
+
+  def _write_capture(self, capture_id: str, seconds: float, hz: float) -> None:
+    try:
+      stacks = self.capture(seconds, hz)
+      os.makedirs(self.profile_dir, exist_ok=True)
+      path = os.path.join(self.profile_dir, f'{capture_id}.collapsed')
+      with open(f'{path}.tmp', 'w') as f:
+        f.write(collapsed(stacks))
+      os.replace(f'{path}.tmp', path)  # Readers see complete files only
+      # Capture ids are <pid>-<unix time>-<random>; delete the oldest
+      captures = sorted(
+          name for name in os.listdir(self.profile_dir)
+          if name.endswith('.collapsed')
+      )
+      captures.sort(key=lambda name: int(name.split('-')[1]))
+      for old in captures[:-_MAX_CAPTURES]:
+        try:
+          os.unlink(os.path.join(self.profile_dir, old))
+        except FileNotFoundError:
+          pass  # Pruned by another worker
+    finally:
+      with self._lock:
+        self._capture_running = False
+
+  def read_capture(self, capture_id: str) -> Optional[str]:
+    """Returns collapsed stacks of a finished capture of any worker, or None."""
+    if not _CAPTURE_ID.match(capture_id):
+      return None
+    try:
+      with open(os.path.join(self.profile_dir, f'{capture_id}.collapsed')) as f:
+        return f.read()
+    except FileNotFoundError:
+      return None
+
+  def ensure_started(self) -> None:
+    """Starts the continuous sampler in this process if enabled and not running."""
+    if not self.continuous_hz or self._started_pid == os.getpid():
+      return
+    with self._lock:
+      if self._started_pid == os.getpid():
+        return
+      # A forked worker inherits the parent's counts but not its thread
+      self._started_pid = os.getpid()
+      self._continuous = {}
+      self._continuous_samples = 0
+      self._continuous_seconds = 0.0
+      self._continuous_started = time.monotonic()
+    threading.Thread(
+        target=self._run_continuous,
+        name='sampling-profiler-continuous',
+        daemon=True,
+    ).start()
+
+  def _run_continuous(self) -> None:
+    def add(stacks: List[Tuple[str, ...]]) -> None:
+      with self._lock:
+        self._continuous_samples += 1
+        for stack in stacks:
+          route = self._continuous.setdefault(stack[0], collections.Counter())
+          if stack not in route and len(route) >= _MAX_STACKS_PER_ROUTE:
+            stack = (stack[0], _TRUNCATED)
+          route[stack] += 1
+
+    self._run(self.continuous_hz, None, add)
+
+  def route_stacks(self, route: Optional[str] = None) -> Stacks:
+    """Continuous samples of one route (all routes if None)."""
+    stacks: Stacks = collections.Counter()
+    with self._lock:
+      for name, counts in self._continuous.items():
+        if route is None or name == route:
+          stacks.update(counts)
+    return stacks
+
+  def stats(self) -> Dict[str, object]:
+    """Continuous sampler samples per route and overhead, for this process."""
+    with self._lock:
+      running = self._started_pid == os.getpid()
+      elapsed = time.monotonic() - self._continuous_started if running else 0.0
+      return {
+          'pid': os.getpid(),
+          'continuous_hz': self.continuous_hz,
+          'running': running,
+          'seconds': round(elapsed, 3),
+          'samples': self._continuous_samples,
+          'overhead': round(self._continuous_seconds / elapsed, 5) if elapsed else 0.0,
+          'routes': {
+              route: sum(counts.values())
+              for route, counts in sorted(self._continuous.items())
+          },
+      }
+
+
+def collapsed(stacks: Mapping[Tuple[str, ...], int]) -> str:
+  """Returns stacks as collapsed lines ("root;...;leaf count"), most common first."""
+  lines = sorted(stacks.items(), key=lambda item: (-item[1], item[0]))
+  return ''.join(f'{";".join(stack)} {count}\n' for stack, count in lines)
+
+
+def parse_collapsed(text: str) -> Stacks:
+  """Inverse of collapsed()."""
+  stacks: Stacks = collections.Counter()
+  for line in text.splitlines():
+    stack, _, count = line.rpartition(' ')
+    if stack and count.isdigit():
+      stacks[tuple(stack.split(';'))] += int(count)
+  return stacks
+
+
+def flame_graph_svg(
+    stacks: Mapping[Tuple[str, ...], int], title: str = 'Flame graph'
+) -> str:
+  """Renders stacks as a standalone flame graph SVG (roots at the bottom)."""
+  width, row_height, font_px = 1200, 16, 11
+  root = {'children': {}, 'count': 0}
+  for stack, count in stacks.items():
+    root['count'] += count
+    node = root
+    for name in stack:
+      node = node['children'].setdefault(name, {'children': {}, 'count': 0})
+      node['count'] += count
+
+  def depth(node) -> int:
+    return 1 + max((depth(child) for child in node['children'].values()), default=0)
+
+  rows = depth(root) - 1
+  height = (rows + 2) * row_height + 8
+  total = max(root['count'], 1)
+  scale = width / total
+  rects = []
+
+  def draw(node, x: float, level: int) -> None:
+    for name, child in sorted(node['children'].items()):
+      w = child['count'] * scale
+      if w >= 0.5:
+        y = height - (level + 1) * row_height - 4
+        shade = int(hashlib.md5(name.encode()).hexdigest()[:4], 16)
+        fill = f'rgb({205 + shade % 50},{80 + shade % 140},{shade % 55})'
+        text = name if len(name) * font_px * 0.6 < w else name[:int(w / (font_px * 0.6)) - 2] + '..'
+        label = html.escape(f'{name} ({child["count"]} samples, {100 * child["count"] / total:.2f}%)')
+        rects.append(
+            f'<g><title>{label}</title><rect x="{x:.2f}" y="{y}" width="{w:.2f}" '
+            f'height="{row_height - 1}" fill="{fill}" rx="2"/>'
+            + (f'<text x="{x + 3:.2f}" y="{y + row_height - 4}">{html.escape(text)}</text>'
+               if w > 3 * font_px else '')
+            + '</g>'
+        )
+        draw(child, x, level + 1)
+      x += w
+
+  draw(root, 0.0, 0)
+  return (
+      f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+      f'font-family="monospace" font-size="{font_px}">'
+      f'<rect width="100%" height="100%" fill="#f8f8f8"/>'
+      f'<text x="{width / 2}" y="{row_height}" text-anchor="middle" font-size="14">'
+      f'{html.escape(title)} ({root["count"]} samples)</text>'
+      + ''.join(rects) + '</svg>\n'
+  )
+
+
+def from_env(continuous_hz: Optional[float] = None) -> Optional[SamplingProfiler]:
+  """Returns a profiler if PROFILER_TOKEN is set, else None.
+
+  continuous_hz defaults to PROFILE_HZ (0: captures only).
+  """
+  if not os.environ.get('PROFILER_TOKEN'):
+    return None
+  if continuous_hz is None:
+    continuous_hz = float(os.environ.get('PROFILE_HZ', '0'))
+  return SamplingProfiler(continuous_hz)
+
+
+def _stacks_response(stacks: Stacks, title: str) -> flask.Response:
+  if flask.request.args.get('format', 'collapsed') == 'svg':
+    return flask.Response(flame_graph_svg(stacks, title), content_type='image/svg+xml')
+  return flask.Response(collapsed(stacks), content_type='text/plain; charset=utf-8')
+
+
+def install(
+    flask_app: flask.Flask,
+    profiler: SamplingProfiler,
+    token: Optional[str] = None,
+) -> None:
+  """Tags requests with their route and adds the /admin/profile endpoints.
+
+  Args:
+    flask_app: App to profile.
+    profiler: Profiler of this app's processes.
+    token: Required in the X-Profiler-Token header; defaults to PROFILER_TOKEN.
+  """
+  token = token or os.environ['PROFILER_TOKEN']
+
+  @flask_app.before_request
+  def _begin_profiled_request():
+    profiler.ensure_started()
+    rule = flask.request.url_rule
+    profiler.begin_request(
+        f'{flask.request.method} {rule.rule if rule is not None else "(no route)"}'
+    )
+
+  @flask_app.teardown_request
+  def _end_profiled_request(unused_exc):
+    profiler.end_request()
+
+  def _check_request() -> None:
+    supplied = flask.request.headers.get(_TOKEN_HEADER, '')
+    if not hmac.compare_digest(supplied.encode(), token.encode()):
+      flask.abort(http.HTTPStatus.UNAUTHORIZED.value, 'Invalid profiler token.')
+    pid = flask.request.args.get('pid')
+    if pid and pid != str(os.getpid()):
+      flask.abort(
+          flask.Response(
+              json.dumps({'error': 'Other worker.', 'pid': os.getpid()}),
+              status=http.HTTPStatus.CONFLICT.value,
+              content_type='application/json',
+          )
+      )
+
+  @flask_app.route('/admin/profile', methods=['POST'])
+  def start_profile():
+    _check_request()
+    try:
+      seconds = float(flask.request.args.get('seconds', '10'))
+      hz = float(flask.request.args.get('hz', str(_CAPTURE_HZ)))
+    except ValueError:
+      flask.abort(http.HTTPStatus.BAD_REQUEST.value, 'seconds and hz must be numbers.')
+    if not 0 < seconds <= _MAX_CAPTURE_SECONDS or not 0 < hz <= _MAX_CAPTURE_HZ:
+      flask.abort(
+          http.HTTPStatus.BAD_REQUEST.value,
+          f'seconds must be in (0, {_MAX_CAPTURE_SECONDS}] and hz in (0, {_MAX_CAPTURE_HZ}].',
+      )
+    capture_id = profiler.start_capture(seconds, hz)
+    if capture_id is None:
+      flask.abort(http.HTTPStatus.CONFLICT.value, 'A capture is already running in this worker.')
+    return flask.Response(
+        json.dumps({'id': capture_id, 'pid': os.getpid(), 'seconds': seconds, 'hz': hz}),
+        status=http.HTTPStatus.ACCEPTED.value,
+        content_type='application/json',
+    )
+
+  @flask_app.route('/admin/profile/routes', methods=['GET'])
+  def route_profile():
+    _check_request()
+    if not profiler.continuous_hz:
+      flask.abort(http.HTTPStatus.NOT_FOUND.value, 'Continuous sampling is off (PROFILE_HZ).')
+    if flask.request.args.get('format', 'json') == 'json':
+      return flask.Response(json.dumps(profiler.stats()), content_type='application/json')
+    route = flask.request.args.get('route')
+    return _stacks_response(profiler.route_stacks(route), f'{route or "All routes"}, pid {os.getpid()}')
+
+  @flask_app.route('/admin/profile/<capture_id>', methods=['GET'])
+  def get_profile(capture_id):
+    _check_request()
+    text = profiler.read_capture(capture_id)
+    if text is None:
+      flask.abort(http.HTTPStatus.NOT_FOUND.value, 'Capture unknown or still running.')
+    return _stacks_response(parse_collapsed(text), f'Capture {capture_id}')
@@ -27,8 +27,6 @@ from typing import Any, Optional, Sequence
 import json
 from flask_cors import CORS
 import diskcache
-import gzip
-from io import BytesIO
 import shutil
 import tempfile
 
@@ -36,12 +34,15 @@ import tempfile
 import requests
 
 from absl import app
+from absl import flags
 from absl import logging
 import auth
 import flask
+from data_models import embedding_json
 from flask import render_template, send_from_directory, Response, send_file, request, current_app, abort
 from gunicorn.app import base as gunicorn_base
 from flask_caching import Cache
+import sampling_profiler
 
 # import pete_predictor_v2
 
@@ -57,6 +58,13 @@ print(f"Cache stats: {cache_disk.stats()}")
 DICOM_SERVER_URL = os.environ.get("DICOM_SERVER_URL")
 PREDICT_SERVER_URL = os.environ.get("PREDICT_ENDPOINT_URL")
 
+_PROFILE_HZ = flags.DEFINE_float(
+    'profile_hz',
+    None,
+    'Continuous per route sampling rate of the /admin/profile endpoints;'
+    ' defaults to PROFILE_HZ. The endpoints need PROFILER_TOKEN.',
+)
+
 
 def validate_allowed_predict_request(data):
     for item in data['instances']:
@@ -91,19 +99,24 @@ def provide_dicom_server_token(data, token):
     return data
 
 
-def compress_response(json_data):
-    """Compresses JSON data using gzip."""
-    compressed_data = BytesIO()
-    with gzip.GzipFile(fileobj=compressed_data, mode='w') as gz:
-        gz.write(json_data.encode('utf-8'))
-    return compressed_data.getvalue()
+def patch_embedding_rows(patch_embeddings):
+    """Wraps patch embedding dicts so embedding_json writes them directly."""
+    return embedding_json.PatchEmbeddingRows(
+        [patch_embedding["embedding_vector"] for patch_embedding in patch_embeddings],
+        [json.dumps(patch_embedding["patch_coordinate"]) for patch_embedding in patch_embeddings],
+        coordinate_first=True,
+    )
 
 
 def create_gzipped_response(data, status=http.HTTPStatus.OK.value, content_type='application/json'):
-    """Creates a gzipped Flask response."""
-    json_data = json.dumps(data)
-    compressed_data = compress_response(json_data)
-    response = Response(compressed_data, status=status, content_type=content_type)
+    """Creates a gzipped Flask response.
+
+    JSON is compressed as it is written and streamed to the client chunked
+    (no Content-Length), so neither the JSON nor the gzipped body is held in
+    memory whole. Output decompresses to json.dumps(data).
+    """
+    compressed_chunks = embedding_json.iter_gzip(embedding_json.iter_json(data))
+    response = Response(compressed_chunks, status=status, content_type=content_type)
     response.headers['Content-Encoding'] = 'gzip'
     return response
 
@@ -160,8 +173,15 @@ def combine_results(instance, cached_patch_embeddings, new_patch_embeddings, unc
     return final_patch_embeddings
 
 
-def _create_app() -> flask.Flask:
-    """Creates a Flask app with the given executor."""
+def _create_app(
+        profiler: Optional[sampling_profiler.SamplingProfiler] = None,
+) -> flask.Flask:
+    """Creates a Flask app with the given executor.
+
+    Args:
+      profiler: Adds the /admin/profile endpoints (sampling_profiler.py) when
+        given, e.g. to see where a hot worker spends time in /predict.
+    """
     # Create credentials and get access token on startup
     try:
         global credentials
@@ -177,6 +197,8 @@ def _create_app() -> flask.Flask:
     CORS(flask_app, origins='http://localhost:5432')
     flask_app.config.from_mapping({"CACHE_TYPE": "simple"})
     cache = Cache(flask_app)
+    if profiler is not None:
+        sampling_profiler.install(flask_app, profiler)
 
     @flask_app.route("/", methods=["GET"])
     def display_html():
@@ -244,7 +266,7 @@ def _create_app() -> flask.Flask:
 
             # If all patches are cached, return the cached results
             if not uncached_patches:
-                return create_gzipped_response({"predictions": [{"result": {"patch_embeddings": cached_patch_embeddings}} ]})
+                return create_gzipped_response({"predictions": [{"result": {"patch_embeddings": patch_embedding_rows(cached_patch_embeddings)}} ]})
 
             # Prepare the request for uncached patches
             request_body = {"instances": [{"dicom_path": dicom_path, "patch_coordinates": uncached_patches}]}
@@ -261,7 +283,7 @@ def _create_app() -> flask.Flask:
 
             final_patch_embeddings = combine_results(instance, cached_patch_embeddings, new_patch_embeddings, uncached_patch_indices)
 
-            return create_gzipped_response({"predictions": [{"result": {"patch_embeddings": final_patch_embeddings}} ]}, status=response.status_code)
+            return create_gzipped_response({"predictions": [{"result": {"patch_embeddings": patch_embedding_rows(final_patch_embeddings)}} ]}, status=response.status_code)
 
         except requests.RequestException as e:
             headers['Authorization'] = "hidden"
@@ -318,11 +340,12 @@ class PredictionApplication(gunicorn_base.BaseApplication):
             self,
             *,
             options: Optional[Mapping[str, Any]] = None,
+            profiler: Optional[sampling_profiler.SamplingProfiler] = None,
     ):
         self.options = options or {}
         self.options = dict(self.options)
         self.options["preload_app"] = False
-        self.application = _create_app()
+        self.application = _create_app(profiler)
         super().__init__()
 
     def load_config(self):
@@ -343,7 +366,9 @@ def main(argv: Sequence[str]) -> None:
                'workers': 6,
                'timeout': 600
                }
-    PredictionApplication(options=options).run()
+    PredictionApplication(
+        options=options, profiler=sampling_profiler.from_env(_PROFILE_HZ.value)
+    ).run()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,128 @@
+"""
+Batched MedSigLIP image preprocessing on uint8 arrays, without PIL.
+
+The Hugging Face processor converts every patch to a PIL image, resizes it,
+rescales and normalizes it one image at a time. Here all patches of a
+micro-batch are stacked into one (N, H, W, 3) uint8 array and resized and
+normalized together with torch, using the constants of the model's own
+image processor (size, resample, rescale factor, mean and std). Rescale and
+normalize are fused into one multiply-add per channel.
+
+Patches already at the model's input size (the common case, 448 x 448 for
+medsiglip-448) skip resizing and match the processor exactly. Resized
+patches use torch's antialiased interpolation, which follows PIL's filters,
+with PIL's uint8 rounding between passes; they agree with the processor
+within two grey levels, with a mean difference far below one.
+scripts/check_batch_preprocess.py measures both.
+"""
+
+import dataclasses
+from typing import Optional, Sequence, Tuple, Union
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+# PIL resample filters (PILImageResampling values) with a torch equivalent
+_TORCH_MODES = {2: 'bilinear', 3: 'bicubic'}
+
+Pixels = Union[np.ndarray, Sequence[np.ndarray]]
+
+
+@dataclasses.dataclass(frozen=True)
+class BatchPreprocessConfig:
+    """Model input size and per channel x * scale - offset applied to uint8 pixels."""
+
+    height: int
+    width: int
+    mode: Optional[str]  # torch interpolate mode; None disables resizing
+    scale: Tuple[float, float, float]
+    offset: Tuple[float, float, float]
+
+
+def _per_channel(value) -> Tuple[float, float, float]:
+    values = [float(v) for v in np.atleast_1d(value)]
+    return tuple(values * 3) if len(values) == 1 else tuple(values)
+
+
+def config_from_processor(image_processor) -> Optional[BatchPreprocessConfig]:
+    """Reads preprocessing constants from a Hugging Face image processor.
+
+    Returns None when the processor does something this path does not
+    reproduce (cropping, padding, an unsupported filter); callers then keep
+    using the processor itself.
+    """
+    if getattr(image_processor, 'do_center_crop', False) or getattr(image_processor, 'do_pad', False):
+        return None
+    try:
+        size = image_processor.size
+        height, width = int(size['height']), int(size['width'])
+        resample = int(image_processor.resample)
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+    do_resize = getattr(image_processor, 'do_resize', True)
+    if do_resize and resample not in _TORCH_MODES:
+        return None
+    rescale = float(image_processor.rescale_factor) if getattr(image_processor, 'do_rescale', True) else 1.0
+    if getattr(image_processor, 'do_normalize', True):
+        mean = _per_channel(image_processor.image_mean)
+        std = _per_channel(image_processor.image_std)
+    else:
+        mean, std = (0.0, 0.0, 0.0), (1.0, 1.0, 1.0)
+    # ((x * rescale) - mean) / std == x * (rescale / std) - mean / std
+    return BatchPreprocessConfig(
+        height=height,
+        width=width,
+        mode=_TORCH_MODES[resample] if do_resize else None,
+        scale=tuple(rescale / s for s in std),
+        offset=tuple(m / s for m, s in zip(mean, std)),
+    )
+
+
+def _resize(x: torch.Tensor, config: BatchPreprocessConfig) -> torch.Tensor:
+    x = x.float()
+    # PIL resizes uint8 images horizontally then vertically, rounding and
+    # clipping to uint8 after each pass; bicubic overshoot makes that visible.
+    # antialias=True selects PIL's filter support and bicubic coefficient (a = -0.5).
+    for size in ((x.shape[2], config.width), (config.height, config.width)):
+        if tuple(x.shape[2:]) != size:
+            x = F.interpolate(x, size=size, mode=config.mode, align_corners=False, antialias=True)
+            x = x.add_(0.5).floor_().clamp_(0, 255)  # PIL rounds halves up
+    return x
+
+
+def pixel_values(pixels: Pixels, config: BatchPreprocessConfig) -> torch.Tensor:
+    """Returns (N, 3, height, width) float32 model inputs for (H, W, 3) uint8 RGB patches.
+
+    pixels is either one (N, H, W, 3) array or a sequence of (H, W, 3)
+    arrays; patches of equal size are resized together.
+    """
+    n = len(pixels)
+    out = torch.empty((n, 3, config.height, config.width), dtype=torch.float32)
+    if isinstance(pixels, np.ndarray) and pixels.ndim == 4:
+        groups = {pixels.shape[1:]: None}
+    else:
+        groups = {}
+        for i, arr in enumerate(pixels):
+            groups.setdefault(arr.shape, []).append(i)
+    scale = torch.tensor(config.scale, dtype=torch.float32).view(1, 3, 1, 1)
+    offset = torch.tensor(config.offset, dtype=torch.float32).view(1, 3, 1, 1)
+    for shape, rows in groups.items():
+        if rows is None:
+            batch = pixels
+        elif len(rows) == n:
+            batch = np.stack(pixels)
+        else:
+            batch = np.stack([pixels[i] for i in rows])
+        x = torch.from_numpy(np.ascontiguousarray(batch, dtype=np.uint8)).permute(0, 3, 1, 2)
+        if shape[:2] != (config.height, config.width):
+            if config.mode is None:
+                raise ValueError(f'Patch size {shape[:2]} differs from the model input size and resizing is disabled')
+            x = _resize(x, config)
+        target = out if rows is None or len(rows) == n else torch.empty((len(rows), 3, config.height, config.width))
+        target.copy_(x)  # uint8 -> float32 for unresized patches
+        target.mul_(scale).sub_(offset)
+        if target is not out:
+            out[rows] = target
+    return out
+
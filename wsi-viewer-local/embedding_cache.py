@@ -0,0 +1,199 @@
+"""
+Content-addressed cache of MedSigLIP patch embeddings.
+
+Embeddings are stored once per distinct patch content, keyed by a BLAKE2b
+digest of the patch pixels (shape + uint8 RGB bytes, as handed to the
+processor) and the model id. Re-imported copies of a slide under new UIDs and
+the many identical blank background patches therefore share one entry,
+whatever their series or coordinate.
+
+A second, smaller index maps exact request coordinates (model, pixel
+sourcing mode, series, instance, patch rectangle and a fingerprint of the
+caller's token) to the
+content digest, so repeated requests for the same patch skip fetching and
+decoding pixels as well as the model. Content hits still fetch pixels (the
+caller proves access by reading them) but skip the model.
+
+Rows live in one preallocated float32 matrix sized from the byte budget;
+evicted rows (least recently used) are reused in place.
+"""
+
+import collections
+import dataclasses
+import hashlib
+import os
+import threading
+from typing import Optional, Tuple
+
+import numpy as np
+
+_DEFAULT_MAX_BYTES = int(os.environ.get('MEDSIGLIP_EMBEDDING_CACHE_BYTES', str(256 * 1024 * 1024)))
+
+_DIGEST_SIZE = 16
+# Approximate bytes per index entry (dict slot, key, digest); each row allows
+# one content entry and _COORDINATES_PER_ROW coordinate entries.
+_INDEX_ENTRY_BYTES = 160
+_COORDINATES_PER_ROW = 2
+
+CoordinateKey = Tuple[str, str, str, str, int, int, int, int]
+
+
+def content_digest(model_id: str, pixels: np.ndarray) -> bytes:
+    """Digest of (model id, patch shape, patch pixels)."""
+    h = hashlib.blake2b(digest_size=_DIGEST_SIZE)
+    h.update(model_id.encode('utf-8'))
+    h.update(repr(pixels.shape).encode('ascii'))
+    h.update(np.ascontiguousarray(pixels, dtype=np.uint8).data)
+    return h.digest()
+
+
+def coordinate_scope(
+    model_id: str, series_path: str, instance_uid: Optional[str], bearer_token: Optional[str],
+    pyramid_sourcing: bool = False,
+) -> Tuple[str, str, str, str]:
+    """Prefix of coordinate keys for one request; tokens are only fingerprinted.
+
+    Pixels read from a coarser pyramid level embed differently, so the sourcing
+    mode is part of the key.
+    """
+    token = hashlib.blake2b((bearer_token or '').encode('utf-8'), digest_size=8).hexdigest()
+    sourcing = 'pyramid' if pyramid_sourcing else 'requested'
+    return (model_id, sourcing, f"{series_path}|{instance_uid or ''}", token)
+
+
+@dataclasses.dataclass(frozen=True)
+class EmbeddingCacheStats:
+    """Point in time statistics; ratios are per patch looked up."""
+
+    lookups: int
+    coordinate_hits: int
+    content_hits: int
+    misses: int
+    entries: int
+    coordinate_entries: int
+    capacity: int
+    resident_bytes: int
+    max_bytes: int
+
+    @property
+    def coordinate_hit_ratio(self) -> float:
+        return self.coordinate_hits / self.lookups if self.lookups else 0.0
+
+    @property
+    def content_hit_ratio(self) -> float:
+        return self.content_hits / self.lookups if self.lookups else 0.0
+
+    @property
+    def hit_ratio(self) -> float:
+        return (self.coordinate_hits + self.content_hits) / self.lookups if self.lookups else 0.0
+
+
+class EmbeddingCache:
+    """Thread safe, byte bounded LRU of embeddings keyed by content digest."""
+
+    def __init__(self, max_bytes: int = _DEFAULT_MAX_BYTES):
+        self._max_bytes = max(0, max_bytes)
+        self._rows: Optional[np.ndarray] = None
+        self._slots = collections.OrderedDict()  # digest -> row index
+        self._free = []
+        self._coordinates = collections.OrderedDict()  # CoordinateKey -> digest
+        self._lookups = 0
+        self._coordinate_hits = 0
+        self._content_hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def max_bytes(self) -> int:
+        return self._max_bytes
+
+    def _capacity(self, dim: int) -> int:
+        return self._max_bytes // (dim * 4 + (1 + _COORDINATES_PER_ROW) * _INDEX_ENTRY_BYTES)
+
+    def get(self, digest: bytes, out: np.ndarray) -> bool:
+        """Copies the embedding for digest into out; False if not cached."""
+        with self._lock:
+            slot = self._slots.get(digest)
+            if slot is None:
+                return False
+            self._slots.move_to_end(digest)
+            out[...] = self._rows[slot]
+            return True
+
+    def put(self, digest: bytes, embedding: np.ndarray) -> None:
+        dim = embedding.shape[-1]
+        with self._lock:
+            if self._rows is None or self._rows.shape[1] != dim:
+                capacity = self._capacity(dim)
+                if not capacity:
+                    return
+                # Allocated on first use, once the embedding size is known
+                self._rows = np.empty((capacity, dim), dtype=np.float32)
+                self._slots.clear()
+                self._coordinates.clear()
+                self._free = list(range(capacity - 1, -1, -1))
+            slot = self._slots.get(digest)
+            if slot is None:
+                if self._free:
+                    slot = self._free.pop()
+                else:
+                    _, slot = self._slots.popitem(last=False)
+                self._slots[digest] = slot
+            else:
+                self._slots.move_to_end(digest)
+            self._rows[slot] = embedding
+
+    def lookup_coordinate(self, key: CoordinateKey) -> Optional[bytes]:
+        """Returns the content digest last stored for key, if its row is cached."""
+        with self._lock:
+            digest = self._coordinates.get(key)
+            if digest is None:
+                return None
+            if digest not in self._slots:
+                del self._coordinates[key]
+                return None
+            self._coordinates.move_to_end(key)
+            return digest
+
+    def put_coordinate(self, key: CoordinateKey, digest: bytes) -> None:
+        with self._lock:
+            if self._rows is None:
+                return
+            self._coordinates[key] = digest
+            self._coordinates.move_to_end(key)
+            while len(self._coordinates) > _COORDINATES_PER_ROW * self._rows.shape[0]:
+                self._coordinates.popitem(last=False)
+
+    def record(self, coordinate_hits: int = 0, content_hits: int = 0, misses: int = 0) -> None:
+        """Counts the outcome of patch lookups (each patch counted once)."""
+        with self._lock:
+            self._lookups += coordinate_hits + content_hits + misses
+            self._coordinate_hits += coordinate_hits
+            self._content_hits += content_hits
+            self._misses += misses
+
+    def clear(self) -> None:
+        with self._lock:
+            self._rows = None
+            self._slots.clear()
+            self._coordinates.clear()
+            self._free = []
+
+    def stats(self) -> EmbeddingCacheStats:
+        with self._lock:
+            capacity = 0 if self._rows is None else self._rows.shape[0]
+            return EmbeddingCacheStats(
+                lookups=self._lookups,
+                coordinate_hits=self._coordinate_hits,
+                content_hits=self._content_hits,
+                misses=self._misses,
+                entries=len(self._slots),
+                coordinate_entries=len(self._coordinates),
+                capacity=capacity,
+                resident_bytes=0 if self._rows is None else self._rows.nbytes,
+                max_bytes=self._max_bytes,
+            )
+
+
+# Process wide cache shared by predictors.
+shared_cache = EmbeddingCache()
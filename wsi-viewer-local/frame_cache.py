@@ -0,0 +1,112 @@
+"""
+Byte bounded LRU cache of decoded DICOM frames.
+
+Interactive sessions request overlapping patches with shifting alignments;
+keeping decoded frames avoids re-fetching and re-decoding the same frames
+within a session. Entries are keyed by FrameKey and evicted least recently
+used first once resident bytes exceed the configured budget.
+"""
+
+import collections
+import dataclasses
+import os
+import threading
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+_DEFAULT_MAX_BYTES = int(os.environ.get('DECODED_FRAME_CACHE_BYTES', str(1024 * 1024 * 1024)))
+
+
+class FrameKey(NamedTuple):
+    """Identifies a decoded frame.
+
+    Attributes:
+        series_path: DICOMweb path of the series.
+        instance_uid: SOP Instance UID of the instance holding the frame.
+        frame_number: Frame number within the instance (1 based).
+        icc_transform: Identifier of the ICC transform applied; '' for none.
+    """
+
+    series_path: str
+    instance_uid: str
+    frame_number: int
+    icc_transform: str = ''
+
+
+@dataclasses.dataclass(frozen=True)
+class FrameCacheStats:
+    """Point in time cache statistics."""
+
+    hits: int
+    misses: int
+    frame_count: int
+    resident_bytes: int
+    max_bytes: int
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class DecodedFrameCache:
+    """Thread safe, byte bounded LRU of decoded frames."""
+
+    def __init__(self, max_bytes: int = _DEFAULT_MAX_BYTES):
+        self._max_bytes = max(0, max_bytes)
+        self._frames = collections.OrderedDict()
+        self._resident_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def max_bytes(self) -> int:
+        return self._max_bytes
+
+    def get(self, key: FrameKey) -> Optional[np.ndarray]:
+        """Returns cached read-only frame or None."""
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is None:
+                self._misses += 1
+                return None
+            self._frames.move_to_end(key)
+            self._hits += 1
+            return frame
+
+    def put(self, key: FrameKey, frame: np.ndarray) -> None:
+        """Caches a copy of frame; frames larger than the budget are ignored."""
+        if frame.nbytes > self._max_bytes:
+            return
+        frame = np.array(frame, copy=True)
+        frame.flags.writeable = False
+        with self._lock:
+            previous = self._frames.pop(key, None)
+            if previous is not None:
+                self._resident_bytes -= previous.nbytes
+            self._frames[key] = frame
+            self._resident_bytes += frame.nbytes
+            while self._resident_bytes > self._max_bytes:
+                _, evicted = self._frames.popitem(last=False)
+                self._resident_bytes -= evicted.nbytes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._frames.clear()
+            self._resident_bytes = 0
+
+    def stats(self) -> FrameCacheStats:
+        with self._lock:
+            return FrameCacheStats(
+                hits=self._hits,
+                misses=self._misses,
+                frame_count=len(self._frames),
+                resident_bytes=self._resident_bytes,
+                max_bytes=self._max_bytes,
+            )
+
+
+# Process wide cache shared by predictors.
+shared_cache = DecodedFrameCache()
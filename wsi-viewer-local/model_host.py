@@ -0,0 +1,309 @@
+"""
+Single process that owns MedSigLIP for multi-worker (production) serving.
+
+Web workers fetch and cache DICOM frames themselves and send patch batches to
+the model host over a local socket (multiprocessing.connection, AF_UNIX,
+authenticated). Pixels and embeddings are not pickled: each client thread
+owns a shared memory segment holding the batch's uint8 RGB patches followed
+by the float32 (patches, dim) output, and only the segment name and patch
+shapes travel over the socket. The host embeds one batch at a time so model
+memory stays bounded by the micro-batch budget however many workers run.
+
+Messages (client -> host):
+  ('info',)                               -> ('ok', {state, error, embedding_dim, batch_size, logit_scale, logit_bias})
+  ('embed', shm_name, shapes, out_offset) -> ('ok', None) | ('error', message)
+  ('embed_text', prompts)                 -> ('ok', (len(prompts), dim) float32 array) | ('error', message)
+"""
+
+import argparse
+import atexit
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing import connection, resource_tracker, shared_memory
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+import predict_medsiglip
+
+_ALIGN = 64
+
+
+def _aligned(n: int) -> int:
+    return (n + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _layout(shapes: Sequence[Tuple[int, int, int]]) -> Tuple[List[int], int]:
+    """Returns byte offset of each patch and the offset following the last."""
+    offsets = []
+    end = 0
+    for shape in shapes:
+        offsets.append(end)
+        end = _aligned(end + int(np.prod(shape)))
+    return offsets, end
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Attaches to a client's segment without taking ownership of it."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        # Otherwise the host's resource tracker unlinks client segments on exit
+        resource_tracker.unregister(shm._name, 'shared_memory')  # type: ignore[attr-defined]
+        return shm
+
+
+class ModelHost:
+    """Serves embedding requests for a predictor; loads it in the background."""
+
+    def __init__(self, predictor: predict_medsiglip.MedSigLIPPredictor):
+        self._predictor = predictor
+        self._state = 'loading'
+        self._error: Optional[str] = None
+        # One batch through the model at a time
+        self._model_lock = threading.Lock()
+        threading.Thread(target=self._load, name='model-host-load', daemon=True).start()
+
+    def _load(self) -> None:
+        try:
+            self._predictor.warm_up()
+            self._state = 'ready'
+        except Exception as e:
+            logging.exception('Model host failed to load the model')
+            self._error = str(e)
+            self._state = 'failed'
+
+    def info(self) -> Dict[str, Any]:
+        info = {'state': self._state, 'error': self._error}
+        if self._state == 'ready':
+            info['embedding_dim'] = self._predictor.embedding_dim
+            info['batch_size'] = self._predictor.batch_size
+            info['input_size'] = list(self._predictor.input_size)
+            info['logit_scale'], info['logit_bias'] = self._predictor.logit_params()
+        return info
+
+    def _embed(self, shm: shared_memory.SharedMemory, shapes, out_offset: int) -> None:
+        offsets, _ = _layout(shapes)
+        size = int(np.prod(shapes[0])) if shapes else 0
+        if shapes and all(tuple(shape) == tuple(shapes[0]) for shape in shapes) and size % _ALIGN == 0:
+            # Equal, unpadded patches are back to back: one (N, H, W, 3) batch
+            pixels = np.ndarray((len(shapes), *shapes[0]), dtype=np.uint8, buffer=shm.buf, offset=0)
+        else:
+            pixels = [
+                np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=offset)
+                for shape, offset in zip(shapes, offsets)
+            ]
+        out = np.ndarray((len(shapes), self._predictor.embedding_dim), dtype=np.float32,
+                         buffer=shm.buf, offset=out_offset)
+        with self._model_lock:
+            self._predictor.embed_pixels(pixels, out)
+
+    def handle(self, conn: connection.Connection) -> None:
+        """Serves one client connection until it closes."""
+        shm: Optional[shared_memory.SharedMemory] = None
+        try:
+            while True:
+                try:
+                    msg = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    if msg[0] == 'info':
+                        conn.send(('ok', self.info()))
+                    elif msg[0] == 'embed':
+                        _, name, shapes, out_offset = msg
+                        if self._state != 'ready':
+                            raise RuntimeError(f'Model is not ready ({self._state}).')
+                        if shm is None or shm.name.lstrip('/') != name.lstrip('/'):
+                            if shm is not None:
+                                shm.close()
+                            shm = _attach(name)
+                        self._embed(shm, shapes, out_offset)
+                        conn.send(('ok', None))
+                    elif msg[0] == 'embed_text':
+                        if self._state != 'ready':
+                            raise RuntimeError(f'Model is not ready ({self._state}).')
+                        with self._model_lock:
+                            embeds = self._predictor.embed_texts(list(msg[1]))
+                        conn.send(('ok', embeds))
+                    else:
+                        conn.send(('error', f'Unknown message {msg[0]!r}'))
+                except Exception as e:
+                    logging.exception('Model host request failed')
+                    conn.send(('error', str(e)))
+        finally:
+            if shm is not None:
+                shm.close()
+            conn.close()
+
+    def serve_forever(self, listener: connection.Listener) -> None:
+        while True:
+            conn = listener.accept()
+            threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+
+def run_host(address: str, authkey: bytes) -> None:
+    """Process entry point: listens on address and serves MedSigLIP embeddings."""
+    logging.basicConfig(level=logging.INFO)
+    if os.path.exists(address):
+        os.unlink(address)
+    # Frames are fetched and cached by the web workers, not the host
+    host = ModelHost(predict_medsiglip.MedSigLIPPredictor(cache=None, embeddings=None))
+    with connection.Listener(address, family='AF_UNIX', authkey=authkey) as listener:
+        logging.info('Model host listening on %s', address)
+        host.serve_forever(listener)
+
+
+def start_host_process(address: str, authkey: bytes, timeout: float = 60.0) -> subprocess.Popen:
+    """Starts the model host process and waits for its socket.
+
+    A plain subprocess rather than multiprocessing.Process: gunicorn workers
+    forked from the launcher would otherwise inherit it as a daemonic child
+    and terminate it when they exit.
+    """
+    if os.path.exists(address):
+        os.unlink(address)
+    env = dict(os.environ, MODEL_HOST_AUTHKEY=authkey.hex())
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--address', address], env=env)
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(address):
+        if process.poll() is not None:
+            raise RuntimeError(f'Model host exited with code {process.returncode}')
+        if time.monotonic() > deadline:
+            process.terminate()
+            raise RuntimeError(f'Model host did not listen on {address} within {timeout}s')
+        time.sleep(0.05)
+    return process
+
+
+class _ClientState(threading.local):
+    conn: Optional[connection.Connection] = None
+    shm: Optional[shared_memory.SharedMemory] = None
+
+
+class ModelHostPredictor(predict_medsiglip.MedSigLIPPredictor):
+    """MedSigLIPPredictor that embeds through the model host process.
+
+    Patch fetching and the decoded frame cache stay in the calling process;
+    only pixels go to the host. Each thread keeps its own connection and
+    shared memory segment, grown as needed and reused across batches.
+    """
+
+    def __init__(self, address: str, authkey: bytes, poll_seconds: float = 1.0, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self._address = address
+        self._authkey = authkey
+        self._poll_seconds = poll_seconds
+        self._embedding_dim: Optional[int] = None
+        self._input_size: Tuple[int, int] = (448, 448)
+        self._logit_params: Tuple[float, float] = (1.0, 0.0)
+        self._local = _ClientState()
+        self._segments: List[shared_memory.SharedMemory] = []
+        self._segments_lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _call(self, msg: tuple) -> Any:
+        if self._local.conn is None:
+            self._local.conn = connection.Client(self._address, family='AF_UNIX', authkey=self._authkey)
+        try:
+            self._local.conn.send(msg)
+            status, payload = self._local.conn.recv()
+        except (EOFError, OSError) as e:
+            self._local.conn = None
+            raise RuntimeError(f'Model host connection failed: {e}') from e
+        if status != 'ok':
+            raise RuntimeError(f'Model host error: {payload}')
+        return payload
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._embedding_dim is not None
+
+    def _lazy_load(self):
+        if self.is_loaded:
+            return
+        info = self._call(('info',))
+        if info['state'] != 'ready':
+            raise RuntimeError(f"Model host is not ready ({info['state']}): {info.get('error') or ''}")
+        self.batch_size = int(info['batch_size'])
+        self._logit_params = (float(info['logit_scale']), float(info['logit_bias']))
+        self._input_size = tuple(int(d) for d in info['input_size'])
+        self._embedding_dim = int(info['embedding_dim'])
+
+    @property
+    def embedding_dim(self) -> int:
+        self._lazy_load()
+        return self._embedding_dim
+
+    @property
+    def input_size(self) -> Tuple[int, int]:
+        self._lazy_load()
+        return self._input_size
+
+    def warm_up(self) -> None:
+        """Waits for the host to finish loading (and warming up) the model."""
+        while True:
+            info = self._call(('info',))
+            if info['state'] == 'ready':
+                self._lazy_load()
+                return
+            if info['state'] == 'failed':
+                raise RuntimeError(f"Model host failed to load the model: {info['error']}")
+            time.sleep(self._poll_seconds)
+
+    def logit_params(self) -> Tuple[float, float]:
+        self._lazy_load()
+        return self._logit_params
+
+    def embed_texts(self, prompts: List[str]) -> np.ndarray:
+        return self._call(('embed_text', list(prompts)))
+
+    def _segment(self, size: int) -> shared_memory.SharedMemory:
+        shm = self._local.shm
+        if shm is not None and shm.size >= size:
+            return shm
+        if shm is not None:
+            with self._segments_lock:
+                self._segments.remove(shm)
+            shm.close()
+            shm.unlink()
+        # Grow geometrically so a thread settles on one segment
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 2 * (shm.size if shm else 0)))
+        with self._segments_lock:
+            self._segments.append(shm)
+        self._local.shm = shm
+        return shm
+
+    def embed_pixels(self, pixels: Union[np.ndarray, List[np.ndarray]], out: np.ndarray) -> None:
+        shapes = [tuple(int(d) for d in arr.shape) for arr in pixels]
+        offsets, out_offset = _layout(shapes)
+        size = out_offset + len(pixels) * self.embedding_dim * 4
+        shm = self._segment(size)
+        for arr, shape, offset in zip(pixels, shapes, offsets):
+            np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=offset)[...] = arr
+        self._call(('embed', shm.name, shapes, out_offset))
+        out[...] = np.ndarray(out.shape, dtype=np.float32, buffer=shm.buf, offset=out_offset)
+
+    def close(self) -> None:
+        """Unlinks shared memory segments created by this predictor."""
+        with self._segments_lock:
+            segments, self._segments = self._segments, []
+        for shm in segments:
+            try:
+                shm.close()
+                shm.unlink()
+            except (BufferError, FileNotFoundError):
+                pass
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--address', required=True, help='Unix socket path to listen on.')
+    args = parser.parse_args()
+    # Passed through the environment so it is not visible in the process list
+    run_host(args.address, bytes.fromhex(os.environ.pop('MODEL_HOST_AUTHKEY')))
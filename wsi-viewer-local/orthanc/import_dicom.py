@@ -1,43 +1,252 @@
 #!/usr/bin/env python3
+"""
+Import DICOM files into Orthanc via REST.
+
+Also the import engine used by scripts/convert_wsi_to_dicom.py and
+scripts/download_sample_wsi.py (OrthancImporter):
+
+- Files are uploaded by a bounded pool of threads, each POSTing over a
+  keep-alive connection of one shared session; bodies are streamed from disk.
+- Before uploading, SOPInstanceUIDs are read from the file headers (needs
+  pydicom, installed with wsidicom) and looked up in Orthanc in bulk
+  (/tools/find); instances already stored are skipped.
+- Connection errors and 408/429/5xx responses are retried with backoff.
+
+Usage:
+  python orthanc/import_dicom.py --path /path/to/folder_or_file --workers 8
+"""
+
 import argparse
+import concurrent.futures
+import dataclasses
 import os
 import sys
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
 import requests
+from requests.adapters import HTTPAdapter
+
+# Upload threads (and keep-alive connections)
+DEFAULT_WORKERS = int(os.environ.get('ORTHANC_IMPORT_WORKERS', '8'))
+# UIDs per /tools/find lookup
+_FIND_CHUNK = 200
+_RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+def find_dicom_files(paths: Iterable[str]) -> List[str]:
+    """Returns .dcm files given directly or found under folders, in a stable order."""
+    files = []
+    for path in paths:
+        if os.path.isfile(path):
+            files.append(path)
+            continue
+        for root, _dirs, names in os.walk(path):
+            files.extend(os.path.join(root, n) for n in sorted(names) if n.lower().endswith('.dcm'))
+    return files
+
+
+def read_sop_instance_uid(path: str) -> Optional[str]:
+    """SOPInstanceUID from the file header, or None if it cannot be read."""
+    try:
+        import pydicom
+    except ImportError:
+        return None
+    try:
+        ds = pydicom.dcmread(path, stop_before_pixels=True, specific_tags=['SOPInstanceUID'])
+        uid = ds.get('SOPInstanceUID')
+    except Exception:  # Not DICOM, truncated, ...: let Orthanc decide
+        return None
+    return str(uid) if uid else None
+
+
+@dataclasses.dataclass
+class ImportStats:
+    files: int = 0
+    uploaded: int = 0
+    skipped: int = 0  # Already in Orthanc
+    failed: int = 0
+    retries: int = 0
+    bytes: int = 0  # Uploaded bytes
+    seconds: float = 0.0
+
+    @property
+    def files_per_second(self) -> float:
+        return self.uploaded / self.seconds if self.seconds else 0.0
+
+    @property
+    def mb_per_second(self) -> float:
+        return self.bytes / 1e6 / self.seconds if self.seconds else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            **dataclasses.asdict(self),
+            'seconds': round(self.seconds, 3),
+            'files_per_second': round(self.files_per_second, 2),
+            'mb_per_second': round(self.mb_per_second, 2),
+        }
 
 
-def post_file(orthanc_url: str, path: str) -> None:
-    with open(path, 'rb') as f:
-        r = requests.post(f"{orthanc_url.rstrip('/')}/instances", data=f, headers={'Expect': ''})
-        r.raise_for_status()
-    print(f"Imported: {path}")
+class OrthancImporter:
+    """Uploads DICOM files to Orthanc concurrently, skipping stored instances.
+
+    Thread safe; one importer (and its connection pool) can serve several
+    callers, e.g. conversions finishing at different times.
+    """
+
+    def __init__(
+        self,
+        orthanc_url: str,
+        workers: int = DEFAULT_WORKERS,
+        dedupe: bool = True,
+        retries: int = 3,
+        backoff_seconds: float = 0.5,
+        timeout: float = 600.0,
+        verbose: bool = True,
+    ) -> None:
+        self.orthanc_url = orthanc_url.rstrip('/')
+        self.workers = max(1, workers)
+        self.dedupe = dedupe
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.timeout = timeout
+        self.verbose = verbose
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers,
+                                                           thread_name_prefix='orthanc-import')
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        self._pool.shutdown()
+        self._session.close()
+
+    def __enter__(self) -> 'OrthancImporter':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _request(self, method: str, url: str, stats: ImportStats, file_path: Optional[str] = None,
+                 **kwargs) -> requests.Response:
+        """Sends a request (streaming file_path as the body), retrying connection errors and transient statuses."""
+        attempt = 0
+        while True:
+            try:
+                if file_path is not None:
+                    # Reopened per attempt, so a retry resends the whole body
+                    with open(file_path, 'rb') as f:
+                        r = self._session.request(method, url, data=f, timeout=self.timeout, **kwargs)
+                else:
+                    r = self._session.request(method, url, timeout=self.timeout, **kwargs)
+                if r.status_code not in _RETRY_STATUS or attempt >= self.retries:
+                    r.raise_for_status()
+                    return r
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.retries:
+                    raise
+            attempt += 1
+            with self._lock:
+                stats.retries += 1
+            time.sleep(self.backoff_seconds * 2 ** (attempt - 1))
+
+    def existing_uids(self, uids: List[str], stats: Optional[ImportStats] = None) -> set:
+        """Returns which of uids Orthanc already stores, with one lookup per chunk."""
+        stats = stats if stats is not None else ImportStats()
+        present = set()
+        for start in range(0, len(uids), _FIND_CHUNK):
+            chunk = uids[start:start + _FIND_CHUNK]
+            r = self._request('POST', f'{self.orthanc_url}/tools/find', stats, json={
+                'Level': 'Instance',
+                'Expand': True,
+                # Backslash separated values match any of them
+                'Query': {'SOPInstanceUID': '\\'.join(chunk)},
+            })
+            present.update(
+                inst.get('MainDicomTags', {}).get('SOPInstanceUID') for inst in r.json()
+            )
+        return present & set(uids)
+
+    def _upload(self, path: str, stats: ImportStats) -> None:
+        try:
+            self._request('POST', f'{self.orthanc_url}/instances', stats, file_path=path,
+                          headers={'Expect': '', 'Content-Type': 'application/dicom'})
+        except (OSError, requests.RequestException) as e:
+            with self._lock:
+                stats.failed += 1
+            print(f"Failed: {path} - {e}", file=sys.stderr, flush=True)
+            return
+        size = os.path.getsize(path)
+        with self._lock:
+            stats.uploaded += 1
+            stats.bytes += size
+        if self.verbose:
+            print(f"Imported: {path}", flush=True)
+
+    def import_files(self, files: List[str]) -> ImportStats:
+        """Uploads files not yet in Orthanc; returns counts and throughput.
+
+        Does not raise for Orthanc errors: failed uploads are counted in
+        stats.failed, and if the lookup of stored instances fails every file is
+        uploaded (Orthanc keeps one copy per SOPInstanceUID).
+        """
+        stats = ImportStats(files=len(files))
+        start = time.perf_counter()
+        if self.dedupe and files:
+            uids = list(self._pool.map(read_sop_instance_uid, files))
+            known = [uid for uid in uids if uid]
+            try:
+                present = self.existing_uids(sorted(set(known)), stats) if known else set()
+            except (requests.RequestException, ValueError) as e:
+                print(f"Lookup of stored instances failed, uploading all files: {e}", file=sys.stderr, flush=True)
+                present = set()
+            # Also skip repeats of a UID within this batch
+            queued = set()
+            todo = []
+            for path, uid in zip(files, uids):
+                if uid and (uid in present or uid in queued):
+                    stats.skipped += 1
+                    continue
+                if uid:
+                    queued.add(uid)
+                todo.append(path)
+            files = todo
+        list(self._pool.map(lambda path: self._upload(path, stats), files))
+        stats.seconds = time.perf_counter() - start
+        return stats
+
+    def import_paths(self, paths: Iterable[str]) -> ImportStats:
+        """Imports .dcm files given directly or found under folders."""
+        return self.import_files(find_dicom_files(paths))
 
 
 def main():
     parser = argparse.ArgumentParser(description="Import DICOM files into Orthanc via REST")
     parser.add_argument('--orthanc', default='http://localhost:8042', help='Orthanc base URL')
-    parser.add_argument('--path', required=True, help='File or folder containing .dcm files')
+    parser.add_argument('--path', required=True, nargs='+', help='Files or folders containing .dcm files')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Concurrent uploads')
+    parser.add_argument('--no-dedupe', action='store_true',
+                        help='Upload every file, even if its SOPInstanceUID is already stored')
+    parser.add_argument('--quiet', action='store_true', help='Only print the summary')
     args = parser.parse_args()
 
-    if not os.path.exists(args.path):
-        print(f"Path not found: {args.path}")
+    missing = [p for p in args.path if not os.path.exists(p)]
+    if missing:
+        print(f"Path not found: {', '.join(missing)}")
         sys.exit(1)
 
-    if os.path.isfile(args.path):
-        post_file(args.orthanc, args.path)
-        return
+    with OrthancImporter(args.orthanc, workers=args.workers, dedupe=not args.no_dedupe,
+                         verbose=not args.quiet) as importer:
+        stats = importer.import_paths(args.path)
 
-    # Walk folder
-    count = 0
-    for root, _dirs, files in os.walk(args.path):
-        for name in files:
-            if name.lower().endswith('.dcm'):
-                full = os.path.join(root, name)
-                post_file(args.orthanc, full)
-                count += 1
-
-    print(f"Imported {count} files")
+    print(f"Imported {stats.uploaded} files, skipped {stats.skipped} already stored, {stats.failed} failed "
+          f"({stats.files_per_second:.1f} files/s, {stats.mb_per_second:.1f} MB/s)")
+    if stats.failed:
+        sys.exit(1)
 
 
 if __name__ == '__main__':
     main()
-
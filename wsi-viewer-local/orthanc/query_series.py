@@ -1,35 +1,57 @@
 #!/usr/bin/env python3
+"""
+List studies/series in Orthanc and print DICOMweb series paths.
+
+Reads the local series catalog (series_catalog.py), synced first with
+Orthanc's change feed: a few bulk requests on the first run, and only the
+changes since the previous run afterwards.
+
+Usage:
+  python orthanc/query_series.py [--levels] [--rebuild]
+"""
+
 import argparse
-import requests
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import series_catalog  # noqa: E402
 
 
 def main():
     parser = argparse.ArgumentParser(description="List studies/series in Orthanc and print DICOMweb series paths")
     parser.add_argument('--orthanc', default='http://localhost:8042', help='Orthanc base URL')
     parser.add_argument('--dicomweb-root', default='http://localhost:8042/dicom-web', help='DICOMweb root URL')
+    parser.add_argument('--catalog', default=series_catalog.CATALOG_PATH, help='SQLite catalog file')
+    parser.add_argument('--rebuild', action='store_true', help='Rebuild the catalog instead of syncing changes')
+    parser.add_argument('--levels', action='store_true', help='Also print the pyramid levels of each series')
     args = parser.parse_args()
 
-    # List studies via Orthanc REST
-    studies = requests.get(f"{args.orthanc.rstrip('/')}/studies").json()
-    if not studies:
+    catalog = series_catalog.SeriesCatalog(args.orthanc, args.catalog)
+    synced = catalog.rebuild() if args.rebuild else catalog.sync()
+    print(f"Catalog synced ({synced['changes']} changes, {catalog.requests} Orthanc requests)", file=sys.stderr)
+
+    series = catalog.list_series()
+    if not series:
         print("No studies found.")
         return
 
-    for sid in studies:
-        study = requests.get(f"{args.orthanc.rstrip('/')}/studies/{sid}").json()
-        study_uid = study.get('MainDicomTags', {}).get('StudyInstanceUID')
-        print(f"Study UID: {study_uid}")
-        series_ids = study.get('Series', [])
-        for ser_id in series_ids:
-            series = requests.get(f"{args.orthanc.rstrip('/')}/series/{ser_id}").json()
-            series_uid = series.get('MainDicomTags', {}).get('SeriesInstanceUID')
-            # DICOMweb series path
-            series_path = f"studies/{study_uid}/series/{series_uid}"
-            print(f"  Series UID: {series_uid}")
-            print(f"  DICOMweb series URL: {args.dicomweb_root.rstrip('/')}/{series_path}")
-            print(f"  Viewer proxy series path: /dicom/{series_path}")
+    study_uid = None
+    for s in series:
+        if s['study_uid'] != study_uid:
+            study_uid = s['study_uid']
+            print(f"Study UID: {study_uid}")
+        print(f"  Series UID: {s['series_uid']}")
+        if s['width']:
+            print(f"  {s['instances']} instances, {s['levels']} levels, {s['width']} x {s['height']} px")
+        print(f"  DICOMweb series URL: {args.dicomweb_root.rstrip('/')}/{s['series_path']}")
+        print(f"  Viewer proxy series path: /dicom/{s['series_path']}")
+        if args.levels:
+            for level in catalog.levels(s['series_uid']):
+                print(f"    {level['width']} x {level['height']} px, {level['frames']} frames "
+                      f"of {level['tile_width']} x {level['tile_height']}: {level['sop_uid']}")
+    catalog.close()
 
 
 if __name__ == '__main__':
     main()
-
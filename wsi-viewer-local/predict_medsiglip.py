@@ -1,7 +1,8 @@
 import os
 import json
+import threading
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import numpy as np
 from PIL import Image
@@ -11,10 +12,30 @@ from transformers import AutoProcessor, AutoModel
 try:
     from ez_wsi_dicomweb import credential_factory
     from ez_wsi_dicomweb import dicom_slide
+    from ez_wsi_dicomweb import dicom_web_interface
     from ez_wsi_dicomweb.ml_toolkit import dicom_path
 except Exception as e:
     raise RuntimeError("ez-wsi-dicomweb is required for MedSigLIP patch fetching") from e
 
+import embedding_cache
+import frame_cache
+import slide_tiles
+import zero_shot
+
+# Activation memory a micro-batch may use; the batch size is derived from it
+# unless MEDSIGLIP_BATCH_SIZE is set.
+_BATCH_MEMORY_BYTES = int(os.environ.get('MEDSIGLIP_BATCH_MEMORY_MB', '2048')) * 1024 * 1024
+_BATCH_SIZE = int(os.environ.get('MEDSIGLIP_BATCH_SIZE', '0'))
+# Torch intra-op / inter-op thread pools; 0 keeps torch defaults.
+_TORCH_THREADS = int(os.environ.get('MEDSIGLIP_TORCH_THREADS', '0'))
+_TORCH_INTEROP_THREADS = int(os.environ.get('MEDSIGLIP_TORCH_INTEROP_THREADS', '0'))
+# Preprocess patch batches with torch (batch_preprocess.py); 0 uses the HF processor per PIL image.
+_BATCH_PREPROCESS = os.environ.get('MEDSIGLIP_BATCH_PREPROCESS', '1') != '0'
+# Read patches from the coarsest pyramid level still covering the model input; 0 reads the requested level.
+_PYRAMID_SOURCING = os.environ.get('MEDSIGLIP_PYRAMID_SOURCING', '1') != '0'
+# Pixel shortfall tolerated on a coarser level, since pyramid level sizes are rounded
+_LEVEL_TOLERANCE = 0.01
+
 
 @dataclass
 class Patch:
@@ -33,97 +54,516 @@ def _to_patch(obj: Dict[str, Any]) -> Patch:
     )
 
 
+def _scale_patch(p: Patch, sx: float, sy: float) -> Patch:
+    """Maps p onto a level sx by sy times coarser, covering the same field of view."""
+    return Patch(
+        x_origin=int(round(p.x_origin / sx)),
+        y_origin=int(round(p.y_origin / sy)),
+        width=max(1, int(round(p.width / sx))),
+        height=max(1, int(round(p.height / sy))),
+    )
+
+
+def _source_level(ds, level, width: int, height: int, input_size: Tuple[int, int]):
+    """Returns (level, sx, sy): the coarsest level where a width by height patch still spans input_size.
+
+    sx, sy are the downsampling of that level relative to level, the one the
+    patch coordinates refer to; (level, 1.0, 1.0) if no coarser level fits.
+    The choice depends only on the patch size, so a patch is always read from
+    the same level whatever other patches share its request.
+    """
+    input_height, input_width = input_size
+    best, best_sx, best_sy = level, 1.0, 1.0
+    for candidate in ds.levels:
+        if candidate.width >= best.width or candidate.height <= 0:
+            continue
+        sx = level.width / candidate.width
+        sy = level.height / candidate.height
+        if (width / sx >= input_width * (1 - _LEVEL_TOLERANCE)
+                and height / sy >= input_height * (1 - _LEVEL_TOLERANCE)):
+            best, best_sx, best_sy = candidate, sx, sy
+    return best, best_sx, best_sy
+
+
+def _image_activation_bytes(vision_config) -> int:
+    """Rough peak float32 activation bytes of one image through the vision tower.
+
+    Dominated by the attention scores and softmax of a layer (heads x tokens^2)
+    plus the MLP intermediate and a few hidden-state sized buffers.
+    """
+    size = int(getattr(vision_config, 'image_size', 448))
+    tokens = (size // int(getattr(vision_config, 'patch_size', 14))) ** 2
+    hidden = int(getattr(vision_config, 'hidden_size', 1152))
+    heads = int(getattr(vision_config, 'num_attention_heads', 16))
+    intermediate = int(getattr(vision_config, 'intermediate_size', 4304))
+    floats = 2 * heads * tokens * tokens + tokens * intermediate + 4 * tokens * hidden + 3 * size * size
+    return 4 * floats
+
+
+def batch_size_for_budget(vision_config, memory_bytes: int = _BATCH_MEMORY_BYTES) -> int:
+    """Images per micro-batch that fit memory_bytes of activations (at least 1)."""
+    return max(1, memory_bytes // _image_activation_bytes(vision_config))
+
+
+def configure_torch_threads(threads: int = _TORCH_THREADS, interop_threads: int = _TORCH_INTEROP_THREADS) -> None:
+    """Sizes torch thread pools; values <= 0 keep torch defaults."""
+    import torch  # Imported with the model so the server starts without it
+    if threads > 0:
+        torch.set_num_threads(threads)
+    if interop_threads > 0:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError:
+            # Can only be set once, before inter-op parallel work has started.
+            pass
+
+
+def _read_patch(
+    ds, level, p: Patch, cache: Optional[frame_cache.DecodedFrameCache], out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Assembles a patch from decoded frames, reusing frames held in cache.
+
+    Writes into out, a (height, width, samples per pixel) uint8 array, when given.
+    """
+    if out is None:
+        out = np.zeros((p.height, p.width, level.samples_per_pixel), dtype=np.uint8)
+    else:
+        out.fill(0)
+    x0 = max(p.x_origin, 0)
+    y0 = max(p.y_origin, 0)
+    x1 = min(p.x_origin + p.width, level.width)
+    y1 = min(p.y_origin + p.height, level.height)
+    if x0 >= x1 or y0 >= y1:
+        return out
+    series_path = str(ds.path)
+    fy = y0 - y0 % level.frame_height
+    while fy < y1:
+        fx = x0 - x0 % level.frame_width
+        while fx < x1:
+            frame_number = level.get_frame_number_by_point(fx, fy)
+            instance = level.get_instance_by_frame(frame_number)
+            if instance is not None:
+                key = frame_cache.FrameKey(
+                    series_path,
+                    instance.path.instance_uid,
+                    instance.instance_frame_number_from_wholes_slide_frame_number(frame_number),
+                )
+                pixels = cache.get(key) if cache is not None else None
+                if pixels is None:
+                    frame = ds.get_frame(level, frame_number)
+                    pixels = frame.image_np if frame is not None else None
+                    if pixels is not None and cache is not None:
+                        cache.put(key, pixels)
+                if pixels is not None:
+                    cx0, cy0 = max(x0, fx), max(y0, fy)
+                    cx1 = min(x1, fx + level.frame_width)
+                    cy1 = min(y1, fy + level.frame_height)
+                    out[cy0 - p.y_origin:cy1 - p.y_origin, cx0 - p.x_origin:cx1 - p.x_origin] = \
+                        pixels[cy0 - fy:cy1 - fy, cx0 - fx:cx1 - fx]
+            fx += level.frame_width
+        fy += level.frame_height
+    if level.photometric_interpretation == 'MONOCHROME1':
+        np.subtract(255, out, out=out)
+    return out
+
+
 class MedSigLIPPredictor:
     """Loads google/medsiglip-448 and returns embeddings for DICOM patches."""
 
-    def __init__(self, model_id: str = "google/medsiglip-448") -> None:
+    def __init__(
+        self,
+        model_id: str = "google/medsiglip-448",
+        cache: Optional[frame_cache.DecodedFrameCache] = frame_cache.shared_cache,
+        batch_size: int = _BATCH_SIZE,
+        batch_memory_bytes: int = _BATCH_MEMORY_BYTES,
+        embeddings: Optional[embedding_cache.EmbeddingCache] = embedding_cache.shared_cache,
+        pyramid_sourcing: bool = _PYRAMID_SOURCING,
+        slides: slide_tiles.SlideHandlePool = slide_tiles.shared_pool,
+    ) -> None:
         self.model_id = model_id
         self.model_dir = os.environ.get('MEDSIGLIP_MODEL_DIR')
         self._model = None
         self._processor = None
+        # Batched torch preprocessing constants; None falls back to the processor
+        self._preprocess = None
+        # Fixed micro-batch size; <= 0 derives it from batch_memory_bytes on load
+        self.batch_size = batch_size
+        self._batch_memory_bytes = batch_memory_bytes
+        # Serializes loading so concurrent first requests load weights once
+        self._load_lock = threading.Lock()
+        # Decoded frames are shared across requests (and predictors) in-process
+        self._cache = cache
+        # Embeddings by patch content (and exact coordinate), also in-process
+        self._embeddings = embeddings
+        # Fetch large fields of view from a coarser pyramid level (see _source_level)
+        self.pyramid_sourcing = pyramid_sourcing
+        # Local WSI files, read through the handles the tile routes use
+        self._slides = slides
+        # Text prompt embeddings, cached in memory and on disk
+        self._prompts = zero_shot.PromptEmbeddingStore(model_id, self.embed_texts)
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._model is not None and self._processor is not None
+
+    @property
+    def embedding_dim(self) -> int:
+        self._lazy_load()
+        return int(self._model.config.vision_config.hidden_size)
+
+    @property
+    def input_size(self) -> Tuple[int, int]:
+        """(height, width) of the model input images."""
+        self._lazy_load()
+        if self._preprocess is not None:
+            return self._preprocess.height, self._preprocess.width
+        size = int(getattr(self._model.config.vision_config, 'image_size', 448))
+        return size, size
 
     def _lazy_load(self):
-        if self._model is None or self._processor is None:
+        if self.is_loaded:
+            return
+        with self._load_lock:
+            if self.is_loaded:
+                return
             # Try local directory first if provided
             load_from = self.model_dir or self.model_id
             try:
-                self._model = AutoModel.from_pretrained(load_from)
-                self._processor = AutoProcessor.from_pretrained(load_from)
+                model = AutoModel.from_pretrained(load_from)
+                processor = AutoProcessor.from_pretrained(load_from)
             except Exception:
                 # Fallback to hub
-                self._model = AutoModel.from_pretrained(self.model_id)
-                self._processor = AutoProcessor.from_pretrained(self.model_id)
+                model = AutoModel.from_pretrained(self.model_id)
+                processor = AutoProcessor.from_pretrained(self.model_id)
+            configure_torch_threads()
+            model.eval()
+            if self.batch_size <= 0:
+                self.batch_size = batch_size_for_budget(
+                    model.config.vision_config, self._batch_memory_bytes)
+            if _BATCH_PREPROCESS:
+                import batch_preprocess
+                self._preprocess = batch_preprocess.config_from_processor(
+                    getattr(processor, 'image_processor', processor))
+            self._processor = processor
+            self._model = model
+
+    def warm_up(self) -> None:
+        """Loads weights and runs one forward pass so the first request is not slow."""
+        self._lazy_load()
+        size = int(getattr(self._model.config.vision_config, 'image_size', 448))
+        out = np.empty((1, self.embedding_dim), dtype=np.float32)
+        self.embed_pixels(np.zeros((1, size, size, 3), dtype=np.uint8), out)
 
     def _credential_factory(self, bearer_token: Optional[str]):
         if bearer_token:
             return credential_factory.TokenPassthroughCredentialFactory(bearer_token)
         return credential_factory.NoAuthCredentialsFactory()
 
-    def _fetch_patch_images(
-        self,
-        series_path: str,
-        patches: List[Patch],
-        bearer_token: Optional[str],
-        instance_uid: Optional[str] = None,
-    ) -> List[Image.Image]:
+    def _open_level(self, series_path: str, bearer_token: Optional[str], instance_uid: Optional[str]):
         cf = self._credential_factory(bearer_token)
         dpath = dicom_path.FromString(series_path)
-        ds = dicom_slide.DicomSlide(dwi=None, path=dpath, credential_factory=cf)
+        dwi = dicom_web_interface.DicomWebInterface(cf)
+        ds = dicom_slide.DicomSlide(dwi=dwi, path=dpath)
         level = None
         if instance_uid:
             # If instance UID provided, use its level; else use base level
             level = ds.get_instance_level(instance_uid)
-        imgs = []
-        for p in patches:
-            arr = ds.get_patch(level, p.x_origin, p.y_origin, p.width, p.height)
-            # Convert to PIL RGB
-            if isinstance(arr, np.ndarray):
-                if arr.ndim == 2:
-                    arr = np.stack([arr, arr, arr], axis=-1)
-                img = Image.fromarray(arr.astype(np.uint8), mode="RGB")
+        if level is None:
+            level = ds.native_level
+        return ds, level
+
+    def _patch_pixels(self, ds, level, p: Patch) -> np.ndarray:
+        """Returns patch as (height, width, 3) uint8 RGB."""
+        arr = _read_patch(ds, level, p, self._cache)
+        if arr.ndim == 2:
+            arr = np.stack([arr, arr, arr], axis=-1)
+        elif arr.shape[-1] == 1:
+            arr = np.repeat(arr, 3, axis=-1)
+        return arr
+
+    def _patch_batch(self, ds, level, patches: List[Patch]) -> Union[np.ndarray, List[np.ndarray]]:
+        """Returns patches as one (N, height, width, 3) uint8 RGB array.
+
+        RGB patches are assembled in place; a list is returned if sizes differ.
+        """
+        if not patches or any((p.width, p.height) != (patches[0].width, patches[0].height) for p in patches):
+            return [self._patch_pixels(ds, level, p) for p in patches]
+        out = np.empty((len(patches), patches[0].height, patches[0].width, 3), dtype=np.uint8)
+        for row, p in zip(out, patches):
+            if level.samples_per_pixel == 3:
+                _read_patch(ds, level, p, self._cache, out=row)
             else:
-                img = Image.fromarray(np.array(arr), mode="RGB")
-            imgs.append(img)
-        return imgs
+                row[...] = self._patch_pixels(ds, level, p)
+        return out
 
-    def _embed_images(self, images: List[Image.Image]) -> List[List[float]]:
+    def _slide_batch(self, slide: str, patches: List[Patch]) -> Union[np.ndarray, List[np.ndarray]]:
+        """Returns level 0 patches of a local slide, as one array when sizes match."""
+        min_size = self.input_size if self.pyramid_sourcing else None
+        pixels = [
+            self._slides.read_region(slide, p.x_origin, p.y_origin, p.width, p.height, min_size)
+            for p in patches
+        ]
+        if pixels and all(arr.shape == pixels[0].shape for arr in pixels):
+            return np.stack(pixels)
+        return pixels
+
+    def _patch_image(self, ds, level, p: Patch) -> Image.Image:
+        return Image.fromarray(self._patch_pixels(ds, level, p), mode="RGB")
+
+    def _fetch_patch_images(
+        self,
+        series_path: str,
+        patches: List[Patch],
+        bearer_token: Optional[str],
+        instance_uid: Optional[str] = None,
+    ) -> List[Image.Image]:
+        ds, level = self._open_level(series_path, bearer_token, instance_uid)
+        return [self._patch_image(ds, level, p) for p in patches]
+
+    def _embed_images(self, images: List[Image.Image], out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Embeds images in micro-batches of self.batch_size into a (N, dim) matrix.
+
+        Rows are L2 normalized (SigLIP image_embeds). Results are written into
+        out when given, otherwise into a newly allocated float32 matrix.
+        """
+        import torch
+        self._lazy_load()
+        if out is None:
+            out = np.empty((len(images), self.embedding_dim), dtype=np.float32)
+        with torch.inference_mode():
+            for start in range(0, len(images), self.batch_size):
+                batch = images[start:start + self.batch_size]
+                inputs = self._processor(images=batch, return_tensors="pt")
+                embeds = self._model.get_image_features(pixel_values=inputs["pixel_values"])
+                embeds = embeds / embeds.norm(p=2, dim=-1, keepdim=True)
+                out[start:start + len(batch)] = embeds.float().numpy()
+        return out
+
+    def embed_texts(self, prompts: List[str]) -> np.ndarray:
+        """Returns L2 normalized (len(prompts), dim) text embeddings."""
+        import torch
+        self._lazy_load()
+        with torch.inference_mode():
+            # SigLIP text towers are trained with max_length padding
+            inputs = self._processor(text=prompts, padding="max_length", truncation=True, return_tensors="pt")
+            embeds = self._model.get_text_features(input_ids=inputs["input_ids"])
+            embeds = embeds / embeds.norm(p=2, dim=-1, keepdim=True)
+        return embeds.float().numpy()
+
+    def logit_params(self) -> Tuple[float, float]:
+        """Returns SigLIP's (logit scale, logit bias) for image-text scoring."""
         self._lazy_load()
-        # Processor handles resizing/normalization; batching for efficiency
-        inputs = self._processor(images=images, return_tensors="pt")
-        with np.errstate(all="ignore"):
-            with self._model.no_grad():  # type: ignore[attr-defined]
-                outputs = self._model(**inputs)
-        embeds = outputs.image_embeds.detach().cpu().numpy()
-        return [emb.tolist() for emb in embeds]
+        scale = float(self._model.logit_scale.exp())
+        bias = getattr(self._model, "logit_bias", None)
+        return scale, float(bias) if bias is not None else 0.0
+
+    def embed_pixels(self, pixels: Union[np.ndarray, List[np.ndarray]], out: np.ndarray) -> None:
+        """Embeds (height, width, 3) uint8 RGB patches into out (len(pixels), dim).
+
+        pixels is a (N, height, width, 3) array or a list of patches. They are
+        resized and normalized per micro-batch with batch_preprocess, or with
+        the HF processor per PIL image if that path is unavailable.
+        """
+        import torch
+        self._lazy_load()
+        if self._preprocess is None:
+            self._embed_images([Image.fromarray(np.asarray(arr), mode="RGB") for arr in pixels], out)
+            return
+        import batch_preprocess
+        with torch.inference_mode():
+            for start in range(0, len(pixels), self.batch_size):
+                batch = pixels[start:start + self.batch_size]
+                values = batch_preprocess.pixel_values(batch, self._preprocess)
+                embeds = self._model.get_image_features(pixel_values=values)
+                embeds = embeds / embeds.norm(p=2, dim=-1, keepdim=True)
+                out[start:start + len(batch)] = embeds.float().numpy()
+
+    def embed_patches(
+        self,
+        series_path: str,
+        patches: List[Patch],
+        bearer_token: Optional[str],
+        instance_uid: Optional[str] = None,
+        slide: Optional[str] = None,
+    ) -> np.ndarray:
+        """Returns (len(patches), dim) embeddings; one micro-batch of images is held at a time.
+
+        Patch coordinates refer to the instance_uid level (base level if None),
+        or to level 0 of slide, a local WSI file under SLIDE_DIR, when given.
+        With pyramid_sourcing, each patch is read from the coarsest level on
+        which a patch of its size still covers the model input size, with
+        coordinates rescaled.
+
+        With an embedding cache, patches seen at the same coordinate are served
+        without fetching pixels, and patches whose pixels match a cached
+        embedding (any series or coordinate) skip the model.
+        """
+        self._lazy_load()
+        out = np.empty((len(patches), self.embedding_dim), dtype=np.float32)
+        cache = self._embeddings
+        pending = list(range(len(patches)))
+        if cache is not None:
+            source = f'slide:{slide}' if slide is not None else series_path
+            scope = embedding_cache.coordinate_scope(
+                self.model_id, source, instance_uid, bearer_token, self.pyramid_sourcing)
+            coordinate_keys = [scope + (p.x_origin, p.y_origin, p.width, p.height) for p in patches]
+            pending = []
+            for i, key in enumerate(coordinate_keys):
+                digest = cache.lookup_coordinate(key)
+                if digest is None or not cache.get(digest, out[i]):
+                    pending.append(i)
+            cache.record(coordinate_hits=len(patches) - len(pending))
+        if not pending:
+            return out
+        # (level, output rows, patches to read by output row); one group for slides
+        groups = [(None, pending, patches)]
+        if slide is None:
+            ds, level = self._open_level(series_path, bearer_token, instance_uid)
+            groups = [(level, pending, patches)]
+            if self.pyramid_sourcing:
+                # Per patch size, so a patch's level never depends on the other patches
+                by_size = {}
+                for i in pending:
+                    by_size.setdefault((patches[i].width, patches[i].height), []).append(i)
+                groups = []
+                for (width, height), group in by_size.items():
+                    source_level, sx, sy = _source_level(ds, level, width, height, self.input_size)
+                    sources = patches
+                    if (sx, sy) != (1.0, 1.0):
+                        sources = {i: _scale_patch(patches[i], sx, sy) for i in group}
+                    groups.append((source_level, group, sources))
+        for source_level, group, sources in groups:
+            for start in range(0, len(group), self.batch_size):
+                indices = group[start:start + self.batch_size]
+                if slide is not None:
+                    pixels = self._slide_batch(slide, [patches[i] for i in indices])
+                else:
+                    pixels = self._patch_batch(ds, source_level, [sources[i] for i in indices])
+                if cache is None:
+                    embeds = np.empty((len(indices), out.shape[1]), dtype=np.float32)
+                    self.embed_pixels(pixels, embeds)
+                    out[indices] = embeds
+                    continue
+                # Embed each distinct uncached content once
+                digests = [embedding_cache.content_digest(self.model_id, px) for px in pixels]
+                missing = {}  # digest -> (pixels, output rows)
+                for i, px, digest in zip(indices, pixels, digests):
+                    if digest in missing:
+                        missing[digest][1].append(i)
+                    elif not cache.get(digest, out[i]):
+                        missing[digest] = (px, [i])
+                if missing:
+                    embeds = np.empty((len(missing), out.shape[1]), dtype=np.float32)
+                    # All distinct and uncached: embed the assembled batch without restacking
+                    self.embed_pixels(pixels if len(missing) == len(indices) else [px for px, _ in missing.values()], embeds)
+                    for row, (digest, (_, rows)) in zip(embeds, missing.items()):
+                        cache.put(digest, row)
+                        out[rows] = row
+                for i, digest in zip(indices, digests):
+                    cache.put_coordinate(coordinate_keys[i], digest)
+                cache.record(content_hits=len(indices) - len(missing), misses=len(missing))
+        return out
+
+    def _instance_patches(self, inst: Dict[str, Any]):
+        """Returns (series_path, instance_uid, slide, patch_objs, patches) of a request instance.
+
+        An instance names either a DICOMweb series (dicom_path.series_path) or
+        a local slide file under SLIDE_DIR ("slide"); the other one is None.
+        """
+        slide = inst.get("slide")
+        dicom_path_obj = inst.get("dicom_path") or inst
+        series_path = dicom_path_obj.get("series_path")
+        if not series_path and not slide:
+            raise ValueError("Missing series_path (or slide) in instance")
+
+        instance_uids = inst.get("instance_uids", [])
+        instance_uid = instance_uids[0] if instance_uids else None
+        patch_objs = inst.get("patch_coordinates") or []
+        if not patch_objs:
+            raise ValueError("Missing patch_coordinates in instance")
+        return series_path, instance_uid, slide, patch_objs, [_to_patch(p) for p in patch_objs]
 
     def predict(self, body: Dict[str, Any], bearer_token: Optional[str]) -> Dict[str, Any]:
         # Expect: { "instances": [ { "dicom_path": {"series_path": str}, "patch_coordinates": [..], "instance_uids": [optional] } ] }
+        # or, for a local slide file, { "slide": "name.svs", "patch_coordinates": [..] } (level 0 coordinates)
         instances = body.get("instances", [])
         results = []
         for inst in instances:
-            dicom_path_obj = inst.get("dicom_path") or inst
-            series_path = dicom_path_obj.get("series_path")
-            if not series_path:
-                raise ValueError("Missing series_path in instance")
-
-            instance_uids = inst.get("instance_uids", [])
-            instance_uid = instance_uids[0] if instance_uids else None
-            patch_objs = inst.get("patch_coordinates") or []
-            if not patch_objs:
-                raise ValueError("Missing patch_coordinates in instance")
-            patches = [_to_patch(p) for p in patch_objs]
-
-            # Fetch images and embed
-            imgs = self._fetch_patch_images(series_path, patches, bearer_token, instance_uid)
-            vectors = self._embed_images(imgs)
+            series_path, instance_uid, slide, patch_objs, patches = self._instance_patches(inst)
+
+            # Fetch and embed one micro-batch of patches at a time
+            vectors = self.embed_patches(series_path, patches, bearer_token, instance_uid, slide)
 
             patch_embeddings = [
                 {
                     "patch_coordinate": patch_objs[i],
-                    "embedding_vector": vectors[i],
+                    "embedding_vector": vectors[i].tolist(),
                 }
                 for i in range(len(patch_objs))
             ]
             results.append({"result": {"patch_embeddings": patch_embeddings}})
 
         return {"predictions": results}
+
+    def zero_shot(self, body: Dict[str, Any], bearer_token: Optional[str]) -> Dict[str, Any]:
+        """Scores instance patches against text prompts.
+
+        Expects predict's instances plus "prompts": [str, ...] and optionally
+        "include_scores": bool. Each result holds, in patch_coordinates order,
+        label_index (into labels) and score of the best prompt, and if
+        requested the (patches, prompts) scores grid.
+        """
+        prompts = body.get("prompts")
+        if not isinstance(prompts, list) or not prompts or not all(isinstance(p, str) and p for p in prompts):
+            raise ValueError("prompts must be a non-empty list of non-empty strings")
+        include_scores = bool(body.get("include_scores", False))
+        text = self._prompts.get(prompts)
+        scale, bias = self.logit_params()
+        results = []
+        for inst in body.get("instances", []):
+            series_path, instance_uid, slide, patch_objs, patches = self._instance_patches(inst)
+            vectors = self.embed_patches(series_path, patches, bearer_token, instance_uid, slide)
+            scored = zero_shot.score(vectors, text, scale, bias, include_scores)
+            result = {
+                "labels": prompts,
+                "patch_coordinates": patch_objs,
+                "label_index": scored["label_index"].tolist(),
+                "score": scored["score"].tolist(),
+            }
+            if include_scores:
+                result["scores"] = scored["scores"].tolist()
+            results.append({"result": result})
+        return {"predictions": results}
+
+    def embedding_cache_stats(self) -> Optional[Dict[str, Any]]:
+        """Returns embedding cache hit ratios (exact coordinate vs content) and size."""
+        if self._embeddings is None:
+            return None
+        stats = self._embeddings.stats()
+        return {
+            "lookups": stats.lookups,
+            "hit_ratio": stats.hit_ratio,
+            "coordinate_hit_ratio": stats.coordinate_hit_ratio,
+            "content_hit_ratio": stats.content_hit_ratio,
+            "coordinate_hits": stats.coordinate_hits,
+            "content_hits": stats.content_hits,
+            "misses": stats.misses,
+            "entries": stats.entries,
+            "capacity": stats.capacity,
+            "resident_bytes": stats.resident_bytes,
+            "max_bytes": stats.max_bytes,
+        }
+
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        """Returns decoded frame cache hit ratio and resident bytes."""
+        if self._cache is None:
+            return None
+        stats = self._cache.stats()
+        return {
+            "hit_ratio": stats.hit_ratio,
+            "hits": stats.hits,
+            "misses": stats.misses,
+            "frames": stats.frame_count,
+            "resident_bytes": stats.resident_bytes,
+            "max_bytes": stats.max_bytes,
+        }
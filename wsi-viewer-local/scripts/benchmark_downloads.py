@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Check resume and measure throughput of download_sample_wsi.py against a local server.
+
+Serves large random fixtures from a local HTTP server that honours Range
+requests, limits each connection to --mbps and, on the first request of
+every file, drops the connection after --drop-at of the file. Downloads all
+fixtures (with their SHA-256 in a manifest) once per --workers value into
+fresh folders and reports MB/s, bytes served and resumed requests. Exits
+non-zero if a file is corrupt or a resume re-sent more than the one chunk
+being read when the connection dropped.
+
+Usage:
+  python scripts/benchmark_downloads.py --files 8 --file-mb 64 --mbps 100 --workers 1,4
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import download_sample_wsi  # noqa: E402
+
+_BLOCK = 64 * 1024
+
+
+class _FixtureServer:
+    """Range-capable static server that drops each file's first transfer part way."""
+
+    def __init__(self, folder: str, bytes_per_second: float, drop_at: float) -> None:
+        self.served = 0
+        self.resumed = 0
+        self._dropped = set()
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                path = os.path.join(folder, os.path.basename(self.path))
+                if not os.path.isfile(path):
+                    self.send_error(404)
+                    return
+                size = os.path.getsize(path)
+                start = 0
+                match = re.match(r'bytes=(\d+)-$', self.headers.get('Range', ''))
+                if match:
+                    start = int(match.group(1))
+                    if start >= size:
+                        self.send_response(416)
+                        self.send_header('Content-Range', f'bytes */{size}')
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header('Content-Range', f'bytes {start}-{size - 1}/{size}')
+                    with server._lock:
+                        server.resumed += 1
+                else:
+                    self.send_response(200)
+                self.send_header('Accept-Ranges', 'bytes')
+                self.send_header('Content-Length', str(size - start))
+                self.end_headers()
+                with server._lock:
+                    drop = None
+                    if drop_at and path not in server._dropped:
+                        server._dropped.add(path)
+                        drop = int(size * drop_at)
+                sent = start
+                with open(path, 'rb') as f:
+                    f.seek(start)
+                    began = time.perf_counter()
+                    while sent < size:
+                        block = f.read(_BLOCK)
+                        if drop is not None and sent + len(block) > drop:
+                            block = block[:max(0, drop - sent)]
+                        self.wfile.write(block)
+                        sent += len(block)
+                        with server._lock:
+                            server.served += len(block)
+                        if drop is not None and sent >= drop:
+                            self.close_connection = True
+                            return
+                        # Throttle to bytes_per_second for this connection
+                        ahead = (sent - start) / bytes_per_second - (time.perf_counter() - began)
+                        if ahead > 0:
+                            time.sleep(ahead)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.httpd.server_port}'
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=8)
+    parser.add_argument('--file-mb', type=float, default=64.0)
+    parser.add_argument('--mbps', type=float, default=100.0, help='Per connection limit, MB/s.')
+    parser.add_argument('--drop-at', type=float, default=0.5, help='Fraction sent before the first drop (0: none).')
+    parser.add_argument('--workers', default='1,4')
+    args = parser.parse_args()
+
+    failed = False
+    results = []
+    with tempfile.TemporaryDirectory() as root:
+        fixtures = os.path.join(root, 'fixtures')
+        os.makedirs(fixtures)
+        entries = []
+        for i in range(args.files):
+            data = os.urandom(int(args.file_mb * 1e6))
+            name = f'slide_{i:03d}.dcm'
+            with open(os.path.join(fixtures, name), 'wb') as f:
+                f.write(data)
+            entries.append((name, hashlib.sha256(data).hexdigest()))
+        total = args.files * int(args.file_mb * 1e6)
+
+        for workers in (int(w) for w in args.workers.split(',')):
+            server = _FixtureServer(fixtures, args.mbps * 1e6, args.drop_at)
+            dest = os.path.join(root, f'dest-{workers}')
+            start = time.perf_counter()
+            downloaded, failures = download_sample_wsi.download_all(
+                [(f'{server.url}/{name}', sha256) for name, sha256 in entries], dest, workers)
+            elapsed = time.perf_counter() - start
+            server.httpd.shutdown()
+            result = {
+                'workers': workers,
+                'files': len(downloaded),
+                'failures': len(failures),
+                'seconds': round(elapsed, 2),
+                'mb_per_second': round(total / 1e6 / elapsed, 1),
+                'bytes_served': server.served,
+                'overhead_bytes': server.served - total,
+                'resumed_requests': server.resumed,
+            }
+            # A resume re-sends at most the chunk being read when the connection broke,
+            # never data already written to the .part file
+            max_overhead = server.resumed * download_sample_wsi.CHUNK_BYTES
+            ok = not failures and len(downloaded) == args.files and total <= server.served <= total + max_overhead
+            result['ok'] = ok
+            failed = failed or not ok
+            results.append(result)
+            print(json.dumps(result), file=sys.stderr)
+
+    print(json.dumps({'files': args.files, 'file_mb': args.file_mb, 'mbps_per_connection': args.mbps,
+                      'drop_at': args.drop_at, 'results': results}, indent=2))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
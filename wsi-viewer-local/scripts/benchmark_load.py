@@ -0,0 +1,506 @@
+#!/usr/bin/env python3
+"""
+Load test the viewer server (/dicom proxy and /predict) against local stand-ins.
+
+Starts a DICOMweb stand-in (series metadata, and frames of --frame-kb after
+--upstream-delay-ms) and runs the viewer app in a child process, under
+gunicorn as server_gunicorn.py does (--server gunicorn, the default) or the
+threaded development server (--server flask). Its predictor is a stand-in
+answering /predict after --predict-delay-ms per patch it has not embedded
+before, with --embedding-dim floats per patch, so the measurement covers
+the web workers and proxy rather than the model. Then, for --duration
+seconds, replays viewer traffic:
+
+  viewers          Each opens a random slide (GET metadata), then pans and
+                   zooms: every step fetches the frames of a --viewport
+                   (columns x rows) with 6 parallel connections, like a
+                   browser, waiting --think-ms between steps. Each viewer
+                   keeps a browser cache (--browser-cache-mb) honouring the
+                   responses' Cache-Control, so revisited frames that the
+                   server marked cacheable are not requested again.
+  predict-clients  Each POSTs /predict for --patches patches of 448 px
+                   drawn from a --predict-area x --predict-area patch grid
+                   of a random slide, so some patches repeat.
+
+Reports, per request kind, requests/sec, p50/p95/p99 latency and errors;
+the browser cache hit ratio, upstream requests per proxied request, the
+predictor cache hit ratio (summed over the workers reached by repeated
+/cache-stats requests, since each worker has its own cache) and
+CPU seconds and utilisation of the server processes (Linux). Results are
+JSON tagged with the git commit and settings; --output writes them to a
+file and --compare adds the change of the main metrics from an earlier
+result.
+
+Usage:
+  python scripts/benchmark_load.py --workers 4 --viewers 32 --predict-clients 4 --duration 30 \\
+      --output load-$(git rev-parse --short HEAD).json
+  python scripts/benchmark_load.py ... --compare load-<earlier commit>.json
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import datetime
+import functools
+import json
+import logging
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Frames (tiles) per pyramid level side: level 0 is _GRID x _GRID frames, each level halves it
+_GRID = 128
+_PATCH = 448
+# Parallel connections per browser to one host
+_BROWSER_CONNECTIONS = 6
+# Metrics compared by --compare: (section, key)
+_COMPARED = [
+    ('dicom', 'requests_per_second'), ('dicom', 'p50_ms'), ('dicom', 'p95_ms'), ('dicom', 'p99_ms'),
+    ('predict', 'requests_per_second'), ('predict', 'p50_ms'), ('predict', 'p95_ms'), ('predict', 'p99_ms'),
+    ('browser_cache', 'hit_ratio'), ('predictor_cache', 'hit_ratio'), ('server_cpu', 'percent'),
+]
+
+
+class StandInPredictor:
+    """Answers predict() like MedSigLIPPredictor, after a fixed delay per patch not embedded before."""
+
+    def __init__(self, patch_delay: float, embedding_dim: int) -> None:
+        self._patch_delay = patch_delay
+        self._vector = [0.0] * embedding_dim
+        self._seen = set()
+        self._lock = threading.Lock()
+        self._lookups = 0
+        self._hits = 0
+
+    def warm_up(self) -> None:
+        pass
+
+    def predict(self, body: Dict[str, Any], bearer_token: Optional[str]) -> Dict[str, Any]:
+        results = []
+        for inst in body.get('instances', []):
+            path = (inst.get('dicom_path') or inst).get('series_path', '')
+            uids = tuple(inst.get('instance_uids') or ())
+            misses = 0
+            embeddings = []
+            for p in inst.get('patch_coordinates', []):
+                key = (path, uids, p.get('x_origin'), p.get('y_origin'), p.get('width'), p.get('height'))
+                with self._lock:
+                    self._lookups += 1
+                    if key in self._seen:
+                        self._hits += 1
+                    else:
+                        self._seen.add(key)
+                        misses += 1
+                embeddings.append({'patch_coordinate': p, 'embedding_vector': self._vector})
+            time.sleep(misses * self._patch_delay)
+            results.append({'result': {'patch_embeddings': embeddings}})
+        return {'predictions': results}
+
+    def cache_stats(self) -> Dict[str, Any]:
+        return {'pid': os.getpid()}
+
+    def embedding_cache_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'pid': os.getpid(), 'lookups': self._lookups, 'hits': self._hits}
+
+
+class _DicomWebStandIn:
+    """Serves series metadata and fixed-size frames after a delay, counting requests."""
+
+    def __init__(self, frame_bytes: int, delay: float) -> None:
+        self.payload = os.urandom(frame_bytes)
+        self.requests = collections.Counter()
+        self._lock = threading.Lock()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                frame = '/frames/' in self.path
+                with stand_in._lock:
+                    stand_in.requests['frames' if frame else 'other'] += 1
+                time.sleep(delay)
+                if frame:
+                    body, content_type = stand_in.payload, 'application/octet-stream'
+                else:
+                    body, content_type = b'[{"00080018": {"vr": "UI"}}]', 'application/dicom+json'
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server.server_port}/dicom-web'
+
+
+def _serve(args) -> None:
+    """Runs the viewer app with the stand-in predictor (child process)."""
+    os.chdir(ROOT)
+    factory = functools.partial(StandInPredictor, args.predict_delay_ms / 1000, args.embedding_dim)
+    if args.server == 'gunicorn':
+        import server_gunicorn
+        server_gunicorn.ViewerApplication(factory, {
+            'bind': f'127.0.0.1:{args.port}',
+            'workers': args.workers,
+            'worker_class': 'gthread',
+            'threads': args.threads,
+            'timeout': 600,
+            'loglevel': 'warning',
+        }).run()
+        return
+    from werkzeug.serving import make_server
+    import server
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    make_server('127.0.0.1', args.port, server.create_app(warm_load=True, predictor_factory=factory),
+                threaded=True).serve_forever()
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _cpu_seconds(root_pid: int) -> Dict[int, float]:
+    """User + system CPU seconds of root_pid and its descendants, from /proc (empty elsewhere)."""
+    if not os.path.isdir('/proc'):
+        return {}
+    stats = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # Fields after the parenthesised command name
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        stats[int(entry)] = (int(fields[1]), (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK'))
+    tree, pending = {}, [root_pid]
+    while pending:
+        pid = pending.pop()
+        if pid in stats:
+            tree[pid] = stats[pid][1]
+        pending.extend(child for child, (ppid, _) in stats.items() if ppid == pid)
+    return tree
+
+
+class _Recorder:
+    """Latencies and errors per request kind, plus browser cache counters."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.latencies = collections.defaultdict(list)
+        self.errors = collections.Counter()
+        self.frame_views = 0
+        self.browser_hits = 0
+
+    def record(self, kind: str, seconds: Optional[float]) -> None:
+        with self._lock:
+            if seconds is None:
+                self.errors[kind] += 1
+            else:
+                self.latencies[kind].append(seconds)
+
+    def view(self, browser_hit: bool) -> None:
+        with self._lock:
+            self.frame_views += 1
+            self.browser_hits += browser_hit
+
+    def summary(self, kind: str, duration: float) -> Dict[str, Any]:
+        ms = np.asarray(self.latencies[kind]) * 1000
+        summary = {'requests': len(ms), 'errors': self.errors[kind],
+                   'requests_per_second': round(len(ms) / duration, 2)}
+        for q in (50, 95, 99):
+            summary[f'p{q}_ms'] = round(float(np.percentile(ms, q)), 2) if len(ms) else None
+        return summary
+
+
+class _BrowserCache:
+    """Per viewer HTTP cache honouring max-age (FIFO within a byte budget)."""
+
+    def __init__(self, max_bytes: int) -> None:
+        self._max_bytes = max_bytes
+        self._bytes = 0
+        self._entries = collections.OrderedDict()  # url -> (expires, size)
+        self._lock = threading.Lock()
+
+    def fresh(self, url: str) -> bool:
+        with self._lock:
+            entry = self._entries.get(url)
+            return entry is not None and entry[0] > time.monotonic()
+
+    def store(self, url: str, response: requests.Response) -> None:
+        match = re.search(r'max-age=(\d+)', response.headers.get('Cache-Control', ''))
+        if not match or 'no-store' in response.headers.get('Cache-Control', ''):
+            return
+        size = len(response.content)
+        with self._lock:
+            if url in self._entries:
+                self._bytes -= self._entries.pop(url)[1]
+            self._entries[url] = (time.monotonic() + int(match.group(1)), size)
+            self._bytes += size
+            while self._bytes > self._max_bytes and self._entries:
+                self._bytes -= self._entries.popitem(last=False)[1][1]
+
+
+def _timed(recorder: _Recorder, kind: str, call) -> Optional[requests.Response]:
+    start = time.perf_counter()
+    try:
+        r = call()
+        ok = r.status_code in (200, 304)
+    except requests.RequestException:
+        r, ok = None, False
+    recorder.record(kind, time.perf_counter() - start if ok else None)
+    return r if ok else None
+
+
+def _session(connections: int) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=connections)
+    session.mount('http://', adapter)
+    return session
+
+
+def _series_path(slide: int) -> str:
+    return f'/dicom/studies/1.2.826.{slide}/series/1.2.826.{slide}.1'
+
+
+def _viewer(url: str, args, stop: threading.Event, recorder: _Recorder, rng: random.Random) -> None:
+    session = _session(_BROWSER_CONNECTIONS)
+    cache = _BrowserCache(int(args.browser_cache_mb * 1024 * 1024))
+    cols, rows = args.viewport
+    with concurrent.futures.ThreadPoolExecutor(max_workers=_BROWSER_CONNECTIONS) as connections:
+
+        def fetch(frame_url: str) -> None:
+            hit = cache.fresh(frame_url)
+            recorder.view(hit)
+            if hit:
+                return
+            r = _timed(recorder, 'dicom', lambda: session.get(frame_url, timeout=60))
+            if r is not None:
+                cache.store(frame_url, r)
+
+        while not stop.is_set():
+            slide = rng.randrange(args.slides)
+            series = _series_path(slide)
+            _timed(recorder, 'metadata', lambda: session.get(f'{url}{series}/metadata', timeout=60))
+            level = rng.randrange(args.levels)
+            x, y = rng.randrange(_GRID >> level), rng.randrange(_GRID >> level)
+            for _ in range(args.steps_per_slide):
+                if stop.is_set():
+                    break
+                side = _GRID >> level
+                frames = [(y + r) % side * side + (x + c) % side + 1 for r in range(rows) for c in range(cols)]
+                list(connections.map(fetch, [f'{url}{series}/instances/1.2.826.{slide}.1.{level + 1}/frames/{n}'
+                                             for n in frames]))
+                if rng.random() < 0.3 and args.levels > 1:
+                    # Zoom in or out around the same point
+                    new_level = min(args.levels - 1, max(0, level + rng.choice((-1, 1))))
+                    x, y = (x << level) >> new_level, (y << level) >> new_level
+                    level = new_level
+                else:
+                    x, y = x + rng.choice((-1, 0, 1)), y + rng.choice((-1, 0, 1))
+                stop.wait(args.think_ms / 1000)
+    session.close()
+
+
+def _predict_client(url: str, args, stop: threading.Event, recorder: _Recorder, rng: random.Random) -> None:
+    session = _session(1)
+    while not stop.is_set():
+        slide = rng.randrange(args.slides)
+        cells = rng.sample(range(args.predict_area ** 2), min(args.patches, args.predict_area ** 2))
+        body = {'instances': [{
+            'dicom_path': {'series_path': _series_path(slide)},
+            'instance_uids': [f'1.2.826.{slide}.1.1'],
+            'patch_coordinates': [{'x_origin': c % args.predict_area * _PATCH, 'y_origin': c // args.predict_area * _PATCH,
+                                   'width': _PATCH, 'height': _PATCH} for c in cells],
+        }]}
+        _timed(recorder, 'predict', lambda: session.post(f'{url}/predict', json=body, timeout=600))
+    session.close()
+
+
+def _predictor_cache(url: str, samples: int) -> Dict[str, Any]:
+    """Sums the stand-in predictor's counters over the workers answering /cache-stats."""
+    per_worker = {}
+    for _ in range(samples):
+        try:
+            # A new connection per sample, so requests spread over the workers
+            stats = requests.get(f'{url}/cache-stats', headers={'Connection': 'close'}, timeout=10).json()
+        except (requests.RequestException, ValueError):
+            continue
+        embeddings = stats.get('embeddings') or {}
+        if 'pid' in embeddings:
+            per_worker[embeddings['pid']] = embeddings
+    lookups = sum(s['lookups'] for s in per_worker.values())
+    hits = sum(s['hits'] for s in per_worker.values())
+    return {'workers_sampled': len(per_worker), 'lookups': lookups, 'hits': hits,
+            'hit_ratio': round(hits / lookups, 4) if lookups else None}
+
+
+def _wait_ready(url: str, process: subprocess.Popen, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f'Server exited with status {process.returncode}')
+        try:
+            if requests.get(f'{url}/readyz', timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f'{url} not ready after {timeout}s')
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+        dirty = subprocess.run(['git', 'diff', '--quiet', 'HEAD', '--', '.'], cwd=ROOT).returncode != 0
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f'{commit}-dirty' if dirty else commit
+
+
+def _compare(before: Dict[str, Any], after: Dict[str, Any]) -> Dict[str, Any]:
+    changes = {}
+    for section, key in _COMPARED:
+        old, new = (before.get(section) or {}).get(key), (after.get(section) or {}).get(key)
+        if old is None or new is None:
+            continue
+        changes[f'{section}.{key}'] = {
+            'before': old, 'after': new,
+            'change_percent': round((new - old) / old * 100, 1) if old else None,
+        }
+    return {'commit': before.get('commit'), 'metrics': changes}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--server', choices=('gunicorn', 'flask'), default='gunicorn')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn worker processes.')
+    parser.add_argument('--threads', type=int, default=8, help='Threads per gunicorn worker.')
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--viewers', type=int, default=16)
+    parser.add_argument('--predict-clients', type=int, default=2)
+    parser.add_argument('--slides', type=int, default=20)
+    parser.add_argument('--levels', type=int, default=5, help='Pyramid levels per slide.')
+    parser.add_argument('--viewport', type=int, nargs=2, default=(6, 4), metavar=('COLUMNS', 'ROWS'),
+                        help='Frames per viewport.')
+    parser.add_argument('--steps-per-slide', type=int, default=20, help='Pans/zooms before opening another slide.')
+    parser.add_argument('--think-ms', type=float, default=100.0, help='Pause between viewer steps.')
+    parser.add_argument('--browser-cache-mb', type=float, default=64.0)
+    parser.add_argument('--frame-kb', type=float, default=32.0)
+    parser.add_argument('--upstream-delay-ms', type=float, default=10.0)
+    parser.add_argument('--patches', type=int, default=16, help='Patches per /predict request.')
+    parser.add_argument('--predict-area', type=int, default=16, help='Side of the patch grid predictions draw from.')
+    parser.add_argument('--predict-delay-ms', type=float, default=5.0, help='Stand-in model time per new patch.')
+    parser.add_argument('--embedding-dim', type=int, default=1152)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the JSON result here.')
+    parser.add_argument('--compare', help='Earlier JSON result to compare with.')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        _serve(args)
+        return
+
+    upstream = _DicomWebStandIn(int(args.frame_kb * 1024), args.upstream_delay_ms / 1000)
+    port = _free_port()
+    url = f'http://127.0.0.1:{port}'
+    child = [arg for arg in sys.argv[1:] if arg not in ('--serve',)]
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), *child, '--serve', '--port', str(port)],
+                               env={**os.environ, 'DICOM_SERVER_URL': upstream.url, 'MEDSIGLIP_WARM_LOAD': '1'})
+    try:
+        _wait_ready(url, process)
+        recorder = _Recorder()
+        stop = threading.Event()
+        rng = random.Random(args.seed)
+        threads = [threading.Thread(target=_viewer, args=(url, args, stop, recorder, random.Random(rng.random())))
+                   for _ in range(args.viewers)]
+        threads += [threading.Thread(target=_predict_client, args=(url, args, stop, recorder, random.Random(rng.random())))
+                    for _ in range(args.predict_clients)]
+        cpu_before, client_before = _cpu_seconds(process.pid), os.times()
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        time.sleep(args.duration)
+        stop.set()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        cpu_after, client_after = _cpu_seconds(process.pid), os.times()
+        predictor_cache = _predictor_cache(url, samples=8 * args.workers)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        upstream.server.shutdown()
+
+    server_cpu = sum(cpu_after.get(pid, 0.0) - cpu_before.get(pid, 0.0) for pid in cpu_after)
+    proxied = len(recorder.latencies['dicom']) + len(recorder.latencies['metadata'])
+    upstream_requests = upstream.requests['frames'] + upstream.requests['other']
+    result = {
+        'commit': _git_commit(),
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'settings': {k: v for k, v in vars(args).items() if k not in ('output', 'compare', 'serve', 'port')},
+        'duration_seconds': round(elapsed, 2),
+        'dicom': recorder.summary('dicom', elapsed),
+        'metadata': recorder.summary('metadata', elapsed),
+        'predict': recorder.summary('predict', elapsed),
+        'browser_cache': {
+            'frame_views': recorder.frame_views,
+            'hits': recorder.browser_hits,
+            'hit_ratio': round(recorder.browser_hits / recorder.frame_views, 4) if recorder.frame_views else None,
+        },
+        'proxy': {
+            'upstream_requests': upstream_requests,
+            'upstream_per_request': round(upstream_requests / proxied, 4) if proxied else None,
+        },
+        'predictor_cache': predictor_cache,
+        'server_cpu': {
+            'processes': len(cpu_after),
+            'seconds': round(server_cpu, 2),
+            # 100 = one core busy for the whole run
+            'percent': round(server_cpu / elapsed * 100, 1) if cpu_after else None,
+        },
+        'client_cpu_percent': round((client_after.user + client_after.system - client_before.user
+                                     - client_before.system) / elapsed * 100, 1),
+    }
+    if args.compare:
+        with open(args.compare) as f:
+            result['comparison'] = _compare(json.load(f), result)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark MedSigLIP embedding throughput and peak memory per micro-batch size.
+
+Embeds synthetic RGB patches (no DICOM store needed) with MedSigLIPPredictor
+and reports patches/sec and peak RSS for each batch size. Every batch size
+runs in a fresh subprocess so peak RSS is not carried over between runs.
+
+Usage:
+  python scripts/benchmark_medsiglip_batching.py --patches 64 --batch-sizes 1,4,8,16,64
+  MEDSIGLIP_TORCH_THREADS=4 python scripts/benchmark_medsiglip_batching.py
+  MEDSIGLIP_BATCH_PREPROCESS=0 python scripts/benchmark_medsiglip_batching.py   # per-image PIL preprocessing
+
+Loads the model from MEDSIGLIP_MODEL_DIR when set (see download_medsiglip.py).
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _peak_rss_bytes() -> int:
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run_one(model_id: str, patches: int, patch_size: int, batch_size: int) -> dict:
+    sys.path.insert(0, ROOT)
+    from predict_medsiglip import MedSigLIPPredictor
+
+    predictor = MedSigLIPPredictor(model_id=model_id, cache=None, batch_size=batch_size)
+    predictor._lazy_load()
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 256, (patches, patch_size, patch_size, 3), dtype=np.uint8)
+    embeddings = np.empty((patches, predictor.embedding_dim), dtype=np.float32)
+    # Warm up kernels / allocator outside the timed run
+    predictor.embed_pixels(pixels[:batch_size], embeddings[:batch_size])
+    rss_before = _peak_rss_bytes()
+    start = time.perf_counter()
+    predictor.embed_pixels(pixels, embeddings)
+    elapsed = time.perf_counter() - start
+    return {
+        "batch_size": batch_size,
+        "patches": patches,
+        "seconds": elapsed,
+        "patches_per_sec": patches / elapsed,
+        "peak_rss_bytes": _peak_rss_bytes(),
+        "peak_rss_after_load_bytes": rss_before,
+        "embedding_shape": list(embeddings.shape),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model-id', default='google/medsiglip-448')
+    parser.add_argument('--patches', type=int, default=64)
+    parser.add_argument('--patch-size', type=int, default=448)
+    parser.add_argument('--batch-sizes', default='1,4,8,16,32,64')
+    parser.add_argument('--single', type=int, default=0, help='Run one batch size in-process (used internally).')
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(run_one(args.model_id, args.patches, args.patch_size, args.single)))
+        return
+
+    results = []
+    for batch_size in (int(b) for b in args.batch_sizes.split(',')):
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--model-id', args.model_id,
+             '--patches', str(args.patches), '--patch-size', str(args.patch_size),
+             '--single', str(batch_size)],
+            check=True, capture_output=True, text=True,
+        )
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        results.append(result)
+        print(f"batch_size={batch_size:4d}  {result['patches_per_sec']:8.2f} patches/s  "
+              f"peak RSS {result['peak_rss_bytes'] / 2**20:8.1f} MiB", file=sys.stderr)
+    print(json.dumps({
+        "torch_threads": os.environ.get('MEDSIGLIP_TORCH_THREADS', 'default'),
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Measure Orthanc import throughput against a local Orthanc stand-in.
+
+Writes synthetic DICOM instances (random pixel payloads, needs pydicom) and
+starts a stand-in serving POST /instances and POST /tools/find, with a fixed
+delay per request and per new connection (handshake / TLS cost). Then imports
+the files three ways and reports files/sec and MB/sec of each:
+
+  sequential   one requests.post per file on a fresh connection (the old scripts)
+  engine       orthanc/import_dicom.OrthancImporter with --workers connections
+  re-import    the engine again; every instance is stored, so all are skipped
+
+Usage:
+  python scripts/benchmark_orthanc_import.py --files 200 --file-mb 2 --workers 8
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'orthanc'))
+import import_dicom  # noqa: E402
+
+
+class _OrthancStandIn:
+    """Stores SOPInstanceUIDs of uploaded instances and answers UID lookups."""
+
+    def __init__(self, request_delay: float, connect_delay: float) -> None:
+        self.uids = set()
+        self.connections = 0
+        self._lock = threading.Lock()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                with stand_in._lock:
+                    stand_in.connections += 1
+                time.sleep(connect_delay)
+
+            def _reply(self, body: bytes) -> None:
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                data = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                time.sleep(request_delay)
+                if self.path == '/tools/find':
+                    wanted = json.loads(data)['Query']['SOPInstanceUID'].split('\\')
+                    with stand_in._lock:
+                        found = [{'MainDicomTags': {'SOPInstanceUID': uid}} for uid in wanted if uid in stand_in.uids]
+                    self._reply(json.dumps(found).encode())
+                    return
+                import pydicom
+                from pydicom.filebase import DicomBytesIO
+                uid = str(pydicom.dcmread(DicomBytesIO(data), stop_before_pixels=True).SOPInstanceUID)
+                with stand_in._lock:
+                    stand_in.uids.add(uid)
+                self._reply(json.dumps({'Status': 'Success'}).encode())
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server.server_port}'
+
+
+def _write_instances(folder: str, count: int, size: int) -> list:
+    import pydicom
+    from pydicom.dataset import Dataset, FileMetaDataset
+    from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+    rng = np.random.default_rng(0)
+    side = int(np.sqrt(size // 3))
+    paths = []
+    for i in range(count):
+        meta = FileMetaDataset()
+        meta.MediaStorageSOPClassUID = '1.2.840.10008.5.1.4.1.1.77.1.6'  # VL Whole Slide Microscopy
+        meta.MediaStorageSOPInstanceUID = generate_uid()
+        meta.TransferSyntaxUID = ExplicitVRLittleEndian
+        ds = Dataset()
+        ds.file_meta = meta
+        ds.SOPClassUID = meta.MediaStorageSOPClassUID
+        ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+        ds.Rows = ds.Columns = side
+        ds.SamplesPerPixel = 3
+        ds.BitsAllocated = 8
+        ds.PixelData = rng.integers(0, 256, side * side * 3, dtype=np.uint8).tobytes()
+        path = os.path.join(folder, f'{i:05d}.dcm')
+        pydicom.dcmwrite(path, ds, enforce_file_format=True)
+        paths.append(path)
+    return paths
+
+
+def _sequential(url: str, paths: list) -> dict:
+    start = time.perf_counter()
+    size = 0
+    for path in paths:
+        with open(path, 'rb') as f:
+            requests.post(f'{url}/instances', data=f, headers={'Expect': '', 'Connection': 'close'}).raise_for_status()
+        size += os.path.getsize(path)
+    seconds = time.perf_counter() - start
+    return {'uploaded': len(paths), 'seconds': round(seconds, 3),
+            'files_per_second': round(len(paths) / seconds, 2), 'mb_per_second': round(size / 1e6 / seconds, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=200)
+    parser.add_argument('--file-mb', type=float, default=2.0)
+    parser.add_argument('--workers', type=int, default=import_dicom.DEFAULT_WORKERS)
+    parser.add_argument('--request-delay-ms', type=float, default=10.0, help='Stand-in work per request.')
+    parser.add_argument('--connect-delay-ms', type=float, default=20.0, help='Stand-in cost per new connection.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        paths = _write_instances(folder, args.files, int(args.file_mb * 1e6))
+        results = {}
+        stand_in = _OrthancStandIn(args.request_delay_ms / 1000, args.connect_delay_ms / 1000)
+        results['sequential'] = {**_sequential(stand_in.url, paths), 'connections': stand_in.connections}
+        stand_in.server.shutdown()
+
+        stand_in = _OrthancStandIn(args.request_delay_ms / 1000, args.connect_delay_ms / 1000)
+        with import_dicom.OrthancImporter(stand_in.url, workers=args.workers, verbose=False) as importer:
+            for name in ('engine', 're-import'):
+                connections = stand_in.connections
+                stats = importer.import_paths([folder]).as_dict()
+                results[name] = {**stats, 'connections': stand_in.connections - connections}
+        stand_in.server.shutdown()
+
+    print(json.dumps({'files': args.files, 'file_mb': args.file_mb, 'workers': args.workers, **results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
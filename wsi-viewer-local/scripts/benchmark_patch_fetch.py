@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark and check the DICOMweb patch fetch path of /predict, offline.
+
+Serves a synthetic series (synthetic_wsi.py) from a local DICOMweb server
+with --latency-ms per request, then reads a grid of patches through
+MedSigLIPPredictor's fetch path (_open_level and _patch_batch: frame
+requests, decoding and the decoded-frame cache), without loading the model.
+An untimed first pass makes the server encode the frames; each timed repeat
+then starts with an empty frame cache. Reports seconds, patches/sec,
+DICOMweb requests and frames per repeat, and the pixel error against the
+pixels the generator defines; exits non-zero if the error is above
+--max-mean-error (0 for lossless compression) or a read fails.
+
+ez-wsi-dicomweb numbers frames as if every level were TILED_FULL, so
+TILED_SPARSE series currently fail the check (wrong frames are read).
+
+Usage:
+  python scripts/benchmark_patch_fetch.py --compression jpeg --latency-ms 10 --grid 4x4
+  python scripts/benchmark_patch_fetch.py --compression jpeg2000 --patch-size 448 --level 1
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'scripts'))
+import frame_cache  # noqa: E402
+import synthetic_wsi  # noqa: E402
+from predict_medsiglip import MedSigLIPPredictor, Patch  # noqa: E402
+from synthetic_dicomweb import add_slide_args, slide_spec  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_slide_args(parser)
+    parser.set_defaults(width=8192, height=6144)
+    parser.add_argument('--latency-ms', type=float, default=5.0, help='Delay added to every DICOMweb request.')
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--level', type=int, default=0, help='Pyramid level the patches are read from.')
+    parser.add_argument('--patch-size', type=int, default=448)
+    parser.add_argument('--grid', default='4x4', help='Patches as ROWSxCOLS around the level centre.')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--max-mean-error', type=float, default=None,
+                        help='Mean absolute pixel error allowed (default: 0 lossless, 8 jpeg).')
+    args = parser.parse_args()
+    max_error = args.max_mean_error
+    if max_error is None:
+        max_error = 8.0 if args.compression == 'jpeg' else 0.0
+
+    slide = synthetic_wsi.SyntheticSlide(slide_spec(args))
+    level = slide.levels[args.level]
+    rows, cols = (int(v) for v in args.grid.lower().split('x'))
+    x0 = max(0, (level.width - cols * args.patch_size) // 2)
+    y0 = max(0, (level.height - rows * args.patch_size) // 2)
+    patches = [Patch(x0 + c * args.patch_size, y0 + r * args.patch_size, args.patch_size, args.patch_size)
+               for r in range(rows) for c in range(cols)]
+    patches = [p for p in patches if p.x_origin + p.width <= level.width and p.y_origin + p.height <= level.height]
+    expected = np.stack([slide.expected_region(level, p.x_origin, p.y_origin, p.width, p.height) for p in patches])
+
+    predictor = MedSigLIPPredictor(cache=None, embeddings=None)
+    runs, error, ok = [], None, True
+    with synthetic_wsi.DicomWebServer([slide], args.latency_ms, args.jitter_ms) as server:
+        series_path = f'{server.url}/{slide.series_path}'
+        for repeat in range(args.repeats + 1):
+            predictor._cache = frame_cache.DecodedFrameCache(max_bytes=1 << 40)
+            requests_before, frames_before = sum(server.requests.values()), server.frames_served
+            start = time.perf_counter()
+            try:
+                ds, dlevel = predictor._open_level(series_path, None, level.sop_instance_uid)
+                pixels = predictor._patch_batch(ds, dlevel, patches)
+            except Exception as exc:
+                error = f'{type(exc).__name__}: {exc}'
+                ok = False
+                break
+            elapsed = time.perf_counter() - start
+            if not repeat:
+                continue  # Frames encoded on this pass
+            runs.append({
+                'seconds': round(elapsed, 3),
+                'patches_per_sec': round(len(patches) / elapsed, 2),
+                'requests': sum(server.requests.values()) - requests_before,
+                'frames': server.frames_served - frames_before,
+            })
+            diff = np.abs(np.asarray(pixels, dtype=np.int16) - expected)
+            mean_error, peak_error = float(diff.mean()), int(diff.max())
+            ok = ok and mean_error <= max_error
+
+    report = {
+        'slide': {k: v for k, v in vars(args).items() if k in ('width', 'height', 'tile_size', 'levels',
+                                                              'compression', 'organization')},
+        'level': args.level, 'patches': len(patches), 'patch_size': args.patch_size,
+        'latency_ms': args.latency_ms, 'runs': runs, 'ok': ok,
+    }
+    if runs:
+        report['mean_abs_error'] = round(mean_error, 3)
+        report['max_abs_error'] = peak_error
+    if error:
+        report['error'] = error
+    print(json.dumps(report, indent=2))
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
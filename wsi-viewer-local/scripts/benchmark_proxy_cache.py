@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Measure repeat-visit bandwidth and latency of DICOM frames through the /dicom proxy.
+
+Starts a local DICOMweb stand-in that serves random frame bytes after a fixed
+delay (simulating a remote archive) and the viewer app in front of it, then
+fetches the same frames twice like a browser with an HTTP cache:
+
+  first visit   plain GETs, validators (ETag / Last-Modified) are kept
+  repeat visit  conditional GETs (If-None-Match) for the same frames
+
+Reports bytes received, latency percentiles, upstream requests and upstream
+TCP connections per visit; a repeat visit should transfer no frame bytes and
+not reach the upstream at all.
+
+Usage:
+  python scripts/benchmark_proxy_cache.py --frames 200 --frame-kb 64 --upstream-delay-ms 20
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+import numpy as np
+import requests
+from werkzeug.serving import make_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+class _Upstream:
+    """DICOMweb stand-in counting requests and distinct client connections."""
+
+    def __init__(self, frame_bytes: int, delay: float) -> None:
+        self.payload = os.urandom(frame_bytes)
+        self.delay = delay
+        self.requests = 0
+        self.connections = set()
+        self._lock = threading.Lock()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, so pooled connections are reused
+
+            def do_GET(self):
+                with stand_in._lock:
+                    stand_in.requests += 1
+                    stand_in.connections.add(self.client_address)
+                time.sleep(stand_in.delay)
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/octet-stream')
+                self.send_header('Content-Length', str(len(stand_in.payload)))
+                self.send_header('Last-Modified', 'Mon, 01 Jan 2024 00:00:00 GMT')
+                self.end_headers()
+                self.wfile.write(stand_in.payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server.server_port}/dicom-web'
+
+    def reset(self) -> None:
+        with self._lock:
+            self.requests = 0
+            self.connections = set()
+
+
+def _visit(session: requests.Session, urls: List[str], validators: Dict[str, str], upstream: _Upstream) -> dict:
+    upstream.reset()
+    latencies, received, not_modified = [], 0, 0
+    for url in urls:
+        headers = {'If-None-Match': validators[url]} if url in validators else {}
+        start = time.perf_counter()
+        r = session.get(url, headers=headers)
+        latencies.append(time.perf_counter() - start)
+        received += len(r.content)
+        if r.status_code == 304:
+            not_modified += 1
+        elif r.status_code == 200 and 'ETag' in r.headers:
+            validators[url] = r.headers['ETag']
+    ms = np.asarray(latencies) * 1000
+    return {
+        'requests': len(urls),
+        'not_modified': not_modified,
+        'bytes_received': received,
+        'p50_ms': round(float(np.percentile(ms, 50)), 2),
+        'p95_ms': round(float(np.percentile(ms, 95)), 2),
+        'total_seconds': round(float(ms.sum()) / 1000, 3),
+        'upstream_requests': upstream.requests,
+        'upstream_connections': len(upstream.connections),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--frame-kb', type=int, default=64)
+    parser.add_argument('--upstream-delay-ms', type=float, default=20.0)
+    args = parser.parse_args()
+
+    upstream = _Upstream(args.frame_kb * 1024, args.upstream_delay_ms / 1000)
+    os.environ['DICOM_SERVER_URL'] = upstream.url
+    os.chdir(ROOT)
+    from server import create_app
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, create_app(warm_load=False, predictor_factory=lambda: None), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    base = f'http://127.0.0.1:{server.server_port}/dicom/studies/1/series/2/instances/3/frames'
+    urls = [f'{base}/{i + 1}' for i in range(args.frames)]
+    validators: Dict[str, str] = {}
+    with requests.Session() as session:
+        first = _visit(session, urls, validators, upstream)
+        repeat = _visit(session, urls, validators, upstream)
+    server.shutdown()
+    upstream.server.shutdown()
+    print(json.dumps({
+        'frames': args.frames,
+        'frame_bytes': args.frame_kb * 1024,
+        'upstream_delay_ms': args.upstream_delay_ms,
+        'first_visit': first,
+        'repeat_visit': repeat,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Compare pyramid-level patch sourcing against native-level fetching for /predict.
+
+Embeds a grid of large patches (fields of view bigger than the model input)
+from one DICOMweb series twice: reading at the requested level, and from the
+coarsest pyramid level that still covers the model input size. Each run
+starts with an empty decoded-frame cache and no embedding cache, so the
+frames and decoded bytes it fetched are the cache's misses and resident
+bytes. Reports those and the end-to-end embed_patches latency per mode.
+
+Usage:
+  python scripts/benchmark_pyramid_sourcing.py \\
+      --series-path http://localhost:8042/dicom-web/studies/<study>/series/<series> \\
+      --patch-size 1792 --grid 4x4
+
+Loads the model from MEDSIGLIP_MODEL_DIR when set; BEARER_TOKEN is passed to DICOMweb.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import frame_cache  # noqa: E402
+from predict_medsiglip import MedSigLIPPredictor, Patch  # noqa: E402
+
+
+def run_one(predictor: MedSigLIPPredictor, args, patches, pyramid_sourcing: bool) -> dict:
+    cache = frame_cache.DecodedFrameCache(max_bytes=1 << 40)  # Never evicts: resident == fetched
+    predictor._cache = cache
+    predictor.pyramid_sourcing = pyramid_sourcing
+    start = time.perf_counter()
+    predictor.embed_patches(args.series_path, patches, os.environ.get('BEARER_TOKEN'), args.instance_uid)
+    elapsed = time.perf_counter() - start
+    stats = cache.stats()
+    return {
+        'pyramid_sourcing': pyramid_sourcing,
+        'seconds': round(elapsed, 3),
+        'patches_per_sec': round(len(patches) / elapsed, 2),
+        'frames_fetched': stats.misses,
+        'decoded_bytes_fetched': stats.resident_bytes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--series-path', required=True, help='DICOMweb series URL.')
+    parser.add_argument('--instance-uid', default=None, help='Level the coordinates refer to (default: base).')
+    parser.add_argument('--model-id', default='google/medsiglip-448')
+    parser.add_argument('--patch-size', type=int, default=1792, help='Field of view per patch, in level pixels.')
+    parser.add_argument('--grid', default='4x4', help='Patches as ROWSxCOLS from --origin.')
+    parser.add_argument('--origin', default='0,0', help='x,y of the first patch.')
+    parser.add_argument('--repeats', type=int, default=2)
+    args = parser.parse_args()
+
+    rows, _, cols = args.grid.partition('x')
+    x0, y0 = (int(v) for v in args.origin.split(','))
+    size = args.patch_size
+    patches = [
+        Patch(x_origin=x0 + c * size, y_origin=y0 + r * size, width=size, height=size)
+        for r in range(int(rows)) for c in range(int(cols or rows))
+    ]
+    predictor = MedSigLIPPredictor(model_id=args.model_id, cache=None, embeddings=None)
+    predictor.warm_up()
+    results = []
+    for _ in range(args.repeats):
+        # Alternate modes so server-side caching favours neither
+        for pyramid_sourcing in (False, True):
+            results.append(run_one(predictor, args, patches, pyramid_sourcing))
+            print(json.dumps(results[-1]), file=sys.stderr)
+    best = {
+        mode: min((r for r in results if r['pyramid_sourcing'] == mode), key=lambda r: r['seconds'])
+        for mode in (False, True)
+    }
+    print(json.dumps({
+        'patches': len(patches),
+        'patch_size': size,
+        'input_size': list(predictor.input_size),
+        'native_level': best[False],
+        'pyramid_level': best[True],
+        'bytes_ratio': round(best[True]['decoded_bytes_fetched'] / max(1, best[False]['decoded_bytes_fetched']), 4),
+        'speedup': round(best[False]['seconds'] / best[True]['seconds'], 2),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
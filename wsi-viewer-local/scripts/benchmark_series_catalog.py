@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Compare the REST walk of query_series.py with the local series catalog.
+
+Starts an Orthanc stand-in holding --studies studies of --series-per-study
+whole slide series (--levels instances each, one per pyramid level) with a
+fixed delay per request, and answering the REST calls both approaches use
+(/studies, /series/{id}, /instances/{id}, /tools/find, /tools/bulk-content,
+/changes). Reports requests and seconds for:
+
+  walk         one GET per study, series and instance (the old scripts)
+  rebuild      series_catalog.SeriesCatalog.rebuild(): paged bulk queries
+  sync         after importing --new-series series and deleting a study
+  idle sync    nothing changed: one /changes request
+  query        list_series() and levels() from SQLite
+
+Exits non-zero if the synced catalog differs from the stand-in's content.
+
+Usage:
+  python scripts/benchmark_series_catalog.py --studies 100 --series-per-study 3 --levels 6
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import series_catalog  # noqa: E402
+
+
+def _id(*parts) -> str:
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()[:16]
+
+
+class _OrthancStandIn:
+    """In-memory studies/series/instances with Orthanc's REST shapes and a change feed."""
+
+    def __init__(self, request_delay: float) -> None:
+        self.studies, self.series, self.instances = {}, {}, {}
+        self.changes = []
+        self.requests = 0
+        self._lock = threading.Lock()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _reply(self, body) -> None:
+                data = json.dumps(body).encode()
+                self.send_response(200 if body is not None else 404)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                time.sleep(request_delay)
+                url = urlparse(self.path)
+                with stand_in._lock:
+                    stand_in.requests += 1
+                    self._reply(stand_in.get(url.path, parse_qs(url.query, keep_blank_values=True)))
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                time.sleep(request_delay)
+                with stand_in._lock:
+                    stand_in.requests += 1
+                    self._reply(stand_in.post(self.path, body))
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server.server_port}'
+
+    def _change(self, kind: str, level: str, orthanc_id: str) -> None:
+        self.changes.append({'ChangeType': kind, 'ResourceType': level, 'ID': orthanc_id, 'Seq': len(self.changes) + 1})
+
+    def add_series(self, study_uid: str, series_uid: str, levels: int) -> None:
+        with self._lock:
+            study_id = _id(study_uid)
+            if study_id not in self.studies:
+                self.studies[study_id] = {'ID': study_id, 'Type': 'Study', 'Series': [],
+                                          'MainDicomTags': {'StudyInstanceUID': study_uid, 'StudyDate': '20250101'},
+                                          'PatientMainDicomTags': {'PatientID': 'P1'}}
+                self._change('NewStudy', 'Study', study_id)
+            series_id = _id(study_uid, series_uid)
+            self.studies[study_id]['Series'].append(series_id)
+            self.series[series_id] = {'ID': series_id, 'Type': 'Series', 'ParentStudy': study_id, 'Instances': [],
+                                      'MainDicomTags': {'SeriesInstanceUID': series_uid, 'Modality': 'SM'}}
+            self._change('NewSeries', 'Series', series_id)
+            for level in range(levels):
+                sop_uid = f'{series_uid}.{level + 1}'
+                instance_id = _id(study_uid, series_uid, sop_uid)
+                width, height = 98304 >> level, 65536 >> level
+                self.series[series_id]['Instances'].append(instance_id)
+                self.instances[instance_id] = {
+                    'ID': instance_id, 'Type': 'Instance', 'ParentSeries': series_id,
+                    'MainDicomTags': {'SOPInstanceUID': sop_uid, 'NumberOfFrames': str(-(-width // 256) * -(-height // 256))},
+                    'Tags': {'ImageType': 'DERIVED\\PRIMARY\\VOLUME\\NONE' if level else 'ORIGINAL\\PRIMARY\\VOLUME\\NONE',
+                             'TotalPixelMatrixColumns': str(width), 'TotalPixelMatrixRows': str(height),
+                             'Columns': '256', 'Rows': '256'},
+                }
+                self._change('NewInstance', 'Instance', instance_id)
+
+    def delete_study(self, study_uid: str) -> None:
+        with self._lock:
+            study = self.studies.pop(_id(study_uid))
+            for series_id in study['Series']:
+                for instance_id in self.series.pop(series_id)['Instances']:
+                    del self.instances[instance_id]
+            self._change('Deleted', 'Study', study['ID'])
+
+    def _public(self, resource: dict) -> dict:
+        return {k: v for k, v in resource.items() if k != 'Tags'}
+
+    def get(self, path: str, query: dict):
+        if path == '/changes':
+            if 'last' in query:
+                return {'Changes': self.changes[-1:], 'Done': True, 'Last': len(self.changes)}
+            since, limit = int(query.get('since', ['0'])[0]), int(query.get('limit', ['100'])[0])
+            page = self.changes[since:since + limit]
+            return {'Changes': page, 'Done': since + limit >= len(self.changes), 'Last': since + len(page)}
+        if path == '/studies':
+            return list(self.studies)
+        match = re.match(r'^/(studies|series|instances)/([^/]+)$', path)
+        if match:
+            resource = getattr(self, match.group(1)).get(match.group(2))
+            return self._public(resource) if resource else None
+        return None
+
+    def post(self, path: str, body: dict):
+        if path == '/tools/bulk-content':
+            table = {'Study': self.studies, 'Series': self.series, 'Instance': self.instances}[body['Level']]
+            return [self._public(table[i]) for i in body['Resources'] if i in table]
+        if path == '/tools/find':
+            table = {'Study': self.studies, 'Series': self.series, 'Instance': self.instances}[body['Level']]
+            resources = list(table.values())
+            wanted = body.get('Query', {}).get('SeriesInstanceUID')
+            if wanted:
+                uids = set(wanted.split('\\'))
+                resources = [r for r in resources
+                             if self.series[r['ParentSeries']]['MainDicomTags']['SeriesInstanceUID'] in uids]
+            since, limit = body.get('Since', 0), body.get('Limit', len(resources))
+            found = []
+            for r in resources[since:since + limit]:
+                r = self._public(r)
+                if body.get('RequestedTags'):
+                    r['RequestedTags'] = {t: table[r['ID']]['Tags'][t] for t in body['RequestedTags']
+                                          if t in table[r['ID']].get('Tags', {})}
+                found.append(r)
+            return found
+        return None
+
+
+def _walk(url: str) -> int:
+    """The old per-resource walk; returns the number of instances seen."""
+    seen = 0
+    for sid in requests.get(f'{url}/studies').json():
+        study = requests.get(f'{url}/studies/{sid}').json()
+        for ser_id in study.get('Series', []):
+            series = requests.get(f'{url}/series/{ser_id}').json()
+            for inst_id in series.get('Instances', []):
+                requests.get(f'{url}/instances/{inst_id}').json()
+                seen += 1
+    return seen
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--studies', type=int, default=100)
+    parser.add_argument('--series-per-study', type=int, default=3)
+    parser.add_argument('--levels', type=int, default=6, help='Instances (pyramid levels) per series.')
+    parser.add_argument('--new-series', type=int, default=10, help='Series imported before the incremental sync.')
+    parser.add_argument('--request-delay-ms', type=float, default=2.0, help='Stand-in work per request.')
+    args = parser.parse_args()
+
+    stand_in = _OrthancStandIn(args.request_delay_ms / 1000)
+    for study in range(args.studies):
+        for series in range(args.series_per_study):
+            stand_in.add_series(f'1.2.3.{study}', f'1.2.3.{study}.{series}', args.levels)
+
+    results = {}
+
+    def measure(name, fn):
+        before, start = stand_in.requests, time.perf_counter()
+        value = fn()
+        results[name] = {'requests': stand_in.requests - before, 'seconds': round(time.perf_counter() - start, 3)}
+        return value
+
+    measure('walk', lambda: _walk(stand_in.url))
+    with tempfile.TemporaryDirectory() as folder:
+        catalog = series_catalog.SeriesCatalog(stand_in.url, os.path.join(folder, 'catalog.sqlite'))
+        measure('rebuild', catalog.rebuild)
+        for series in range(args.new_series):
+            stand_in.add_series('1.2.3.new', f'1.2.3.new.{series}', args.levels)
+        stand_in.delete_study('1.2.3.0')
+        results['sync_changes'] = measure('sync', catalog.sync)['changes']
+        measure('idle sync', catalog.sync)
+
+        start = time.perf_counter()
+        listed = catalog.list_series()
+        results['list_series_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        start = time.perf_counter()
+        levels = catalog.levels(listed[0]['series_uid'])
+        results['levels_ms'] = round((time.perf_counter() - start) * 1000, 2)
+
+        expected = {s['MainDicomTags']['SeriesInstanceUID'] for s in stand_in.series.values()}
+        ok = ({s['series_uid'] for s in listed} == expected
+              and catalog.stats()['instances'] == len(stand_in.instances)
+              and len(levels) == args.levels and levels[0]['width'] == 98304)
+        catalog.close()
+    stand_in.server.shutdown()
+
+    print(json.dumps({'studies': args.studies, 'series': len(stand_in.series), 'instances': len(stand_in.instances),
+                      **results, 'ok': ok}, indent=2))
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
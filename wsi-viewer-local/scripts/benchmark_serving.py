@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Measure viewer server throughput under concurrent tile + predict load.
+
+Runs tile clients (GETs, e.g. DICOM frames through the /dicom proxy) and
+predict clients (POST /predict) against a running server for a fixed
+duration and reports requests/sec and latency percentiles for each.
+Run it once against the development server and once against production
+mode to compare:
+
+  python server.py                      # development: one process, model inside
+  python server_gunicorn.py             # production: web workers + model host
+
+  python scripts/benchmark_serving.py --url http://localhost:8081 \\
+      --tile-path /dicom/studies/<Study>/series/<Series>/instances/<SOP>/frames/1 \\
+      --predict-body examples/predict_example.json \\
+      --tile-clients 16 --predict-clients 2 --duration 60
+
+Waits for /readyz (model loaded) before starting unless --no-wait-ready.
+"""
+
+import argparse
+import itertools
+import json
+import threading
+import time
+from typing import Dict, List
+
+import numpy as np
+import requests
+
+
+def _wait_ready(url: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{url}/readyz", timeout=5).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(2)
+    raise SystemExit(f"{url} not ready after {timeout}s")
+
+
+def _client(session_call, stop: threading.Event, latencies: List[float], errors: List[int]) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            r = session_call()
+            ok = r.status_code == 200
+            r.close()
+        except requests.RequestException:
+            ok = False
+        if ok:
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors.append(1)
+
+
+def _summary(latencies: List[float], errors: List[int], duration: float) -> Dict[str, float]:
+    lat = np.array(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "requests_per_sec": len(latencies) / duration,
+        "p50_ms": float(np.percentile(lat, 50)) if len(lat) else None,
+        "p95_ms": float(np.percentile(lat, 95)) if len(lat) else None,
+        "p99_ms": float(np.percentile(lat, 99)) if len(lat) else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://localhost:8081')
+    parser.add_argument('--tile-path', action='append', default=[],
+                        help='Path to GET as tile load (repeatable; clients cycle through them).')
+    parser.add_argument('--predict-body', help='JSON file POSTed to /predict.')
+    parser.add_argument('--tile-clients', type=int, default=16)
+    parser.add_argument('--predict-clients', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=60)
+    parser.add_argument('--no-wait-ready', action='store_true')
+    args = parser.parse_args()
+
+    url = args.url.rstrip('/')
+    if not args.no_wait_ready and args.predict_body:
+        _wait_ready(url, timeout=900)
+
+    tile_paths = args.tile_path or ['/']
+    body = None
+    if args.predict_body:
+        with open(args.predict_body) as f:
+            body = json.load(f)
+
+    stop = threading.Event()
+    results = {"tile": ([], []), "predict": ([], [])}
+    threads = []
+    for i in range(args.tile_clients):
+        session = requests.Session()
+        offset = i % len(tile_paths)
+        paths = itertools.cycle(tile_paths[offset:] + tile_paths[:offset])
+        call = lambda s=session, p=paths: s.get(f"{url}{next(p)}", timeout=120)
+        threads.append(threading.Thread(target=_client, args=(call, stop, *results["tile"]), daemon=True))
+    if body is not None:
+        for _ in range(args.predict_clients):
+            session = requests.Session()
+            call = lambda s=session: s.post(f"{url}/predict", json=body, timeout=600)
+            threads.append(threading.Thread(target=_client, args=(call, stop, *results["predict"]), daemon=True))
+
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(args.duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    print(json.dumps({
+        "url": url,
+        "duration_seconds": elapsed,
+        "tile_clients": args.tile_clients,
+        "predict_clients": args.predict_clients if body is not None else 0,
+        "tile": _summary(*results["tile"], elapsed),
+        "predict": _summary(*results["predict"], elapsed) if body is not None else None,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Benchmark zero-shot scoring of patch embeddings against text prompts.
+
+Times zero_shot.score on random embeddings, i.e. the cost of /zero-shot once
+image and prompt embeddings are cached (no model needed).
+
+Usage:
+  python scripts/benchmark_zero_shot.py --patches 50000 --prompts 20 --dim 1152
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import zero_shot  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--patches', type=int, default=50000)
+    parser.add_argument('--prompts', type=int, default=20)
+    parser.add_argument('--dim', type=int, default=1152)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    images = rng.standard_normal((args.patches, args.dim)).astype(np.float32)
+    images /= np.linalg.norm(images, axis=1, keepdims=True)
+    texts = rng.standard_normal((args.prompts, args.dim)).astype(np.float32)
+    results = {}
+    for include_scores in (False, True):
+        times = []
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            zero_shot.score(images, texts, 10.0, -10.0, include_scores=include_scores)
+            times.append(time.perf_counter() - start)
+        results['with_scores_grid' if include_scores else 'labels_only'] = {
+            'best_seconds': min(times),
+            'median_seconds': float(np.median(times)),
+        }
+    print(json.dumps({'patches': args.patches, 'prompts': args.prompts, 'dim': args.dim, **results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
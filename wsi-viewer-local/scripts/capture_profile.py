@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Capture a sampling profile of a running server worker (sampling_profiler.py).
+
+Works with this viewer (server.py / server_gunicorn.py) and the
+path-foundation-demo server, both started with PROFILER_TOKEN set. Starts a
+capture of --seconds on the worker with --pid (any worker if omitted,
+retrying on new connections until gunicorn hands one to that worker), waits
+for it and saves collapsed stacks, or a flame graph with --format svg.
+--routes instead reads the continuous per route samples (PROFILE_HZ > 0).
+
+Usage:
+  PROFILER_TOKEN=... python scripts/capture_profile.py --url http://localhost:8080 --seconds 30 --output predict.svg
+  PROFILER_TOKEN=... python scripts/capture_profile.py --pid 4242 --hz 200 --format collapsed --output hot.collapsed
+  PROFILER_TOKEN=... python scripts/capture_profile.py --routes --route 'POST /predict' --output predict-routes.svg
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import requests
+
+_ATTEMPTS_PER_WORKER = 20
+
+
+def _request(method: str, url: str, token: str, pid, params: dict, workers: int) -> requests.Response:
+    """Sends a request until the worker with pid answers (each try on a new connection)."""
+    params = dict(params, **({'pid': pid} if pid else {}))
+    for _ in range(max(1, workers) * _ATTEMPTS_PER_WORKER):
+        response = requests.request(method, url, params=params, headers={'X-Profiler-Token': token,
+                                                                         'Connection': 'close'})
+        if response.status_code != 409 or 'pid' not in response.text:
+            return response
+    sys.exit(f"No response from worker {pid}; check its pid in the server log or /admin/profile/routes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Capture a sampling profile of a server worker")
+    parser.add_argument('--url', default='http://localhost:8080', help='Server base URL.')
+    parser.add_argument('--token', default=os.environ.get('PROFILER_TOKEN'), help='Default: PROFILER_TOKEN.')
+    parser.add_argument('--pid', help='Worker process to profile (default: whichever answers).')
+    parser.add_argument('--workers', type=int, default=8, help='Upper bound of workers, for --pid retries.')
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--hz', type=float, default=100.0, help='Samples per second.')
+    parser.add_argument('--routes', action='store_true', help='Read the continuous per route samples instead.')
+    parser.add_argument('--route', help="With --routes, one route, e.g. 'POST /predict'.")
+    parser.add_argument('--format', choices=('svg', 'collapsed'), default=None,
+                        help='Default: from the --output extension, else collapsed.')
+    parser.add_argument('--output', help='File to write (default: stdout).')
+    args = parser.parse_args()
+    if not args.token:
+        parser.error('--token or PROFILER_TOKEN is required')
+    fmt = args.format or ('svg' if (args.output or '').endswith('.svg') else 'collapsed')
+    base = args.url.rstrip('/')
+
+    if args.routes:
+        stats = _request('GET', f'{base}/admin/profile/routes', args.token, args.pid, {}, args.workers)
+        stats.raise_for_status()
+        print(json.dumps(stats.json(), indent=2), file=sys.stderr)
+        params = {'format': fmt, **({'route': args.route} if args.route else {})}
+        # Same worker as the summary above
+        result = _request('GET', f'{base}/admin/profile/routes', args.token, stats.json()['pid'], params,
+                          args.workers)
+    else:
+        started = _request('POST', f'{base}/admin/profile', args.token, args.pid,
+                           {'seconds': args.seconds, 'hz': args.hz}, args.workers)
+        started.raise_for_status()
+        capture = started.json()
+        print(f"Capturing {capture['seconds']} s at {capture['hz']} Hz in worker {capture['pid']} "
+              f"({capture['id']})", file=sys.stderr)
+        time.sleep(capture['seconds'])
+        # Any worker serves finished captures; 404 until written
+        deadline = time.monotonic() + 30
+        while True:
+            result = requests.get(f"{base}/admin/profile/{capture['id']}", params={'format': fmt},
+                                  headers={'X-Profiler-Token': args.token})
+            if result.status_code != 404 or time.monotonic() > deadline:
+                break
+            time.sleep(0.5)
+    result.raise_for_status()
+
+    if args.output:
+        with open(args.output, 'wb') as f:
+            f.write(result.content)
+        print(f"Wrote {args.output}", file=sys.stderr)
+    else:
+        sys.stdout.write(result.text)
+
+
+if __name__ == '__main__':
+    main()
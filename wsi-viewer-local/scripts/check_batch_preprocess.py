@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Check batched torch preprocessing (batch_preprocess.py) against the HF processor.
+
+Builds synthetic RGB patches (smooth gradients plus noise) at several sizes,
+preprocesses them both ways and reports the largest and mean absolute
+difference of the model inputs per size. Patches at the model input size
+must match exactly; resized ones within --atol / --mean-atol (normalized
+units, where one grey level is 2/255 for mean = std = 0.5). With
+--embeddings the model also embeds both inputs and the lowest cosine
+similarity must reach --min-cosine. Exits non-zero on any failure.
+
+Usage:
+  python scripts/check_batch_preprocess.py
+  python scripts/check_batch_preprocess.py --sizes 448,224,512,300x500 --embeddings
+
+Loads the processor (and model) from MEDSIGLIP_MODEL_DIR when set.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import batch_preprocess  # noqa: E402
+
+
+def _patches(rng: np.random.Generator, count: int, height: int, width: int) -> np.ndarray:
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None, None]
+    x = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    base = (y * np.array([1.0, 0.3, 0.6]) + x * np.array([0.0, 0.7, 0.4]))
+    noise = rng.normal(0, 24, (count, height, width, 3))
+    return np.clip(base[None] + noise, 0, 255).astype(np.uint8)
+
+
+def _size(text: str):
+    h, _, w = text.partition('x')
+    return int(h), int(w or h)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model-id', default='google/medsiglip-448')
+    parser.add_argument('--sizes', default='448,224,512,300x500,1024',
+                        help='Patch sizes, N or HxW (comma separated).')
+    parser.add_argument('--patches', type=int, default=4, help='Patches per size.')
+    parser.add_argument('--atol', type=float, default=0.02)
+    parser.add_argument('--mean-atol', type=float, default=0.001)
+    parser.add_argument('--embeddings', action='store_true', help='Also compare model embeddings.')
+    parser.add_argument('--min-cosine', type=float, default=0.999)
+    args = parser.parse_args()
+
+    import torch
+    from transformers import AutoModel, AutoProcessor
+
+    load_from = os.environ.get('MEDSIGLIP_MODEL_DIR') or args.model_id
+    # The slow (PIL) processor is the reference the predictor used before
+    processor = AutoProcessor.from_pretrained(load_from, use_fast=False)
+    config = batch_preprocess.config_from_processor(processor.image_processor)
+    if config is None:
+        raise SystemExit('Processor settings are not supported by batch_preprocess; the predictor uses the processor.')
+    model = AutoModel.from_pretrained(load_from).eval() if args.embeddings else None
+
+    rng = np.random.default_rng(0)
+    results = []
+    failed = False
+    for height, width in (_size(s) for s in args.sizes.split(',')):
+        pixels = _patches(rng, args.patches, height, width)
+        expected = processor(images=[Image.fromarray(p, mode='RGB') for p in pixels],
+                             return_tensors='pt')['pixel_values'].float()
+        actual = batch_preprocess.pixel_values(pixels, config)
+        diff = (actual - expected).abs()
+        exact = (height, width) == (config.height, config.width)
+        result = {
+            'size': [height, width],
+            'resized': not exact,
+            'max_abs_diff': float(diff.max()),
+            'mean_abs_diff': float(diff.mean()),
+        }
+        ok = result['max_abs_diff'] <= (1e-5 if exact else args.atol)
+        ok = ok and (exact or result['mean_abs_diff'] <= args.mean_atol)
+        if model is not None:
+            with torch.inference_mode():
+                a = model.get_image_features(pixel_values=actual)
+                b = model.get_image_features(pixel_values=expected)
+            cosine = torch.nn.functional.cosine_similarity(a, b, dim=-1)
+            result['min_cosine'] = float(cosine.min())
+            ok = ok and result['min_cosine'] >= args.min_cosine
+        result['ok'] = bool(ok)
+        failed = failed or not ok
+        results.append(result)
+        print(f"{height}x{width}: max {result['max_abs_diff']:.5f}  mean {result['mean_abs_diff']:.6f}  "
+              f"{'ok' if ok else 'FAIL'}", file=sys.stderr)
+
+    print(json.dumps({'config': config.__dict__, 'results': results}, indent=2))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -14,16 +14,38 @@ Examples:
     --outdir orthanc/import \
     --orthanc http://localhost:8042
 
+  # Batch: every slide in a folder (or listed in a manifest), 4 conversions at a time
+  python scripts/convert_wsi_to_dicom.py --input /data/slides --workers 4 --outdir /data/import
+  python scripts/convert_wsi_to_dicom.py --manifest slides.txt --workers 4 --report report.json
+
 This uses the wsidicomizer library to produce VL Whole Slide Microscopy DICOM files.
+
+Each slide is converted into its own folder under --outdir (<name>-<hash>),
+by up to --workers wsidicomizer processes at once. A slide's series is
+imported into Orthanc as soon as its conversion finishes, while other slides
+are still converting. Slides are identified by a BLAKE2b hash of their
+content, recorded in <outdir>/.converted.json: re-running skips slides that
+were already converted and imported, whatever their file name or location.
 """
 
 import argparse
+import concurrent.futures
+import dataclasses
+import hashlib
+import json
 import os
 import shutil
 import subprocess
 import sys
+import threading
+import time
+from typing import List, Optional
 
-import requests
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'orthanc'))
+import import_dicom  # noqa: E402
+
+SLIDE_EXTENSIONS = ('.svs', '.tif', '.tiff', '.ndpi', '.vms', '.vmu', '.scn', '.mrxs', '.svslide', '.bif')
+STATE_FILE = '.converted.json'
 
 
 def ensure_tool():
@@ -44,39 +66,221 @@ def run_wsidicomizer(inp: str, outdir: str):
     else:
         # Fallback: try module entrypoint (may not be available in some versions)
         cmd = [sys.executable, '-c', 'import wsidicomizer.cli as c; c.main()', '--out', outdir, inp]
-    print('Running:', ' '.join(cmd))
-    subprocess.check_call(cmd)
+    print('Running:', ' '.join(cmd), file=sys.stderr, flush=True)
+    subprocess.check_call(cmd, stdout=subprocess.DEVNULL)
+
+
+def content_hash(path: str, chunk_size: int = 8 * 1024 * 1024) -> str:
+    """BLAKE2b digest of a slide file (the files of its folder for .mrxs-like formats are not included)."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def find_slides(inputs: List[str], manifest: Optional[str]) -> List[str]:
+    """Returns slide paths from files, folders (non recursive) and a manifest, deduplicated."""
+    paths = list(inputs)
+    if manifest:
+        with open(manifest) as f:
+            paths.extend(line.strip() for line in f if line.strip() and not line.lstrip().startswith('#'))
+    slides = []
+    for path in paths:
+        if os.path.isdir(path):
+            slides.extend(
+                os.path.join(path, name) for name in sorted(os.listdir(path))
+                if name.lower().endswith(SLIDE_EXTENSIONS) and os.path.isfile(os.path.join(path, name))
+            )
+        elif os.path.isfile(path):
+            slides.append(path)
+        else:
+            print(f"Skipping missing input: {path}", file=sys.stderr)
+    seen = set()
+    return [s for s in (os.path.abspath(p) for p in slides) if not (s in seen or seen.add(s))]
+
+
+@dataclasses.dataclass
+class SlideResult:
+    source: str
+    status: str  # 'converted', 'skipped' (done earlier), 'duplicate' (of another input) or 'failed'
+    digest: str = ''
+    outdir: str = ''
+    bytes: int = 0
+    convert_seconds: float = 0.0
+    imported: bool = False
+    import_files: int = 0
+    import_seconds: float = 0.0
+    error: str = ''
+
+
+class ConversionState:
+    """Slides already converted (and imported), by content hash; saved after every change."""
+
+    def __init__(self, outdir: str) -> None:
+        self._path = os.path.join(outdir, STATE_FILE)
+        self._lock = threading.Lock()
+        self._claimed = set()  # digests being converted in this run
+        try:
+            with open(self._path) as f:
+                self._slides = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._slides = {}
+
+    def get(self, digest: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._slides.get(digest)
+            return dict(entry) if entry else None
+
+    def claim(self, digest: str) -> bool:
+        """False if another slide with the same content is already being converted."""
+        with self._lock:
+            if digest in self._claimed:
+                return False
+            self._claimed.add(digest)
+            return True
 
+    def update(self, digest: str, **fields) -> None:
+        with self._lock:
+            self._slides.setdefault(digest, {}).update(fields)
+            tmp = f'{self._path}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self._slides, f, indent=2, sort_keys=True)
+            os.replace(tmp, self._path)
 
-def import_folder(orthanc_url: str, folder: str):
-    for root, _dirs, files in os.walk(folder):
-        for name in files:
-            if name.lower().endswith('.dcm'):
-                full = os.path.join(root, name)
-                with open(full, 'rb') as f:
-                    r = requests.post(f"{orthanc_url.rstrip('/')}/instances", data=f, headers={'Expect': ''})
-                    r.raise_for_status()
-                print(f"Imported: {full}")
+
+def convert_slide(source: str, outdir: str, state: ConversionState) -> SlideResult:
+    """Hashes and, unless already done, converts one slide into its own folder."""
+    result = SlideResult(source=source, status='converted', bytes=os.path.getsize(source))
+    try:
+        result.digest = content_hash(source)
+        stem = os.path.splitext(os.path.basename(source))[0]
+        result.outdir = os.path.join(outdir, f'{stem}-{result.digest[:12]}')
+        done = state.get(result.digest)
+        if done and os.path.isdir(done.get('outdir', '')):
+            # Converted earlier; the caller still imports it if that did not finish
+            result.status = 'skipped'
+            result.outdir = done['outdir']
+            result.imported = bool(done.get('imported'))
+            return result
+        if not state.claim(result.digest):
+            result.status = 'duplicate'  # Same content as another input of this run
+            return result
+        if os.path.isdir(result.outdir):
+            shutil.rmtree(result.outdir)  # Leftovers of an interrupted conversion
+        start = time.perf_counter()
+        run_wsidicomizer(source, result.outdir)
+        result.convert_seconds = time.perf_counter() - start
+        state.update(result.digest, source=source, outdir=result.outdir, imported=False)
+    except (OSError, subprocess.CalledProcessError) as e:
+        result.status = 'failed'
+        result.error = str(e)
+        if result.outdir and os.path.isdir(result.outdir):
+            shutil.rmtree(result.outdir, ignore_errors=True)
+    return result
+
+
+def import_slide(result: SlideResult, importer: import_dicom.OrthancImporter, state: ConversionState) -> SlideResult:
+    stats = importer.import_paths([result.outdir])
+    result.import_seconds = stats.seconds
+    result.import_files = stats.uploaded
+    if stats.failed:
+        result.error = f'import failed for {stats.failed} of {stats.files} files'
+        return result
+    result.imported = True
+    state.update(result.digest, imported=True)
+    return result
+
+
+def _report(results: List[SlideResult], total: int, elapsed: float) -> dict:
+    converted = [r for r in results if r.status == 'converted']
+    converted_bytes = sum(r.bytes for r in converted)
+    return {
+        'slides': total,
+        'converted': len(converted),
+        'skipped': sum(r.status in ('skipped', 'duplicate') for r in results),
+        'failed': sum(r.status == 'failed' or bool(r.error) for r in results),
+        'imported': sum(r.imported for r in results),
+        'elapsed_seconds': round(elapsed, 1),
+        'converted_gb': round(converted_bytes / 1e9, 3),
+        'slides_per_hour': round(len(converted) / elapsed * 3600, 1) if elapsed else 0.0,
+        'mb_per_second': round(converted_bytes / 1e6 / elapsed, 2) if elapsed else 0.0,
+        'results': [dataclasses.asdict(r) for r in results],
+    }
+
+
+def convert_batch(slides: List[str], outdir: str, workers: int, orthanc_url: Optional[str],
+                  import_workers: int = import_dicom.DEFAULT_WORKERS) -> dict:
+    """Converts slides with up to workers concurrent conversions, importing each as it finishes."""
+    os.makedirs(outdir, exist_ok=True)
+    state = ConversionState(outdir)
+    results: List[SlideResult] = []
+    finished = 0
+    start = time.perf_counter()
+    importer = import_dicom.OrthancImporter(orthanc_url, workers=import_workers, verbose=False) if orthanc_url else None
+
+    def progress(result: SlideResult, what: str) -> None:
+        failed = sum(r.status == 'failed' or bool(r.error) for r in results)
+        print(f"[{finished}/{len(slides)} done, {failed} failed, {time.perf_counter() - start:.0f}s] "
+              f"{what}: {os.path.basename(result.source)}{' - ' + result.error if result.error else ''}",
+              file=sys.stderr, flush=True)
+
+    # Conversions run as separate wsidicomizer processes, up to workers at once;
+    # meanwhile each finished series is imported, one at a time, by the concurrent importer.
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as converters, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=1) as import_queue:
+        futures = {converters.submit(convert_slide, s, outdir, state): 'convert' for s in slides}
+        while futures:
+            done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                kind = futures.pop(future)
+                result = future.result()
+                if kind == 'convert':
+                    results.append(result)
+                    if result.status in ('converted', 'skipped') and orthanc_url is not None and not result.imported:
+                        futures[import_queue.submit(import_slide, result, importer, state)] = 'import'
+                        progress(result, f'{result.status}, importing')
+                        continue
+                    finished += 1
+                    progress(result, result.status)
+                else:
+                    finished += 1
+                    progress(result, 'imported' if result.imported else 'import failed')
+    if importer is not None:
+        importer.close()
+    return _report(results, len(slides), time.perf_counter() - start)
 
 
 def main():
     parser = argparse.ArgumentParser(description='Convert WSI to DICOM-WSI and import to Orthanc')
-    parser.add_argument('--input', required=True, help='Input WSI file (SVS, TIFF, etc.)')
+    parser.add_argument('--input', nargs='*', default=[],
+                        help='Input WSI files (SVS, TIFF, etc.) or folders of them')
+    parser.add_argument('--manifest', help='Text file listing slide paths (or folders), one per line')
     parser.add_argument('--outdir', default='orthanc/import', help='Output folder for DICOM files')
     parser.add_argument('--orthanc', default='http://localhost:8042', help='Orthanc base URL to import to')
     parser.add_argument('--no-import', action='store_true', help='Skip import into Orthanc')
+    parser.add_argument('--workers', type=int, default=min(4, os.cpu_count() or 1),
+                        help='Slides converted at the same time')
+    parser.add_argument('--import-workers', type=int, default=import_dicom.DEFAULT_WORKERS,
+                        help='Concurrent uploads to Orthanc')
+    parser.add_argument('--report', help='Write the JSON progress/throughput report here')
     args = parser.parse_args()
 
-    ensure_tool()
-
-    # Clear output folder if it contains leftovers from prior conversions
-    os.makedirs(args.outdir, exist_ok=True)
-    # Keep existing files; wsidicomizer writes into a subfolder per series/study
+    slides = find_slides(args.input, args.manifest)
+    if not slides:
+        parser.error('no slides found; pass --input and/or --manifest')
 
-    run_wsidicomizer(args.input, args.outdir)
+    ensure_tool()
 
-    if not args.no_import:
-        import_folder(args.orthanc, args.outdir)
+    report = convert_batch(slides, args.outdir, args.workers, None if args.no_import else args.orthanc,
+                           args.import_workers)
+    summary = {k: v for k, v in report.items() if k != 'results'}
+    print(json.dumps(summary, indent=2))
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+    if summary['failed']:
+        sys.exit(1)
 
 
 if __name__ == '__main__':
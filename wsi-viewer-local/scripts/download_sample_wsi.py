@@ -7,39 +7,217 @@ Usage examples:
     --dest orthanc/import \
     --urls https://example.com/pathology_wsi_1.dcm https://example.com/pathology_wsi_2.dcm
 
-  python scripts/download_sample_wsi.py --manifest urls.txt --dest orthanc/import
+  python scripts/download_sample_wsi.py --manifest urls.txt --dest orthanc/import --workers 4 --stream-import
 
 Notes:
 - You must supply valid URLs. This script does not bundle sample data.
-- After download, files are imported to Orthanc using REST /instances.
+- Manifest lines are "URL" or "URL SHA256"; with a checksum the download is verified.
+- Up to --workers files download at once. Files are named after the URL;
+  URLs sharing a file name get a short hash of the URL appended. Partial
+  downloads are kept as <name>.part and resumed with HTTP Range requests,
+  after a failure or in a later run, only if the server's ETag (or
+  Last-Modified) still matches (If-Range); finished files that are already
+  present are not downloaded again.
+- After download, files are imported to Orthanc with orthanc/import_dicom.py
+  (concurrent uploads, instances already stored are skipped). With
+  --stream-import each file is imported as soon as it is downloaded.
 """
 
 import argparse
+import collections
+import concurrent.futures
+import hashlib
 import os
 import sys
+import time
+from typing import Dict, List, Optional, Tuple
 from urllib.parse import urlparse
 import requests
+from requests.adapters import HTTPAdapter
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'orthanc'))
+import import_dicom  # noqa: E402
 
-def download(url: str, dest_folder: str) -> str:
-    os.makedirs(dest_folder, exist_ok=True)
-    name = os.path.basename(urlparse(url).path) or 'file.dcm'
-    out = os.path.join(dest_folder, name)
-    with requests.get(url, stream=True) as r:
+# Read size; a chunk being read when a connection breaks is lost and fetched again
+CHUNK_BYTES = 256 * 1024
+
+
+class ChecksumError(ValueError):
+    """Raised when a downloaded file does not match its expected SHA-256."""
+
+
+def sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(8 * 1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _validator(r: requests.Response) -> Optional[str]:
+    """Returns the response's strong ETag, else its Last-Modified, for If-Range."""
+    etag = r.headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return r.headers.get('Last-Modified')
+
+
+def _fetch(session: requests.Session, url: str, part: str, timeout: float) -> None:
+    """Appends the rest of url to part, resuming from its size when the server supports ranges.
+
+    The validator of the response that started part is kept in <part>.validator;
+    resuming sends it as If-Range, so a changed remote file is fetched again
+    from the start instead of being appended to the old data.
+    """
+    validator_path = f'{part}.validator'
+    offset = os.path.getsize(part) if os.path.exists(part) else 0
+    validator = None
+    if offset and os.path.exists(validator_path):
+        with open(validator_path, 'r') as f:
+            validator = f.read().strip() or None
+    # Without a validator the partial data cannot be matched to the remote file
+    headers = {'Range': f'bytes={offset}-', 'If-Range': validator} if validator else {}
+    with session.get(url, stream=True, headers=headers, timeout=timeout) as r:
+        if r.status_code == 416 and validator:
+            return  # Nothing left: part already holds the whole file
         r.raise_for_status()
-        with open(out, 'wb') as f:
-            for chunk in r.iter_content(chunk_size=1024 * 1024):
+        if headers and r.status_code == 206:
+            mode = 'ab'
+        else:
+            # 200: no range support, a changed file or no validator; restart
+            mode = 'wb'
+            with open(validator_path, 'w') as f:
+                f.write(_validator(r) or '')
+        with open(part, mode) as f:
+            for chunk in r.iter_content(chunk_size=CHUNK_BYTES):
                 if chunk:
                     f.write(chunk)
+
+
+def dest_names(urls: List[str]) -> Dict[str, str]:
+    """Returns the file name of each URL, unique across urls.
+
+    The name is the URL's basename; URLs sharing a basename get a short hash of
+    the URL appended before the extension (1.dcm -> 1-3f2a9c1b.dcm).
+    """
+    basenames = {url: os.path.basename(urlparse(url).path) or 'file.dcm' for url in urls}
+    counts = collections.Counter(basenames.values())
+    names = {}
+    for url, name in basenames.items():
+        if counts[name] > 1:
+            stem, ext = os.path.splitext(name)
+            name = f"{stem}-{hashlib.sha256(url.encode('utf-8')).hexdigest()[:8]}{ext}"
+        names[url] = name
+    return names
+
+
+def download(
+    url: str,
+    dest_folder: str,
+    sha256: Optional[str] = None,
+    session: Optional[requests.Session] = None,
+    retries: int = 5,
+    backoff_seconds: float = 1.0,
+    timeout: float = 60.0,
+    name: Optional[str] = None,
+) -> str:
+    """Downloads url into dest_folder, resuming partial data, and returns the file path.
+
+    The file is named name (default: the URL's basename). A file already
+    present is kept if it matches sha256 (or no checksum is given). Raises
+    ChecksumError if the finished download does not match.
+    """
+    os.makedirs(dest_folder, exist_ok=True)
+    name = name or os.path.basename(urlparse(url).path) or 'file.dcm'
+    out = os.path.join(dest_folder, name)
+    if os.path.exists(out) and (sha256 is None or sha256_file(out) == sha256.lower()):
+        print(f"Already downloaded: {out}")
+        return out
+    part = f'{out}.part'
+    session = session or requests.Session()
+    attempt = 0
+    while True:
+        received = os.path.getsize(part) if os.path.exists(part) else 0
+        try:
+            _fetch(session, url, part, timeout)
+            break
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            # Keep the partial file; the next attempt resumes after it
+            if os.path.exists(part) and os.path.getsize(part) > received:
+                attempt = 0  # Made progress: resume right away
+                print(f"Resuming {url} after {os.path.getsize(part)} bytes: {e}", file=sys.stderr)
+                continue
+            if attempt >= retries:
+                raise
+            attempt += 1
+            print(f"Retrying ({attempt}/{retries}) {url}: {e}", file=sys.stderr)
+            time.sleep(backoff_seconds * 2 ** (attempt - 1))
+    if sha256 is not None:
+        actual = sha256_file(part)
+        if actual != sha256.lower():
+            os.remove(part)  # Corrupt data cannot be resumed
+            if os.path.exists(f'{part}.validator'):
+                os.remove(f'{part}.validator')
+            raise ChecksumError(f'{url}: expected sha256 {sha256}, got {actual}')
+    os.replace(part, out)
+    if os.path.exists(f'{part}.validator'):
+        os.remove(f'{part}.validator')
     print(f"Downloaded: {url} -> {out}")
     return out
 
 
-def import_to_orthanc(orthanc_url: str, path: str) -> None:
-    with open(path, 'rb') as f:
-        r = requests.post(f"{orthanc_url.rstrip('/')}/instances", data=f, headers={'Expect': ''})
-    r.raise_for_status()
-    print(f"Imported to Orthanc: {path}")
+def read_manifest(path: str) -> List[Tuple[str, Optional[str]]]:
+    """Returns (url, sha256 or None) entries of a manifest, skipping comments."""
+    entries = []
+    with open(path, 'r') as f:
+        for line in f:
+            fields = line.split()
+            if fields and not fields[0].startswith('#'):
+                entries.append((fields[0], fields[1] if len(fields) > 1 else None))
+    return entries
+
+
+def download_all(
+    entries: List[Tuple[str, Optional[str]]],
+    dest_folder: str,
+    workers: int = 4,
+    importer: Optional[import_dicom.OrthancImporter] = None,
+) -> Tuple[List[str], List[Tuple[str, str]]]:
+    """Downloads entries concurrently; returns (downloaded paths, (url, error) failures).
+
+    With an importer, each file is imported as soon as its download finishes.
+    Repeated URLs are downloaded once; see dest_names for file names.
+    """
+    unique = {}
+    for url, sha256 in entries:
+        unique.setdefault(url, sha256)
+    entries = list(unique.items())
+    names = dest_names([url for url, _ in entries])
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(1, workers))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    downloaded, failures, imports = [], [], []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as pool, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=1) as import_queue:
+        futures = {pool.submit(download, url, dest_folder, sha256, session, name=names[url]): url
+                   for url, sha256 in entries}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                path = future.result()
+            except (requests.RequestException, OSError, ChecksumError) as e:
+                failures.append((futures[future], str(e)))
+                print(f"Failed: {futures[future]} - {e}", file=sys.stderr)
+                continue
+            downloaded.append(path)
+            if importer is not None:
+                imports.append(import_queue.submit(importer.import_files, [path]))
+        for future in imports:
+            stats = future.result()
+            if stats.failed:
+                failures.append((f'import of {stats.failed} file(s)', 'failed'))
+    session.close()
+    return downloaded, failures
 
 
 def main():
@@ -47,32 +225,42 @@ def main():
     parser.add_argument('--orthanc', default='http://localhost:8042', help='Orthanc base URL')
     parser.add_argument('--dest', default='orthanc/import', help='Destination download folder')
     parser.add_argument('--urls', nargs='*', default=None, help='One or more HTTPS URLs to .dcm files')
-    parser.add_argument('--manifest', default=None, help='Text file with one URL per line')
+    parser.add_argument('--manifest', default=None, help='Text file with one URL (and optional SHA256) per line')
     parser.add_argument('--no-import', action='store_true', help='Skip importing to Orthanc')
+    parser.add_argument('--workers', type=int, default=4, help='Concurrent downloads')
+    parser.add_argument('--stream-import', action='store_true',
+                        help='Import each file as soon as it is downloaded instead of after all downloads')
     args = parser.parse_args()
 
-    urls = []
-    if args.urls:
-        urls.extend(args.urls)
+    entries = [(u, None) for u in args.urls or []]
     if args.manifest:
-        with open(args.manifest, 'r') as f:
-            for line in f:
-                u = line.strip()
-                if u and not u.startswith('#'):
-                    urls.append(u)
+        entries.extend(read_manifest(args.manifest))
 
-    if not urls:
+    if not entries:
         print('No URLs provided. Provide with --urls or --manifest.')
         print('Tip: Some public sources host DICOM WSI (pathology) samples. Replace with valid links you have access to.')
         sys.exit(2)
 
-    downloaded = [download(u, args.dest) for u in urls]
-
-    if not args.no_import:
-        for p in downloaded:
-            import_to_orthanc(args.orthanc, p)
+    start = time.perf_counter()
+    importer = None if args.no_import else import_dicom.OrthancImporter(args.orthanc)
+    try:
+        downloaded, failures = download_all(entries, args.dest, args.workers,
+                                            importer if args.stream_import else None)
+        if importer is not None and not args.stream_import:
+            stats = importer.import_files(downloaded)
+            print(f"Imported to Orthanc: {stats.uploaded} files, {stats.skipped} already stored, {stats.failed} failed")
+            if stats.failed:
+                failures.append((f'import of {stats.failed} file(s)', 'failed'))
+    finally:
+        if importer is not None:
+            importer.close()
+    size = sum(os.path.getsize(p) for p in downloaded)
+    elapsed = time.perf_counter() - start
+    print(f"{len(downloaded)} of {len(entries)} files, {size / 1e6:.1f} MB in {elapsed:.1f}s "
+          f"({size / 1e6 / elapsed:.1f} MB/s)")
+    if failures:
+        sys.exit(1)
 
 
 if __name__ == '__main__':
     main()
-
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Serve synthetic DICOM whole slide images over a local DICOMweb server.
+
+Generates --slides tiled multi-level VL Whole Slide Microscopy series (see
+synthetic_wsi.py) and serves them until interrupted, adding --latency-ms
+(+ up to --jitter-ms) to every request. Prints the series URLs to use as
+series_path in /predict or as the DICOMweb root of the viewer proxy.
+With --write DIR the series are saved as .dcm files instead (e.g. for
+import into Orthanc with orthanc/import_dicom.py).
+
+Usage:
+  python scripts/synthetic_dicomweb.py --width 49152 --height 32768 --compression jpeg --latency-ms 20
+  python scripts/synthetic_dicomweb.py --slides 2 --organization TILED_SPARSE --port 8043
+  python scripts/synthetic_dicomweb.py --width 8192 --height 6144 --write ./synthetic_dicom
+"""
+
+import argparse
+import dataclasses
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import synthetic_wsi  # noqa: E402
+
+
+def add_slide_args(parser: argparse.ArgumentParser) -> None:
+    defaults = synthetic_wsi.SlideSpec()
+    parser.add_argument('--width', type=int, default=defaults.width, help='Level 0 width in pixels.')
+    parser.add_argument('--height', type=int, default=defaults.height, help='Level 0 height in pixels.')
+    parser.add_argument('--tile-size', type=int, default=defaults.tile_size)
+    parser.add_argument('--levels', type=int, default=defaults.levels, help='Pyramid levels, each half the previous.')
+    parser.add_argument('--compression', choices=sorted(synthetic_wsi.COMPRESSIONS), default=defaults.compression)
+    parser.add_argument('--organization', choices=synthetic_wsi.ORGANIZATIONS, default=defaults.organization)
+    parser.add_argument('--jpeg-quality', type=int, default=defaults.jpeg_quality)
+    parser.add_argument('--seed', type=int, default=defaults.seed, help='Seed of the first slide.')
+
+
+def slide_spec(args, seed_offset: int = 0) -> synthetic_wsi.SlideSpec:
+    return synthetic_wsi.SlideSpec(
+        width=args.width, height=args.height, tile_size=args.tile_size, levels=args.levels,
+        compression=args.compression, organization=args.organization, jpeg_quality=args.jpeg_quality,
+        seed=args.seed + seed_offset,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve synthetic DICOM WSI series over DICOMweb")
+    add_slide_args(parser)
+    parser.add_argument('--slides', type=int, default=1, help='Series to generate (seeds --seed, --seed+1, ...).')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8043)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Delay added to every request.')
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help='Extra uniform random delay per request.')
+    parser.add_argument('--write', metavar='DIR', help='Write the series as .dcm files instead of serving them.')
+    args = parser.parse_args()
+
+    slides = [synthetic_wsi.SyntheticSlide(slide_spec(args, i)) for i in range(args.slides)]
+    if args.write:
+        for slide in slides:
+            for path in slide.write(args.write):
+                print(path)
+        return
+
+    server = synthetic_wsi.DicomWebServer(slides, args.latency_ms, args.jitter_ms, args.host, args.port)
+    server.start()
+    print(f"DICOMweb root: {server.url}")
+    for slide in slides:
+        spec = dataclasses.asdict(slide.spec)
+        print(f"  {server.url}/{slide.series_path}")
+        print(f"    {spec['width']} x {spec['height']} px, {spec['levels']} levels of "
+              f"{[level.number_of_frames for level in slide.levels]} frames, "
+              f"{spec['compression']}, {spec['organization']}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Requests: {dict(server.requests)}, frames served: {server.frames_served}")
+        server.close()
+
+
+if __name__ == '__main__':
+    main()
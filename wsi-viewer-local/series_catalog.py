@@ -0,0 +1,448 @@
+"""
+Local SQLite catalog of the studies, series and instances stored in Orthanc.
+
+Listing series by walking Orthanc's REST API (/studies, then each study,
+series and instance) costs one round trip per resource. The catalog is
+built instead with a few paged bulk queries (/tools/find with Expand, one
+per level), asking for the whole slide geometry of every instance (image
+type, total pixel matrix, tile size, frame count) as RequestedTags, so
+pyramid levels and dimensions are known without touching the DICOM files
+again. orthanc.json declares those tags as ExtraMainDicomTags, so Orthanc
+answers from its index rather than reading the stored files.
+
+Afterwards sync() only replays Orthanc's change feed (/changes) since the
+last sequence number seen: new instances are described in bulk
+(/tools/bulk-content) and their series re-listed, deleted resources are
+dropped. Queries are then local SQLite reads, a few milliseconds each.
+
+Server workers share one catalog file. A sync takes a lease in the file, so
+the other processes skip theirs meanwhile, and writes happen in a BEGIN
+IMMEDIATE transaction which first checks that the stored change sequence is
+still the one the sync started from.
+"""
+
+import contextlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+CATALOG_PATH = os.environ.get('SERIES_CATALOG_PATH', os.path.join('~', '.cache', 'wsi-viewer', 'series_catalog.sqlite'))
+# Resources per /tools/find page and per /changes request
+_PAGE = 1000
+# Orthanc IDs or UIDs per bulk request
+_CHUNK = 200
+# A sync lease older than this is taken to belong to a dead process
+_SYNC_LEASE_SECONDS = 900
+
+# Instance tags describing the slide geometry (also ExtraMainDicomTags in orthanc.json)
+INSTANCE_TAGS = ['ImageType', 'TotalPixelMatrixColumns', 'TotalPixelMatrixRows', 'Columns', 'Rows', 'NumberOfFrames']
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS studies (
+    id TEXT PRIMARY KEY,
+    study_uid TEXT NOT NULL,
+    patient_id TEXT,
+    study_date TEXT,
+    description TEXT
+);
+CREATE TABLE IF NOT EXISTS series (
+    id TEXT PRIMARY KEY,
+    study_id TEXT NOT NULL,
+    series_uid TEXT NOT NULL,
+    modality TEXT,
+    description TEXT
+);
+CREATE TABLE IF NOT EXISTS instances (
+    id TEXT PRIMARY KEY,
+    series_id TEXT NOT NULL,
+    sop_uid TEXT NOT NULL,
+    image_type TEXT,
+    width INTEGER,
+    height INTEGER,
+    tile_width INTEGER,
+    tile_height INTEGER,
+    frames INTEGER
+);
+CREATE INDEX IF NOT EXISTS series_study ON series (study_id);
+CREATE INDEX IF NOT EXISTS series_uid ON series (series_uid);
+CREATE INDEX IF NOT EXISTS instances_series ON instances (series_id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _int(value: Any) -> Optional[int]:
+    try:
+        return int(str(value).split('\\')[0])
+    except (TypeError, ValueError):
+        return None
+
+
+def _tags(resource: Dict[str, Any]) -> Dict[str, Any]:
+    """Main DICOM tags merged with the RequestedTags of an expanded resource."""
+    return {**resource.get('MainDicomTags', {}), **resource.get('RequestedTags', {})}
+
+
+def _chunks(items: List[str], size: int = _CHUNK) -> Iterable[List[str]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class SeriesCatalog:
+    """SQLite index of an Orthanc server's DICOM resources, kept current incrementally.
+
+    Thread safe: reads use their own connection; syncs are serialized, across
+    processes sharing the catalog file as well.
+    """
+
+    def __init__(self, orthanc_url: str, path: str = CATALOG_PATH, timeout: float = 120.0) -> None:
+        self.orthanc_url = orthanc_url.rstrip('/')
+        self.path = os.path.expanduser(path)
+        self.timeout = timeout
+        self.requests = 0  # Orthanc round trips made by this instance
+        self._sync_lock = threading.Lock()
+        self._synced_at = 0.0
+        self._sync_thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()  # Guards _sync_thread
+        self._lease_owner = f'{os.getpid()}:{id(self)}'
+        self.sync_error: Optional[str] = None  # Of the last background sync
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as db:
+            db.executescript(_SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        db.row_factory = sqlite3.Row
+        try:
+            db.execute('PRAGMA journal_mode=WAL')
+            with db:  # One transaction, committed on success
+                yield db
+        finally:
+            db.close()
+
+    @contextlib.contextmanager
+    def _write(self):
+        """Connection in a BEGIN IMMEDIATE transaction: other processes cannot write until it ends."""
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        try:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                yield db
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+            db.execute('COMMIT')
+        finally:
+            db.close()
+
+    def close(self) -> None:
+        self._session.close()
+
+    def _get(self, path: str, **params) -> Any:
+        self.requests += 1
+        r = self._session.get(f'{self.orthanc_url}{path}', params=params, timeout=self.timeout)
+        r.raise_for_status()
+        return r.json()
+
+    def _post(self, path: str, body: Dict[str, Any]) -> Any:
+        self.requests += 1
+        r = self._session.post(f'{self.orthanc_url}{path}', json=body, timeout=self.timeout)
+        r.raise_for_status()
+        return r.json()
+
+    def _find(self, level: str, query: Optional[Dict[str, str]] = None,
+              requested_tags: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """All expanded resources of level matching query, fetched in pages."""
+        found = []
+        while True:
+            body = {'Level': level, 'Expand': True, 'Query': query or {}, 'Since': len(found), 'Limit': _PAGE}
+            if requested_tags:
+                body['RequestedTags'] = requested_tags
+            page = self._post('/tools/find', body)
+            found.extend(page)
+            if len(page) < _PAGE:
+                return found
+
+    def _describe(self, level: str, ids: List[str]) -> List[Dict[str, Any]]:
+        """Expanded resources by Orthanc ID, in bulk (one GET each before Orthanc 1.9.4)."""
+        described = []
+        for chunk in _chunks(ids):
+            try:
+                described.extend(self._post('/tools/bulk-content', {'Resources': chunk, 'Level': level}))
+            except requests.HTTPError as e:
+                if e.response is None or e.response.status_code != 404:
+                    raise
+                for orthanc_id in chunk:
+                    try:
+                        described.append(self._get(f'/{level.lower()}s/{orthanc_id}'))
+                    except requests.HTTPError as e:  # Deleted meanwhile
+                        if e.response is None or e.response.status_code != 404:
+                            raise
+        return described
+
+    # -- Writing ---------------------------------------------------------
+
+    @staticmethod
+    def _put_studies(db: sqlite3.Connection, studies: List[Dict[str, Any]]) -> None:
+        db.executemany('INSERT OR REPLACE INTO studies VALUES (?, ?, ?, ?, ?)', [
+            (s['ID'], _tags(s).get('StudyInstanceUID', ''), s.get('PatientMainDicomTags', {}).get('PatientID'),
+             _tags(s).get('StudyDate'), _tags(s).get('StudyDescription'))
+            for s in studies
+        ])
+
+    @staticmethod
+    def _put_series(db: sqlite3.Connection, series: List[Dict[str, Any]]) -> None:
+        db.executemany('INSERT OR REPLACE INTO series VALUES (?, ?, ?, ?, ?)', [
+            (s['ID'], s.get('ParentStudy', ''), _tags(s).get('SeriesInstanceUID', ''), _tags(s).get('Modality'),
+             _tags(s).get('SeriesDescription'))
+            for s in series
+        ])
+
+    @staticmethod
+    def _put_instances(db: sqlite3.Connection, instances: List[Dict[str, Any]]) -> None:
+        rows = []
+        for inst in instances:
+            tags = _tags(inst)
+            image_type = tags.get('ImageType')
+            if isinstance(image_type, list):
+                image_type = '\\'.join(image_type)
+            rows.append((
+                inst['ID'], inst.get('ParentSeries', ''), tags.get('SOPInstanceUID', ''), image_type,
+                _int(tags.get('TotalPixelMatrixColumns')), _int(tags.get('TotalPixelMatrixRows')),
+                _int(tags.get('Columns')), _int(tags.get('Rows')), _int(tags.get('NumberOfFrames')),
+            ))
+        db.executemany('INSERT OR REPLACE INTO instances VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    @staticmethod
+    def _delete(db: sqlite3.Connection, level: str, ids: List[str]) -> None:
+        """Deletes resources and their descendants."""
+        for chunk in _chunks(ids):
+            marks = ','.join('?' * len(chunk))
+            if level == 'Study':
+                db.execute(f'DELETE FROM instances WHERE series_id IN '
+                           f'(SELECT id FROM series WHERE study_id IN ({marks}))', chunk)
+                db.execute(f'DELETE FROM series WHERE study_id IN ({marks})', chunk)
+                db.execute(f'DELETE FROM studies WHERE id IN ({marks})', chunk)
+            elif level == 'Series':
+                db.execute(f'DELETE FROM instances WHERE series_id IN ({marks})', chunk)
+                db.execute(f'DELETE FROM series WHERE id IN ({marks})', chunk)
+            elif level == 'Instance':
+                db.execute(f'DELETE FROM instances WHERE id IN ({marks})', chunk)
+
+    @staticmethod
+    def _set_meta(db: sqlite3.Connection, **values) -> None:
+        db.executemany('INSERT OR REPLACE INTO meta VALUES (?, ?)', [(k, str(v)) for k, v in values.items()])
+
+    @staticmethod
+    def _read_meta(db: sqlite3.Connection, key: str) -> Optional[str]:
+        row = db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row['value'] if row else None
+
+    def _meta(self, key: str) -> Optional[str]:
+        with self._connect() as db:
+            return self._read_meta(db, key)
+
+    def _claim_lease(self) -> bool:
+        """Takes the catalog's sync lease; False while another process holds it."""
+        with self._write() as db:
+            lease = self._read_meta(db, 'sync_lease')
+            if lease:
+                holder, _, expires = lease.rpartition(' ')
+                if holder != self._lease_owner and float(expires) > time.time():
+                    return False
+            self._set_meta(db, sync_lease=f'{self._lease_owner} {time.time() + _SYNC_LEASE_SECONDS}')
+        return True
+
+    def _release_lease(self) -> None:
+        with self._write() as db:
+            db.execute("DELETE FROM meta WHERE key = 'sync_lease' AND value LIKE ?", (f'{self._lease_owner} %',))
+
+    def rebuild(self) -> Dict[str, int]:
+        """Replaces the catalog with a full listing of Orthanc (three paged bulk queries)."""
+        with self._sync_lock:
+            return self._rebuild()
+
+    def _rebuild(self) -> Dict[str, int]:
+        before = self._meta('last_change')
+        # Read the feed position first: changes made during the listing are replayed by the next sync
+        last = self._get('/changes', last='')['Last']
+        studies = self._find('Study')
+        series = self._find('Series')
+        instances = self._find('Instance', requested_tags=INSTANCE_TAGS)
+        with self._write() as db:
+            if self._read_meta(db, 'last_change') != before:
+                # Another process synced meanwhile; its catalog is at least as recent
+                self._synced_at = time.monotonic()
+                return {'studies': 0, 'series': 0, 'instances': 0, 'changes': 0}
+            db.execute('DELETE FROM instances')
+            db.execute('DELETE FROM series')
+            db.execute('DELETE FROM studies')
+            self._put_studies(db, studies)
+            self._put_series(db, series)
+            self._put_instances(db, instances)
+            self._set_meta(db, orthanc_url=self.orthanc_url, last_change=last)
+        self._synced_at = time.monotonic()
+        return {'studies': len(studies), 'series': len(series), 'instances': len(instances), 'changes': 0}
+
+    def sync(self) -> Dict[str, int]:
+        """Applies Orthanc's changes since the last sync; rebuilds a new or foreign catalog.
+
+        Returns zero counts without contacting Orthanc while another process
+        sharing the catalog file is syncing it.
+        """
+        with self._sync_lock:
+            if not self._claim_lease():
+                self._synced_at = time.monotonic()
+                return {'studies': 0, 'series': 0, 'instances': 0, 'changes': 0}
+            try:
+                last = self._meta('last_change')
+                if last is None or self._meta('orthanc_url') != self.orthanc_url:
+                    return self._rebuild()
+                return self._apply_changes(int(last))
+            finally:
+                self._release_lease()
+
+    def sync_in_background(self, max_age_seconds: float) -> bool:
+        """Starts sync in a thread unless this process synced within max_age_seconds.
+
+        Returns whether a sync is running; queries meanwhile read the catalog
+        as it is. Errors are logged and kept in sync_error.
+        """
+        with self._thread_lock:
+            if self._sync_thread is not None and self._sync_thread.is_alive():
+                return True
+            if time.monotonic() - self._synced_at < max_age_seconds:
+                return False
+            self._sync_thread = threading.Thread(target=self._background_sync, name='series-catalog-sync',
+                                                 daemon=True)
+            self._sync_thread.start()
+            return True
+
+    def _background_sync(self) -> None:
+        try:
+            self.sync()
+            self.sync_error = None
+        except (requests.RequestException, sqlite3.Error, ValueError) as e:
+            logging.warning('Series catalog sync failed: %s', e)
+            self.sync_error = str(e)
+
+    def _apply_changes(self, since: int) -> Dict[str, int]:
+        new_instances, deleted = set(), {'Study': set(), 'Series': set(), 'Instance': set()}
+        patient_deleted = False
+        changes = 0
+        last = since
+        while True:
+            page = self._get('/changes', since=last, limit=_PAGE)
+            for change in page.get('Changes', []):
+                changes += 1
+                kind, level, orthanc_id = change.get('ChangeType'), change.get('ResourceType'), change.get('ID')
+                if kind == 'NewInstance':
+                    new_instances.add(orthanc_id)
+                elif kind == 'Deleted':
+                    if level in deleted:
+                        deleted[level].add(orthanc_id)
+                        new_instances.discard(orthanc_id)
+                    elif level == 'Patient':
+                        patient_deleted = True
+            last = page.get('Last', last)
+            if page.get('Done', True):
+                break
+
+        # Series holding new instances are re-listed whole, with their study
+        instances = self._describe('Instance', sorted(new_instances))
+        series = self._describe('Series', sorted({i['ParentSeries'] for i in instances if i.get('ParentSeries')}))
+        studies = self._describe('Study', sorted({s['ParentStudy'] for s in series if s.get('ParentStudy')}))
+        listed = []
+        for chunk in _chunks(sorted({_tags(s).get('SeriesInstanceUID', '') for s in series} - {''})):
+            # Backslash separated values match any of them
+            listed.extend(self._find('Instance', {'SeriesInstanceUID': '\\'.join(chunk)}, INSTANCE_TAGS))
+        remaining_studies = self._get('/studies') if patient_deleted else None
+
+        with self._write() as db:
+            if self._read_meta(db, 'last_change') != str(since):
+                # Another process applied these changes meanwhile
+                self._synced_at = time.monotonic()
+                return {'studies': 0, 'series': 0, 'instances': 0, 'changes': 0}
+            for level, ids in deleted.items():
+                self._delete(db, level, sorted(ids))
+            if remaining_studies is not None:
+                # A patient deletion only names the patient: drop studies Orthanc no longer has
+                known = [row['id'] for row in db.execute('SELECT id FROM studies')]
+                self._delete(db, 'Study', sorted(set(known) - set(remaining_studies)))
+            self._put_studies(db, studies)
+            self._put_series(db, series)
+            self._put_instances(db, listed)
+            self._set_meta(db, last_change=last)
+        self._synced_at = time.monotonic()
+        return {'studies': len(studies), 'series': len(series), 'instances': len(listed), 'changes': changes}
+
+    # -- Queries ---------------------------------------------------------
+
+    def list_series(self, study_uid: Optional[str] = None, modality: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Series with their study, instance count and base (largest) level size."""
+        where, args = [], []
+        if study_uid:
+            where.append('st.study_uid = ?')
+            args.append(study_uid)
+        if modality:
+            where.append('se.modality = ?')
+            args.append(modality)
+        sql = f"""
+            SELECT st.study_uid, st.patient_id, st.study_date, se.series_uid, se.modality, se.description,
+                   COUNT(i.id) AS instances, MAX(i.width) AS width, MAX(i.height) AS height,
+                   SUM(i.image_type LIKE '%VOLUME%') AS levels
+            FROM series se JOIN studies st ON st.id = se.study_id LEFT JOIN instances i ON i.series_id = se.id
+            {'WHERE ' + ' AND '.join(where) if where else ''}
+            GROUP BY se.id ORDER BY st.study_date, st.study_uid, se.series_uid
+        """
+        with self._connect() as db:
+            rows = [dict(row) for row in db.execute(sql, args)]
+        for row in rows:
+            row['series_path'] = f"studies/{row['study_uid']}/series/{row['series_uid']}"
+        return rows
+
+    def levels(self, series_uid: str) -> List[Dict[str, Any]]:
+        """Pyramid levels (VOLUME instances, or all instances with a pixel matrix), largest first."""
+        with self._connect() as db:
+            rows = [dict(row) for row in db.execute("""
+                SELECT i.sop_uid, i.image_type, i.width, i.height, i.tile_width, i.tile_height, i.frames
+                FROM instances i JOIN series se ON se.id = i.series_id
+                WHERE se.series_uid = ? AND i.width IS NOT NULL
+                ORDER BY i.width DESC, i.sop_uid
+            """, (series_uid,))]
+        volume = [row for row in rows if 'VOLUME' in (row['image_type'] or '')]
+        return volume or rows
+
+    def any_series(self) -> Optional[Tuple[str, str, str]]:
+        """(study UID, series UID, instance UID) of a slide's base level, or of any instance."""
+        with self._connect() as db:
+            row = db.execute("""
+                SELECT st.study_uid, se.series_uid, i.sop_uid
+                FROM instances i JOIN series se ON se.id = i.series_id JOIN studies st ON st.id = se.study_id
+                ORDER BY i.width IS NULL, i.width DESC, st.study_uid, se.series_uid
+                LIMIT 1
+            """).fetchone()
+        return (row['study_uid'], row['series_uid'], row['sop_uid']) if row else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._connect() as db:
+            counts = {table: db.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                      for table in ('studies', 'series', 'instances')}
+        last = self._meta('last_change')
+        return {**counts, 'last_change': int(last) if last is not None else None, 'orthanc_requests': self.requests}
@@ -1,11 +1,21 @@
 import os
 import json
+import hashlib
 import http
-from typing import Optional
+import logging
+import re
+import threading
+import time
+from typing import Any, Dict, Optional
 
 from flask import Flask, Response, abort, request
 from flask_cors import CORS
 import requests
+from requests.adapters import HTTPAdapter
+
+import sampling_profiler
+import series_catalog
+import slide_tiles
 
 try:
     # Optional auth support if SERVICE_ACC_KEY is provided
@@ -43,12 +53,136 @@ def _refresh(creds: "service_account.Credentials") -> "service_account.Credentia
     return creds
 
 
-def create_app() -> Flask:
+# Seconds clients are told to wait (Retry-After) while the model is loading
+_RETRY_AFTER_SECONDS = int(os.environ.get('MEDSIGLIP_RETRY_AFTER_SECONDS', '10'))
+
+# Frames and bulk data of an instance never change for a given SOP Instance UID
+_IMMUTABLE_DICOM_PATH = re.compile(r'(^|/)instances/[^/]+/(frames/[^/]+(/rendered)?|bulkdata(/.*)?)$')
+_IMMUTABLE_MAX_AGE = int(os.environ.get('DICOM_PROXY_MAX_AGE', str(365 * 24 * 3600)))
+# Local slide tiles are revalidated (ETag) after this long, in case the file is replaced
+_TILE_MAX_AGE = int(os.environ.get('SLIDE_TILE_MAX_AGE', '3600'))
+# Upstream keep-alive connections kept per host, and (connect, read) timeouts
+_PROXY_POOL_SIZE = int(os.environ.get('DICOM_PROXY_POOL_SIZE', '32'))
+_PROXY_TIMEOUT = (
+    float(os.environ.get('DICOM_PROXY_CONNECT_TIMEOUT', '5')),
+    float(os.environ.get('DICOM_PROXY_READ_TIMEOUT', '60')),
+)
+
+# The series catalog replays Orthanc's change feed at most this often
+_CATALOG_SYNC_SECONDS = float(os.environ.get('SERIES_CATALOG_SYNC_SECONDS', '10'))
+
+
+def _proxy_session(pool_size: int = _PROXY_POOL_SIZE) -> requests.Session:
+    """Returns a session reusing upstream connections across proxy requests."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def immutable_etag(upstream_url: str, query: str) -> str:
+    """Strong ETag of an immutable DICOMweb resource, derived from its URL alone.
+
+    Lets conditional requests be answered without contacting the upstream.
+    """
+    digest = hashlib.sha256(f'{upstream_url}?{query}'.encode('utf-8')).hexdigest()[:32]
+    return f'"{digest}"'
+
+
+def _not_modified(etag: str) -> bool:
+    """True if the request's validators show the client holds the immutable resource."""
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or etag in tags or f'W/{etag}' in tags
+    # Any copy the client dated is still current, since the resource never changes
+    return 'If-Modified-Since' in request.headers
+
+
+class PredictorLoader:
+    """Loads and warms up a predictor in a background thread.
+
+    State is one of 'idle' (not started), 'loading', 'ready' or 'failed'.
+    start() is a no-op while loading or ready, and retries after a failure.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._state = 'idle'
+        self._error: Optional[str] = None
+        self._started_at: Optional[float] = None
+        self._load_seconds: Optional[float] = None
+        self._predictor = None
+
+    def start(self) -> None:
+        with self._lock:
+            if self._state in ('loading', 'ready'):
+                return
+            self._state = 'loading'
+            self._error = None
+            self._started_at = time.monotonic()
+        threading.Thread(target=self._load, name='predictor-warm-load', daemon=True).start()
+
+    def _load(self) -> None:
+        try:
+            predictor = self._factory()
+            predictor.warm_up()
+        except Exception as e:  # Reported through status(); /predict retries the load
+            logging.exception('Predictor warm load failed')
+            with self._lock:
+                self._state = 'failed'
+                self._error = str(e)
+            return
+        with self._lock:
+            self._predictor = predictor
+            self._load_seconds = time.monotonic() - self._started_at
+            self._state = 'ready'
+
+    @property
+    def predictor(self):
+        """Returns the predictor once ready, otherwise None."""
+        return self._predictor
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            status: Dict[str, Any] = {'state': self._state}
+            if self._state == 'loading':
+                status['loading_seconds'] = round(time.monotonic() - self._started_at, 1)
+            elif self._state == 'ready':
+                status['load_seconds'] = round(self._load_seconds, 1)
+            elif self._state == 'failed':
+                status['error'] = self._error
+            return status
+
+
+def _json_response(body: Dict[str, Any], status: int, headers: Optional[Dict[str, str]] = None) -> Response:
+    return Response(json.dumps(body), status=status, content_type='application/json', headers=headers)
+
+
+def create_app(warm_load: Optional[bool] = None, predictor_factory=None,
+               profiler: Optional[sampling_profiler.SamplingProfiler] = None) -> Flask:
+    """Creates the viewer app.
+
+    warm_load starts loading MedSigLIP in the background right away; defaults
+    to MEDSIGLIP_WARM_LOAD (on unless "0"). When off, the first /predict
+    starts the load. predictor_factory builds the predictor (default: an
+    in-process MedSigLIPPredictor; server_gunicorn passes a model host client).
+    profiler adds the /admin/profile endpoints (default: one from
+    PROFILER_TOKEN / PROFILE_HZ, none without a token).
+    """
+    if warm_load is None:
+        warm_load = os.environ.get('MEDSIGLIP_WARM_LOAD', '1') != '0'
     app = Flask(__name__, static_folder='web', static_url_path='')
     CORS(app)
+    profiler = profiler or sampling_profiler.from_env()
+    if profiler is not None:
+        sampling_profiler.install(app, profiler)
 
     DICOM_SERVER_URL = os.environ.get("DICOM_SERVER_URL", "")
     creds = _make_credentials()
+    upstream = _proxy_session()
 
     @app.route('/')
     def index():
@@ -81,6 +215,16 @@ def create_app() -> Flask:
             abort(http.HTTPStatus.BAD_REQUEST, "DICOM_SERVER_URL is not set.")
 
         full_url = f"{DICOM_SERVER_URL.rstrip('/')}/{url_path}"
+        immutable = _IMMUTABLE_DICOM_PATH.search(url_path) is not None
+        cache_headers = {}
+        if immutable:
+            cache_headers = {
+                'ETag': immutable_etag(full_url, request.query_string.decode('latin-1')),
+                # private: responses may depend on the caller's credentials
+                'Cache-Control': f'private, max-age={_IMMUTABLE_MAX_AGE}, immutable',
+            }
+            if _not_modified(cache_headers['ETag']):
+                return Response(status=http.HTTPStatus.NOT_MODIFIED, headers=cache_headers)
         headers = {}
 
         # If creds available, attach Bearer token
@@ -95,20 +239,98 @@ def create_app() -> Flask:
             headers['Authorization'] = f"Bearer {token}"
 
         try:
-            r = requests.get(full_url, params=request.args, headers=headers, timeout=60)
+            r = upstream.get(full_url, params=request.args, headers=headers, timeout=_PROXY_TIMEOUT)
             r.raise_for_status()
             content_type = r.headers.get('Content-Type', 'application/octet-stream')
-            return Response(r.content, status=r.status_code, content_type=content_type)
+            if immutable and 'Last-Modified' in r.headers:
+                cache_headers['Last-Modified'] = r.headers['Last-Modified']
+            return Response(r.content, status=r.status_code, content_type=content_type, headers=cache_headers)
         except requests.RequestException as e:
             abort(http.HTTPStatus.BAD_GATEWAY, f"Proxy error: {e}")
 
-    from predict_medsiglip import MedSigLIPPredictor
-    predictor: Optional[MedSigLIPPredictor] = None
+    slides = slide_tiles.shared_pool
 
-    def _ensure_predictor():
-        nonlocal predictor
-        if predictor is None:
-            predictor = MedSigLIPPredictor()
+    @app.route('/slides')
+    def slide_list():
+        # Local WSI files served as Deep Zoom without DICOM conversion
+        stats = slides.stats()
+        return _json_response({
+            'slides': slide_tiles.list_slides(slides.root),
+            'tile_cache': {
+                'hit_ratio': stats.hit_ratio,
+                'tiles': stats.tile_count,
+                'resident_bytes': stats.resident_bytes,
+                'max_bytes': stats.max_bytes,
+            },
+        }, http.HTTPStatus.OK)
+
+    @app.route('/slides/<path:name>.dzi')
+    def slide_dzi(name: str):
+        try:
+            dzi, _ = slides.dzi(name)
+        except slide_tiles.SlideNotFoundError:
+            abort(http.HTTPStatus.NOT_FOUND)
+        return Response(dzi, mimetype='application/xml', headers={'Cache-Control': 'no-cache'})
+
+    @app.route('/slides/<path:name>_files/<int:level>/<int:col>_<int:row>.<any(jpeg, png):fmt>')
+    def slide_tile(name: str, level: int, col: int, row: int, fmt: str):
+        try:
+            etag = slides.tile_etag(name, level, col, row, fmt)
+            headers = {'ETag': f'"{etag}"', 'Cache-Control': f'private, max-age={_TILE_MAX_AGE}'}
+            if request.if_none_match.contains(etag):
+                return Response(status=http.HTTPStatus.NOT_MODIFIED, headers=headers)
+            tile = slides.tile(name, level, col, row, fmt)
+        except slide_tiles.SlideNotFoundError:
+            abort(http.HTTPStatus.NOT_FOUND)
+        except ValueError:
+            abort(http.HTTPStatus.NOT_FOUND, 'No such tile')
+        return Response(tile, mimetype=f'image/{fmt}', headers=headers)
+
+    ORTHANC_URL = os.environ.get('ORTHANC_URL', '')
+    catalog = series_catalog.SeriesCatalog(ORTHANC_URL) if ORTHANC_URL else None
+
+    @app.route('/series')
+    def series_list():
+        # Series in Orthanc from the local catalog (optionally ?study=<StudyUID>&modality=SM)
+        if catalog is None:
+            return _json_response({'error': 'ORTHANC_URL is not set.'}, http.HTTPStatus.SERVICE_UNAVAILABLE)
+        # Syncs off the request thread; the listing is what the catalog holds meanwhile
+        syncing = catalog.sync_in_background(_CATALOG_SYNC_SECONDS)
+        series = catalog.list_series(request.args.get('study'), request.args.get('modality'))
+        synced = not syncing and catalog.sync_error is None
+        return _json_response({'series': series, 'synced': synced, 'syncing': syncing}, http.HTTPStatus.OK)
+
+    @app.route('/series/<series_uid>/levels')
+    def series_levels(series_uid: str):
+        if catalog is None:
+            return _json_response({'error': 'ORTHANC_URL is not set.'}, http.HTTPStatus.SERVICE_UNAVAILABLE)
+        levels = catalog.levels(series_uid)
+        if not levels:
+            abort(http.HTTPStatus.NOT_FOUND)
+        return _json_response({'levels': levels}, http.HTTPStatus.OK)
+
+    if predictor_factory is None:
+        from predict_medsiglip import MedSigLIPPredictor
+        predictor_factory = MedSigLIPPredictor
+    loader = PredictorLoader(predictor_factory)
+    if warm_load:
+        loader.start()
+
+    @app.route('/healthz')
+    def healthz():
+        # Process is up and serving the viewer / DICOM proxy; model may still be loading
+        return _json_response({'status': 'ok', 'model': loader.status()}, http.HTTPStatus.OK)
+
+    @app.route('/readyz')
+    def readyz():
+        status = loader.status()
+        if status['state'] == 'ready':
+            return _json_response({'status': 'ready', 'model': status}, http.HTTPStatus.OK)
+        return _json_response(
+            {'status': 'not ready', 'model': status},
+            http.HTTPStatus.SERVICE_UNAVAILABLE,
+            {'Retry-After': str(_RETRY_AFTER_SECONDS)},
+        )
 
     def _bearer_token():
         token = None
@@ -133,9 +355,29 @@ def create_app() -> Flask:
                 return path
         return path
 
-    @app.route('/predict', methods=['POST'])
-    def predict_route():
-        _ensure_predictor()
+    @app.route('/cache-stats')
+    def cache_stats():
+        # Per process; under server_gunicorn each worker reports its own caches
+        predictor = loader.predictor
+        if predictor is None:
+            return _json_response({'model': loader.status()}, http.HTTPStatus.SERVICE_UNAVAILABLE,
+                                  {'Retry-After': str(_RETRY_AFTER_SECONDS)})
+        return _json_response({
+            'frames': predictor.cache_stats(),
+            'embeddings': predictor.embedding_cache_stats(),
+        }, http.HTTPStatus.OK)
+
+    def _predict_request():
+        """Returns (predictor, body) for a prediction request; aborts with 503 while the model loads."""
+        predictor = loader.predictor
+        if predictor is None:
+            # Fail fast rather than holding the request while weights load
+            loader.start()
+            abort(_json_response(
+                {'error': 'Model is loading; retry later.', 'model': loader.status()},
+                http.HTTPStatus.SERVICE_UNAVAILABLE,
+                {'Retry-After': str(_RETRY_AFTER_SECONDS)},
+            ))
         try:
             body = request.get_json(force=True, silent=False)
         except Exception:
@@ -149,20 +391,42 @@ def create_app() -> Flask:
             d = inst.get('dicom_path') or inst
             if 'series_path' in d and isinstance(d['series_path'], str):
                 d['series_path'] = _rewrite_series_path(d['series_path'])
+        return predictor, body
+
+    @app.route('/predict', methods=['POST'])
+    def predict_route():
+        predictor, body = _predict_request()
 
         token = _bearer_token()
         try:
-            result = predictor.predict(body, token)  # type: ignore[arg-type]
+            result = predictor.predict(body, token)
         except Exception as e:
             abort(http.HTTPStatus.INTERNAL_SERVER_ERROR, f"Prediction error: {e}")
 
         # Return JSON directly (optionally gzip in future)
         return Response(json.dumps(result), status=200, content_type='application/json')
 
+    @app.route('/zero-shot', methods=['POST'])
+    def zero_shot_route():
+        # Body: predict's instances plus "prompts": [...] (and "include_scores")
+        predictor, body = _predict_request()
+        prompts = body.get('prompts')
+        if not isinstance(prompts, list) or not prompts or not all(isinstance(p, str) and p for p in prompts):
+            abort(http.HTTPStatus.BAD_REQUEST, 'prompts must be a non-empty list of strings')
+
+        token = _bearer_token()
+        try:
+            result = predictor.zero_shot(body, token)
+        except Exception as e:
+            abort(http.HTTPStatus.INTERNAL_SERVER_ERROR, f"Zero-shot error: {e}")
+        return Response(json.dumps(result), status=200, content_type='application/json')
+
     return app
 
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', '8081'))
-    app = create_app()
+    # With debug=True the reloader parent only watches files; load in the serving child
+    warm_load = None if os.environ.get('WERKZEUG_RUN_MAIN') == 'true' else False
+    app = create_app(warm_load=warm_load)
     app.run(host='0.0.0.0', port=port, debug=True)
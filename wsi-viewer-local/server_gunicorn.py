@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Production serving: gunicorn web workers plus one shared model host process.
+
+The model host (model_host.py) loads MedSigLIP once. Each gunicorn worker
+runs the Flask app from server.create_app, serving the viewer and DICOM
+proxy and fetching /predict patches itself, and sends patch pixels to the
+host through shared memory. Adding workers scales tile and proxy traffic
+without loading the model again.
+
+Environment:
+  PORT                 Listen port (default 8080).
+  WEB_WORKERS          gunicorn worker processes (default 4).
+  WEB_THREADS          Threads per worker (gthread; default 8).
+  MODEL_HOST_ADDRESS   Unix socket path of the model host (default: temp dir).
+  PROFILER_TOKEN       Enables the /admin/profile endpoints (sampling_profiler.py).
+  PROFILE_HZ           Continuous per route sampling rate (default 0: off).
+
+Usage:
+  python server_gunicorn.py [--profile-hz 10]
+"""
+
+import argparse
+import functools
+import os
+import subprocess
+import tempfile
+from typing import Any, Mapping, Optional
+
+from flask import Flask
+from gunicorn.app import base as gunicorn_base
+
+import model_host
+import sampling_profiler
+import server
+
+
+class ViewerApplication(gunicorn_base.BaseApplication):
+    """Serves the viewer app with gunicorn; the app is created per worker."""
+
+    def __init__(self, predictor_factory, options: Optional[Mapping[str, Any]] = None,
+                 profiler: Optional[sampling_profiler.SamplingProfiler] = None):
+        self.options = dict(options or {})
+        # Created after fork so each worker starts its own warm-load thread
+        self.options['preload_app'] = False
+        self._predictor_factory = predictor_factory
+        self._profiler = profiler
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key.lower(), value)
+
+    def load(self) -> Flask:
+        return server.create_app(warm_load=True, predictor_factory=self._predictor_factory, profiler=self._profiler)
+
+
+def _stop_host(host, address: str) -> None:
+    host.terminate()
+    try:
+        host.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        host.kill()
+    if os.path.exists(address):
+        os.unlink(address)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve the viewer with gunicorn workers and a model host")
+    parser.add_argument('--profile-hz', type=float, default=None,
+                        help='Continuous per route sampling rate (overrides PROFILE_HZ; needs PROFILER_TOKEN).')
+    args = parser.parse_args()
+    address = os.environ.get(
+        'MODEL_HOST_ADDRESS', os.path.join(tempfile.gettempdir(), f'medsiglip-host-{os.getpid()}.sock'))
+    authkey = os.urandom(32)
+    host = model_host.start_host_process(address, authkey)
+    options = {
+        'bind': f"0.0.0.0:{int(os.environ.get('PORT', '8080'))}",
+        'workers': int(os.environ.get('WEB_WORKERS', '4')),
+        'worker_class': 'gthread',
+        'threads': int(os.environ.get('WEB_THREADS', '8')),
+        'timeout': 600,
+        # Runs in the gunicorn master only, not in exiting workers
+        'on_exit': lambda arbiter: _stop_host(host, address),
+    }
+    ViewerApplication(functools.partial(model_host.ModelHostPredictor, address, authkey), options,
+                      sampling_profiler.from_env(args.profile_hz)).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+"""
+Deep Zoom tiles and patches read directly from local WSI files (SVS, TIFF, ...).
+
+Slides under SLIDE_DIR are opened with OpenSlide (openslide.open_slide, which
+falls back to PIL for plain images), so they can be viewed and embedded
+without converting them to DICOM and importing them into Orthanc.
+
+Open slides are kept in a small LRU pool of handles shared by the tile
+routes and the predictors; an evicted handle is closed once the last reader
+using it returns it. Encoded tiles (JPEG/PNG bytes) are kept in a byte
+bounded LRU, keyed by slide, file version and tile address, so panning back
+over a region does not re-read and re-encode tiles.
+"""
+
+import collections
+import contextlib
+import dataclasses
+import hashlib
+import io
+import os
+import threading
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+SLIDE_DIR = os.environ.get('SLIDE_DIR', 'data')
+_DEFAULT_MAX_HANDLES = int(os.environ.get('SLIDE_HANDLE_POOL_SIZE', '16'))
+_DEFAULT_TILE_CACHE_BYTES = int(os.environ.get('SLIDE_TILE_CACHE_BYTES', str(256 * 1024 * 1024)))
+# Deep Zoom tile geometry and JPEG quality
+_TILE_SIZE = int(os.environ.get('SLIDE_TILE_SIZE', '254'))
+_TILE_OVERLAP = int(os.environ.get('SLIDE_TILE_OVERLAP', '1'))
+_JPEG_QUALITY = int(os.environ.get('SLIDE_JPEG_QUALITY', '80'))
+
+SLIDE_EXTENSIONS = ('.svs', '.tif', '.tiff', '.ndpi', '.vms', '.vmu', '.scn', '.mrxs', '.svslide', '.bif')
+TILE_FORMATS = ('jpeg', 'png')
+
+# Pixel shortfall tolerated on a coarser level, since pyramid level sizes are rounded
+_LEVEL_TOLERANCE = 0.01
+
+
+class SlideNotFoundError(LookupError):
+    """Raised for names that are not slide files under the slide directory."""
+
+
+def resolve_slide(root: str, name: str) -> str:
+    """Returns the real path of slide name under root, refusing paths outside it."""
+    root = os.path.realpath(root)
+    path = os.path.realpath(os.path.join(root, name))
+    if (not path.startswith(root + os.sep) or not path.lower().endswith(SLIDE_EXTENSIONS)
+            or not os.path.isfile(path)):
+        raise SlideNotFoundError(name)
+    return path
+
+
+def list_slides(root: str = SLIDE_DIR) -> List[str]:
+    """Returns the slide file names directly in root, sorted.
+
+    Not recursive: root may also hold large trees such as Orthanc's storage.
+    Slides in subdirectories can still be opened by relative path.
+    """
+    try:
+        entries = list(os.scandir(root))
+    except FileNotFoundError:
+        return []
+    return sorted(e.name for e in entries if e.is_file() and e.name.lower().endswith(SLIDE_EXTENSIONS))
+
+
+@dataclasses.dataclass(frozen=True)
+class TileCacheStats:
+    """Point in time cache statistics."""
+
+    hits: int
+    misses: int
+    tile_count: int
+    resident_bytes: int
+    max_bytes: int
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class EncodedTileCache:
+    """Thread safe, byte bounded LRU of encoded tiles."""
+
+    def __init__(self, max_bytes: int = _DEFAULT_TILE_CACHE_BYTES):
+        self._max_bytes = max(0, max_bytes)
+        self._tiles = collections.OrderedDict()
+        self._resident_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[bytes]:
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is None:
+                self._misses += 1
+                return None
+            self._tiles.move_to_end(key)
+            self._hits += 1
+            return tile
+
+    def put(self, key: tuple, tile: bytes) -> None:
+        if len(tile) > self._max_bytes:
+            return
+        with self._lock:
+            previous = self._tiles.pop(key, None)
+            if previous is not None:
+                self._resident_bytes -= len(previous)
+            self._tiles[key] = tile
+            self._resident_bytes += len(tile)
+            while self._resident_bytes > self._max_bytes:
+                _, evicted = self._tiles.popitem(last=False)
+                self._resident_bytes -= len(evicted)
+
+    def stats(self) -> TileCacheStats:
+        with self._lock:
+            return TileCacheStats(
+                hits=self._hits,
+                misses=self._misses,
+                tile_count=len(self._tiles),
+                resident_bytes=self._resident_bytes,
+                max_bytes=self._max_bytes,
+            )
+
+
+class _Handle:
+    """An open slide, its Deep Zoom generator and the readers using it."""
+
+    def __init__(self, path: str, tile_size: int, overlap: int):
+        import openslide  # Native library; only needed once a slide is opened
+        from openslide import deepzoom
+        stat = os.stat(path)
+        self.path = path
+        # Identifies the file version in tile keys and ETags
+        self.version = f'{stat.st_mtime_ns}-{stat.st_size}'
+        self.slide = openslide.open_slide(path)
+        self.deepzoom = deepzoom.DeepZoomGenerator(self.slide, tile_size=tile_size, overlap=overlap,
+                                                   limit_bounds=False)
+        self.users = 0
+        self.evicted = False
+
+
+class SlideHandlePool:
+    """LRU pool of open slides under a root directory, with an encoded tile cache.
+
+    Slides are addressed by their path relative to root. OpenSlide handles
+    are safe to read from several threads, so one handle per slide is shared.
+    """
+
+    def __init__(
+        self,
+        root: str = SLIDE_DIR,
+        max_handles: int = _DEFAULT_MAX_HANDLES,
+        tiles: Optional[EncodedTileCache] = None,
+        tile_size: int = _TILE_SIZE,
+        overlap: int = _TILE_OVERLAP,
+    ) -> None:
+        self.root = root
+        self._max_handles = max(1, max_handles)
+        self._tiles = tiles if tiles is not None else EncodedTileCache()
+        self._tile_size = tile_size
+        self._overlap = overlap
+        self._handles = collections.OrderedDict()  # real path -> _Handle
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def slide(self, name: str) -> Iterator[_Handle]:
+        """Yields the open handle of slide name, opening it if needed."""
+        path = resolve_slide(self.root, name)
+        handle = self._acquire(path)
+        try:
+            yield handle
+        finally:
+            self._release(handle)
+
+    def _acquire(self, path: str) -> _Handle:
+        with self._lock:
+            handle = self._handles.get(path)
+            if handle is not None:
+                self._handles.move_to_end(path)
+                handle.users += 1
+                return handle
+        # Open outside the lock; a concurrent open of the same slide is discarded
+        opened = _Handle(path, self._tile_size, self._overlap)
+        with self._lock:
+            handle = self._handles.get(path)
+            if handle is None:
+                handle = self._handles[path] = opened
+                opened = None
+                while len(self._handles) > self._max_handles:
+                    _, evicted = self._handles.popitem(last=False)
+                    evicted.evicted = True
+                    if evicted.users == 0:
+                        evicted.slide.close()
+            else:
+                self._handles.move_to_end(path)
+            handle.users += 1
+        if opened is not None:
+            opened.slide.close()
+        return handle
+
+    def _release(self, handle: _Handle) -> None:
+        with self._lock:
+            handle.users -= 1
+            close = handle.evicted and handle.users == 0
+        if close:
+            handle.slide.close()
+
+    def dzi(self, name: str, tile_format: str = 'jpeg') -> Tuple[str, str]:
+        """Returns (Deep Zoom descriptor XML, file version) of slide name."""
+        with self.slide(name) as handle:
+            return handle.deepzoom.get_dzi(tile_format), handle.version
+
+    def tile_etag(self, name: str, level: int, col: int, row: int, tile_format: str) -> str:
+        """ETag value (unquoted) of a tile, changing whenever the slide file changes."""
+        with self.slide(name) as handle:
+            key = f'{handle.path}|{handle.version}|{level}|{col}|{row}|{tile_format}'
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+    def tile(self, name: str, level: int, col: int, row: int, tile_format: str = 'jpeg') -> bytes:
+        """Returns an encoded Deep Zoom tile; ValueError if it does not exist."""
+        if tile_format not in TILE_FORMATS:
+            raise ValueError(f'Unsupported tile format {tile_format!r}')
+        with self.slide(name) as handle:
+            key = (handle.path, handle.version, level, col, row, tile_format)
+            data = self._tiles.get(key)
+            if data is not None:
+                return data
+            image = handle.deepzoom.get_tile(level, (col, row))
+        buf = io.BytesIO()
+        if tile_format == 'jpeg':
+            image.convert('RGB').save(buf, 'JPEG', quality=_JPEG_QUALITY)
+        else:
+            image.save(buf, 'PNG')
+        data = buf.getvalue()
+        self._tiles.put(key, data)
+        return data
+
+    def read_region(
+        self, name: str, x: int, y: int, width: int, height: int,
+        min_size: Optional[Tuple[int, int]] = None,
+    ) -> np.ndarray:
+        """Returns a level 0 rectangle of slide name as (H, W, 3) uint8 RGB.
+
+        With min_size (height, width), the rectangle is read from the coarsest
+        level on which it still spans min_size pixels, so H, W are the
+        rectangle's size on that level. Pixels outside the slide are 0.
+        """
+        with self.slide(name) as handle:
+            slide = handle.slide
+            level, downsample = 0, 1.0
+            if min_size is not None:
+                max_downsample = min(width / min_size[1], height / min_size[0]) / (1 - _LEVEL_TOLERANCE)
+                level = slide.get_best_level_for_downsample(max(1.0, max_downsample))
+                downsample = float(slide.level_downsamples[level])
+            size = (max(1, int(round(width / downsample))), max(1, int(round(height / downsample))))
+            region = slide.read_region((int(x), int(y)), level, size)
+        # RGBA with alpha 0 (and RGB 0) outside the scanned area
+        return np.asarray(region)[..., :3].copy()
+
+    def stats(self) -> TileCacheStats:
+        return self._tiles.stats()
+
+
+# Process wide pool shared by the tile routes and predictors.
+shared_pool = SlideHandlePool()
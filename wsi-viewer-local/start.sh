@@ -7,6 +7,11 @@ mkdir -p /data/db /data/import
 echo "Starting Orthanc..."
 orthanc /etc/orthanc/orthanc.json &
 
+if [ "${SERVER_MODE:-development}" = "production" ]; then
+  echo "Starting viewer (gunicorn workers + model host) on port ${PORT:-8080}..."
+  exec python3 /app/server_gunicorn.py
+fi
+
 echo "Starting Flask viewer on port ${PORT:-8080}..."
 exec python3 /app/server.py
 
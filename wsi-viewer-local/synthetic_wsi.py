@@ -0,0 +1,437 @@
+"""
+Synthetic DICOM whole slide images served by a local DICOMweb server.
+
+SyntheticSlide describes a VL Whole Slide Microscopy series (one instance
+per pyramid level, each level half the size of the previous) of any size,
+tile size, compression and frame organization:
+
+  TILED_FULL    every tile of the total pixel matrix, in row-major order.
+  TILED_SPARSE  only tiles touching the tissue (an ellipse inscribed in the
+                slide), each positioned by PerFrameFunctionalGroupsSequence.
+
+Pixels are a deterministic function of level 0 coordinates (smooth stain-like
+colour waves plus hashed noise inside the tissue, white outside), so any
+region can be recomputed with expected_region() to check what a reader
+returned. Frames are encoded on first use and kept in a small LRU, so
+large slides cost nothing until read; write() saves the series as .dcm files
+(e.g. to import into Orthanc).
+
+DicomWebServer answers the QIDO-RS and WADO-RS requests ez-wsi-dicomweb
+makes (series/instance searches, metadata, frames as multipart/related,
+whole instances) with an injectable per-request latency, and counts them.
+Needs pydicom and Pillow (openjpeg for jpeg2000).
+"""
+
+import collections
+import dataclasses
+import functools
+import http
+import io
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+from PIL import Image
+import pydicom
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.encaps import encapsulate
+from pydicom.sequence import Sequence as DicomSequence
+from pydicom.uid import generate_uid
+
+VL_WHOLE_SLIDE_MICROSCOPY = '1.2.840.10008.5.1.4.1.1.77.1.6'
+EXPLICIT_VR_LITTLE_ENDIAN = '1.2.840.10008.1.2.1'
+# compression -> (transfer syntax, photometric interpretation)
+COMPRESSIONS = {
+    'none': (EXPLICIT_VR_LITTLE_ENDIAN, 'RGB'),
+    'jpeg': ('1.2.840.10008.1.2.4.50', 'YBR_FULL_422'),
+    'jpeg2000': ('1.2.840.10008.1.2.4.90', 'RGB'),  # Lossless
+}
+ORGANIZATIONS = ('TILED_FULL', 'TILED_SPARSE')
+
+# Encoded frames kept per slide
+_FRAME_CACHE_SIZE = int(os.environ.get('SYNTHETIC_WSI_FRAME_CACHE', '4096'))
+_BACKGROUND = 240
+_PADDING = 255  # Frame pixels past the edge of the total pixel matrix
+_PIXEL_SPACING_MM = 0.00025  # 0.25 um per level 0 pixel
+
+
+@dataclasses.dataclass(frozen=True)
+class SlideSpec:
+    width: int = 16384
+    height: int = 12288
+    tile_size: int = 256
+    levels: int = 4
+    compression: str = 'jpeg'
+    organization: str = 'TILED_FULL'
+    jpeg_quality: int = 85
+    noise: int = 12  # Amplitude of the per pixel noise
+    seed: int = 0
+
+    def __post_init__(self):
+        if self.compression not in COMPRESSIONS:
+            raise ValueError(f'compression must be one of {", ".join(COMPRESSIONS)}')
+        if self.organization not in ORGANIZATIONS:
+            raise ValueError(f'organization must be one of {", ".join(ORGANIZATIONS)}')
+        if min(self.width, self.height, self.tile_size, self.levels) < 1:
+            raise ValueError('width, height, tile_size and levels must be positive')
+
+
+def _in_tissue(xs: np.ndarray, ys: np.ndarray, width: int, height: int) -> np.ndarray:
+    return ((xs / width - 0.5) ** 2 + (ys / height - 0.5) ** 2) < 0.2
+
+
+def slide_pixels(spec: SlideSpec, x: int, y: int, width: int, height: int, downsample: int = 1) -> np.ndarray:
+    """RGB uint8 pixels of a rectangle of the level with this downsample (level coordinates)."""
+    xs = (np.arange(x, x + width, dtype=np.int64) * downsample)[None, :]
+    ys = (np.arange(y, y + height, dtype=np.int64) * downsample)[:, None]
+    noise = ((xs * 73856093) ^ (ys * 19349663) ^ (spec.seed * 83492791)) % (2 * spec.noise + 1) - spec.noise
+    out = np.empty((height, width, 3), dtype=np.uint8)
+    waves = (
+        200 + 40 * np.sin(xs / 97.0 + ys / 131.0),
+        120 + 60 * np.sin(xs / 53.0 - ys / 71.0),
+        190 + 40 * np.cos(xs / 113.0 + ys / 37.0),
+    )
+    tissue = _in_tissue(xs, ys, spec.width, spec.height)
+    for channel, wave in enumerate(waves):
+        out[..., channel] = np.where(tissue, np.clip(wave + noise, 0, 255), _BACKGROUND)
+    return out
+
+
+@dataclasses.dataclass(frozen=True)
+class Level:
+    index: int
+    downsample: int
+    width: int
+    height: int
+    sop_instance_uid: str
+    tiles: Tuple[Tuple[int, int], ...]  # (column, row) of each frame, in frame order
+
+    @property
+    def number_of_frames(self) -> int:
+        return len(self.tiles)
+
+
+class SyntheticSlide:
+    """A synthetic VL Whole Slide Microscopy series; frames are encoded on first use."""
+
+    def __init__(self, spec: SlideSpec, study_uid: Optional[str] = None, series_uid: Optional[str] = None) -> None:
+        self.spec = spec
+        # UIDs derived from the spec, so the same spec always gives the same series
+        key = repr(spec)
+        self.study_uid = study_uid or generate_uid(entropy_srcs=[key, 'study'])
+        self.series_uid = series_uid or generate_uid(entropy_srcs=[key, 'series'])
+        self.levels: List[Level] = []
+        tile = spec.tile_size
+        for index in range(spec.levels):
+            downsample = 2 ** index
+            width, height = -(-spec.width // downsample), -(-spec.height // downsample)
+            cols, rows = -(-width // tile), -(-height // tile)
+            tiles = [(c, r) for r in range(rows) for c in range(cols)]
+            if spec.organization == 'TILED_SPARSE':
+                tiles = [(c, r) for c, r in tiles if self._touches_tissue(c, r, downsample)] or tiles[:1]
+            self.levels.append(Level(index, downsample, width, height,
+                                     generate_uid(entropy_srcs=[key, 'instance', str(index)]), tuple(tiles)))
+        self._by_uid = {level.sop_instance_uid: level for level in self.levels}
+        self.frame = functools.lru_cache(maxsize=_FRAME_CACHE_SIZE)(self._encode_frame)
+
+    def _touches_tissue(self, col: int, row: int, downsample: int) -> bool:
+        size = self.spec.tile_size * downsample
+        xs = np.linspace(col * size, (col + 1) * size, 5)[None, :]
+        ys = np.linspace(row * size, (row + 1) * size, 5)[:, None]
+        return bool(_in_tissue(xs, ys, self.spec.width, self.spec.height).any())
+
+    @property
+    def series_path(self) -> str:
+        return f'studies/{self.study_uid}/series/{self.series_uid}'
+
+    @property
+    def transfer_syntax_uid(self) -> str:
+        return COMPRESSIONS[self.spec.compression][0]
+
+    def level(self, sop_instance_uid: str) -> Optional[Level]:
+        return self._by_uid.get(sop_instance_uid)
+
+    def frame_pixels(self, level: Level, number: int) -> np.ndarray:
+        """Decoded pixels of 1-based frame number of level, padded past the image edge."""
+        col, row = level.tiles[number - 1]
+        tile = self.spec.tile_size
+        x, y = col * tile, row * tile
+        out = np.full((tile, tile, 3), _PADDING, dtype=np.uint8)
+        w, h = min(tile, level.width - x), min(tile, level.height - y)
+        out[:h, :w] = slide_pixels(self.spec, x, y, w, h, level.downsample)
+        return out
+
+    def _encode_frame(self, sop_instance_uid: str, number: int) -> bytes:
+        """Encoded bytes of 1-based frame number of an instance (memoized as frame())."""
+        pixels = self.frame_pixels(self._by_uid[sop_instance_uid], number)
+        if self.spec.compression == 'none':
+            return pixels.tobytes()
+        buffer = io.BytesIO()
+        if self.spec.compression == 'jpeg':
+            Image.fromarray(pixels).save(buffer, format='JPEG', quality=self.spec.jpeg_quality)
+        else:
+            Image.fromarray(pixels).save(buffer, format='JPEG2000', irreversible=False)
+        return buffer.getvalue()
+
+    def expected_region(self, level: Level, x: int, y: int, width: int, height: int) -> np.ndarray:
+        """Pixels a lossless reader should return for a rectangle inside level."""
+        return slide_pixels(self.spec, x, y, width, height, level.downsample)
+
+    def dataset(self, level: Level, per_frame: bool = True) -> Dataset:
+        """The instance of a level without pixel data (per_frame=False also leaves out frame positions)."""
+        spec = self.spec
+        ds = Dataset()
+        ds.SOPClassUID = VL_WHOLE_SLIDE_MICROSCOPY
+        ds.SOPInstanceUID = level.sop_instance_uid
+        ds.StudyInstanceUID = self.study_uid
+        ds.SeriesInstanceUID = self.series_uid
+        ds.Modality = 'SM'
+        ds.PatientID = f'SYNTHETIC-{spec.seed}'
+        ds.PatientName = 'Synthetic^Slide'
+        ds.StudyID = '1'
+        ds.SeriesNumber = 1
+        ds.InstanceNumber = level.index + 1
+        ds.ContainerIdentifier = f'SYNTHETIC-{spec.seed}'
+        ds.ImageType = (['ORIGINAL', 'PRIMARY', 'VOLUME', 'NONE'] if level.index == 0
+                        else ['DERIVED', 'PRIMARY', 'VOLUME', 'RESAMPLED'])
+        ds.Rows = ds.Columns = spec.tile_size
+        ds.TotalPixelMatrixColumns = level.width
+        ds.TotalPixelMatrixRows = level.height
+        ds.TotalPixelMatrixFocalPlanes = 1
+        ds.NumberOfFrames = level.number_of_frames
+        ds.SamplesPerPixel = 3
+        ds.PhotometricInterpretation = COMPRESSIONS[spec.compression][1]
+        ds.PlanarConfiguration = 0
+        ds.BitsAllocated = ds.BitsStored = 8
+        ds.HighBit = 7
+        ds.PixelRepresentation = 0
+        ds.DimensionOrganizationType = spec.organization
+        spacing = _PIXEL_SPACING_MM * level.downsample
+        ds.ImagedVolumeWidth = spec.width * _PIXEL_SPACING_MM
+        ds.ImagedVolumeHeight = spec.height * _PIXEL_SPACING_MM
+        ds.ImagedVolumeDepth = 0.001
+        measures = Dataset()
+        measures.PixelSpacing = [spacing, spacing]
+        measures.SliceThickness = 0.001
+        shared = Dataset()
+        shared.PixelMeasuresSequence = DicomSequence([measures])
+        ds.SharedFunctionalGroupsSequence = DicomSequence([shared])
+        if spec.organization == 'TILED_SPARSE' and per_frame:
+            frames = []
+            for col, row in level.tiles:
+                position = Dataset()
+                position.ColumnPositionInTotalImagePixelMatrix = col * spec.tile_size + 1
+                position.RowPositionInTotalImagePixelMatrix = row * spec.tile_size + 1
+                position.XOffsetInSlideCoordinateSystem = col * spec.tile_size * spacing
+                position.YOffsetInSlideCoordinateSystem = row * spec.tile_size * spacing
+                position.ZOffsetInSlideCoordinateSystem = 0.0
+                item = Dataset()
+                item.PlanePositionSlideSequence = DicomSequence([position])
+                frames.append(item)
+            ds.PerFrameFunctionalGroupsSequence = DicomSequence(frames)
+        return ds
+
+    def metadata(self, level: Level, per_frame: bool = True) -> Dict[str, Any]:
+        """DICOM JSON of a level's instance, including its transfer syntax."""
+        tags = self.dataset(level, per_frame).to_json_dict()
+        tags['00020010'] = {'vr': 'UI', 'Value': [self.transfer_syntax_uid]}
+        return tags
+
+    def instance_bytes(self, level: Level) -> bytes:
+        """The level as a DICOM Part 10 file."""
+        ds = self.dataset(level)
+        ds.file_meta = FileMetaDataset()
+        ds.file_meta.MediaStorageSOPClassUID = VL_WHOLE_SLIDE_MICROSCOPY
+        ds.file_meta.MediaStorageSOPInstanceUID = level.sop_instance_uid
+        ds.file_meta.TransferSyntaxUID = self.transfer_syntax_uid
+        frames = [self.frame(level.sop_instance_uid, n) for n in range(1, level.number_of_frames + 1)]
+        if self.spec.compression == 'none':
+            ds.PixelData = b''.join(frames)
+        else:
+            ds.PixelData = encapsulate(frames)
+        buffer = io.BytesIO()
+        pydicom.dcmwrite(buffer, ds, enforce_file_format=True)
+        return buffer.getvalue()
+
+    def write(self, folder: str) -> List[str]:
+        """Writes one .dcm file per level into folder; returns their paths."""
+        os.makedirs(folder, exist_ok=True)
+        paths = []
+        for level in self.levels:
+            path = os.path.join(folder, f'{self.series_uid}-{level.index}.dcm')
+            with open(path, 'wb') as f:
+                f.write(self.instance_bytes(level))
+            paths.append(path)
+        return paths
+
+
+_STUDY_TAGS = ('00080020', '00080050', '00100010', '00100020', '00200010', '0020000D')
+_SERIES_TAGS = ('00080060', '0020000D', '0020000E', '00200011')
+_PER_FRAME = '52009230'
+_BOUNDARY = 'synthetic-wsi-frame-boundary'
+_ROUTE = re.compile(
+    r'^/studies(?:/(?P<study>[^/]+)(?:/series(?:/(?P<series>[^/]+)'
+    r'(?:/instances(?:/(?P<instance>[^/]+)(?:/frames/(?P<frames>[0-9,]+))?)?|/(?P<series_metadata>metadata))?)?)?)?'
+    r'(?P<metadata>/metadata)?$'
+)
+
+
+class DicomWebServer:
+    """Serves SyntheticSlides over DICOMweb on a local port, sleeping latency (+ jitter) per request.
+
+    Counts requests by kind ('studies', 'series', 'instances', 'metadata',
+    'frames', 'instance') and frames served.
+    """
+
+    def __init__(self, slides: Iterable[SyntheticSlide], latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 host: str = '127.0.0.1', port: int = 0, seed: int = 0) -> None:
+        self.slides = {(s.study_uid, s.series_uid): s for s in slides}
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.requests = collections.Counter()
+        self.frames_served = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                server._handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """DICOMweb root, e.g. http://127.0.0.1:PORT/dicomWeb."""
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}/dicomWeb'
+
+    def start(self) -> 'DicomWebServer':
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='synthetic-dicomweb', daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> 'DicomWebServer':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _count(self, kind: str, frames: int = 0) -> None:
+        with self._lock:
+            self.requests[kind] += 1
+            self.frames_served += frames
+            delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            time.sleep(delay)
+
+    @staticmethod
+    def _send(handler: BaseHTTPRequestHandler, status: int, body: bytes, content_type: str) -> None:
+        handler.send_response(status)
+        handler.send_header('Content-Type', content_type)
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def _json(self, handler, items: List[Dict[str, Any]]) -> None:
+        if not items:
+            self._send(handler, http.HTTPStatus.NO_CONTENT, b'', 'application/dicom+json')
+            return
+        self._send(handler, http.HTTPStatus.OK, json.dumps(items).encode(), 'application/dicom+json')
+
+    def _handle(self, handler: BaseHTTPRequestHandler) -> None:
+        url = urlparse(handler.path)
+        path = url.path[len('/dicomWeb'):] if url.path.startswith('/dicomWeb') else url.path
+        query = parse_qs(url.query)
+        match = _ROUTE.match(path)
+        if not match:
+            self._send(handler, http.HTTPStatus.NOT_FOUND, b'', 'text/plain')
+            return
+        study, series, instance, frames = match.group('study', 'series', 'instance', 'frames')
+        slides = [s for (st, se), s in self.slides.items()
+                  if (study is None or st == study) and (series is None or se == series)]
+        if not slides:
+            self._count('not_found')
+            self._send(handler, http.HTTPStatus.NOT_FOUND, b'', 'text/plain')
+            return
+
+        if frames is not None:
+            self._frames(handler, slides[0], instance, [int(n) for n in frames.split(',') if n])
+            return
+        if instance is not None and not match.group('metadata'):
+            level = slides[0].level(instance)
+            self._count('instance')
+            if level is None:
+                self._send(handler, http.HTTPStatus.NOT_FOUND, b'', 'text/plain')
+                return
+            self._send(handler, http.HTTPStatus.OK, slides[0].instance_bytes(level), 'application/dicom')
+            return
+        if match.group('metadata') or match.group('series_metadata'):
+            self._count('metadata')
+            levels = [(s, lv) for s in slides for lv in s.levels if instance is None or lv.sop_instance_uid == instance]
+            self._json(handler, [s.metadata(lv) for s, lv in levels])
+            return
+
+        # QIDO-RS searches; PerFrameFunctionalGroupsSequence only if asked for
+        includes = {f for value in query.get('includefield', []) for f in value.split(',')}
+        per_frame = 'all' in includes or _PER_FRAME in includes
+        if series is not None and path.endswith('/instances'):
+            self._count('instances')
+            wanted = set(query.get('SOPInstanceUID', []))
+            self._json(handler, [s.metadata(lv, per_frame) for s in slides for lv in s.levels
+                                 if not wanted or lv.sop_instance_uid in wanted])
+        elif study is not None and path.endswith('/series'):
+            self._count('series')
+            self._json(handler, [{k: v for k, v in s.metadata(s.levels[0], False).items() if k in _SERIES_TAGS}
+                                 for s in slides])
+        else:
+            self._count('studies')
+            studies = {s.study_uid: s for s in slides}.values()
+            self._json(handler, [{k: v for k, v in s.metadata(s.levels[0], False).items() if k in _STUDY_TAGS}
+                                 for s in studies])
+
+    def _frames(self, handler: BaseHTTPRequestHandler, slide: SyntheticSlide, instance: str,
+                numbers: Sequence[int]) -> None:
+        self._count('frames', len(numbers))
+        level = slide.level(instance)
+        if level is None or not numbers or any(n < 1 or n > level.number_of_frames for n in numbers):
+            self._send(handler, http.HTTPStatus.NOT_FOUND, b'', 'text/plain')
+            return
+        accept = handler.headers.get('Accept', '')
+        match = re.search(r'transfer-syntax\s*=\s*"?([0-9.*]+)', accept)
+        wanted = match.group(1) if match else slide.transfer_syntax_uid
+        if wanted in ('*', slide.transfer_syntax_uid):
+            syntax, frames = slide.transfer_syntax_uid, [slide.frame(instance, n) for n in numbers]
+        elif wanted == EXPLICIT_VR_LITTLE_ENDIAN:
+            # Transcode to native pixels
+            syntax, frames = wanted, [slide.frame_pixels(level, n).tobytes() for n in numbers]
+        else:
+            self._send(handler, http.HTTPStatus.NOT_ACCEPTABLE, b'', 'text/plain')
+            return
+        parts = []
+        for frame in frames:
+            parts.append(f'--{_BOUNDARY}\r\nContent-Type: application/octet-stream; transfer-syntax={syntax}'
+                         f'\r\n\r\n'.encode())
+            parts.append(frame)
+            parts.append(b'\r\n')
+        parts.append(f'--{_BOUNDARY}--\r\n'.encode())
+        self._send(handler, http.HTTPStatus.OK, b''.join(parts),
+                   f'multipart/related; type="application/octet-stream"; boundary={_BOUNDARY}')
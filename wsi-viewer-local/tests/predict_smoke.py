@@ -4,24 +4,15 @@ import sys
 import json
 import requests
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import series_catalog  # noqa: E402
+
 
 def get_any_series(orthanc_base: str):
-    studies = requests.get(f"{orthanc_base.rstrip('/')}/studies").json()
-    if not studies:
-        return None
-    for sid in studies:
-        study = requests.get(f"{orthanc_base.rstrip('/')}/studies/{sid}").json()
-        study_uid = study.get('MainDicomTags', {}).get('StudyInstanceUID')
-        for ser_id in study.get('Series', []):
-            series = requests.get(f"{orthanc_base.rstrip('/')}/series/{ser_id}").json()
-            series_uid = series.get('MainDicomTags', {}).get('SeriesInstanceUID')
-            insts = series.get('Instances', [])
-            if insts:
-                inst_id = insts[0]
-                inst = requests.get(f"{orthanc_base.rstrip('/')}/instances/{inst_id}").json()
-                instance_uid = inst.get('MainDicomTags', {}).get('SOPInstanceUID')
-                return study_uid, series_uid, instance_uid
-    return None
+    # Local catalog synced from Orthanc's change feed, instead of walking every resource
+    catalog = series_catalog.SeriesCatalog(orthanc_base)
+    catalog.sync()
+    return catalog.any_series()
 
 
 def main():
@@ -27,7 +27,8 @@ def main() -> int:
         print(f"Failed to import server: {e}")
         return 1
 
-    app = create_app()
+    # Skip the background model load; readiness should report not ready
+    app = create_app(warm_load=False)
     client = app.test_client()
 
     # Index should serve the shell page
@@ -54,6 +55,53 @@ def main() -> int:
         print("/dicom/* unexpectedly succeeded without DICOM_SERVER_URL")
         return 1
 
+    # Local slide listing works without OpenSlide or any slides
+    r = client.get("/slides")
+    if r.status_code != 200 or not isinstance(r.get_json().get("slides"), list):
+        print(f"GET /slides unexpected response: {r.status_code}")
+        return 1
+    r = client.get("/slides/missing.svs.dzi")
+    if r.status_code != 404:
+        print(f"GET /slides/missing.svs.dzi unexpected status: {r.status_code}")
+        return 1
+
+    # The series catalog needs an Orthanc to sync from
+    r = client.get("/series")
+    if r.status_code != 503:
+        print(f"GET /series unexpected status without ORTHANC_URL: {r.status_code}")
+        return 1
+
+    # The profiler endpoints only exist with PROFILER_TOKEN
+    if not os.environ.get("PROFILER_TOKEN"):
+        r = client.post("/admin/profile?seconds=1")
+        if r.status_code == 202:
+            print("POST /admin/profile unexpectedly started a capture without PROFILER_TOKEN")
+            return 1
+
+    # Liveness is independent of the model; readiness waits for it
+    r = client.get("/healthz")
+    if r.status_code != 200 or r.get_json().get("model", {}).get("state") != "idle":
+        print(f"GET /healthz unexpected response: {r.status_code} {r.data!r}")
+        return 1
+    r = client.get("/readyz")
+    if r.status_code != 503 or "Retry-After" not in r.headers:
+        print(f"GET /readyz unexpected response before model load: {r.status_code}")
+        return 1
+
+    # Revalidating an immutable frame is answered locally (upstream is unreachable)
+    from server import immutable_etag  # type: ignore
+    os.environ["DICOM_SERVER_URL"] = "http://127.0.0.1:9/dicom-web"
+    try:
+        proxy = create_app(warm_load=False).test_client()
+    finally:
+        del os.environ["DICOM_SERVER_URL"]
+    frame = "studies/1/series/2/instances/3/frames/1"
+    etag = immutable_etag(f"http://127.0.0.1:9/dicom-web/{frame}", "")
+    r = proxy.get(f"/dicom/{frame}", headers={"If-None-Match": etag})
+    if r.status_code != 304 or r.headers.get("ETag") != etag or "immutable" not in r.headers.get("Cache-Control", ""):
+        print(f"Conditional frame request unexpected response: {r.status_code} {dict(r.headers)}")
+        return 1
+
     print("WSI viewer smoke tests passed.")
     return 0
 
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Check that modules shared with path-foundation-demo have not drifted.
+
+frame_cache.py and sampling_profiler.py are kept in both apps, each
+formatted in its app's style. The copies must have the same syntax tree;
+docstrings are compared with whitespace collapsed, since indentation inside
+them follows the style.
+Skipped when path-foundation-demo is not next to this folder (e.g. in the
+container).
+"""
+
+import ast
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+OTHER = ROOT.parent / "path-foundation-demo"
+SHARED = ("frame_cache.py", "sampling_profiler.py")
+
+
+def _normalized(path: Path) -> str:
+    tree = ast.parse(path.read_text())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            node.value = " ".join(node.value.split())
+    return ast.dump(tree)
+
+
+def main() -> int:
+    if not OTHER.is_dir():
+        print(f"Skipped: {OTHER} not found.")
+        return 0
+    drifted = [name for name in SHARED if _normalized(ROOT / name) != _normalized(OTHER / name)]
+    if drifted:
+        print(f"Shared modules differ from path-foundation-demo: {', '.join(drifted)}")
+        return 1
+    print("Shared modules match.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""
+Zero-shot patch classification against text prompts with MedSigLIP.
+
+Prompt embeddings are computed once per (model, prompt) and kept in memory
+and on disk (one .npy per prompt under MEDSIGLIP_PROMPT_CACHE_DIR), so prompt
+sets such as ["tumor", "stroma", "necrosis"] cost nothing after first use,
+across requests, workers and restarts.
+
+Scoring is one matrix multiply of the (patches, dim) image embeddings with
+the normalized (prompts, dim) text embeddings, divided by the image norms,
+followed by SigLIP's per-pair sigmoid(scale * cosine + bias). Each patch gets the best
+prompt and its score; the full (patches, prompts) score grid is optional.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+_DEFAULT_DIR = os.environ.get(
+    'MEDSIGLIP_PROMPT_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'medsiglip', 'prompts'))
+# Patches scored per matrix multiply; bounds the (rows, prompts) temporaries
+_SCORE_ROWS = 65536
+
+
+def _normalized(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    return x / np.maximum(norms, np.finfo(np.float32).tiny)
+
+
+class PromptEmbeddingStore:
+    """Memory and disk cache of normalized text embeddings for one model."""
+
+    def __init__(
+        self,
+        model_id: str,
+        embed_texts: Callable[[List[str]], np.ndarray],
+        directory: Optional[str] = _DEFAULT_DIR,
+    ) -> None:
+        """embed_texts maps prompts to (len(prompts), dim) embeddings; directory None keeps memory only."""
+        self._model_id = model_id
+        self._embed_texts = embed_texts
+        self._directory = directory
+        self._memory: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, prompt: str) -> str:
+        return hashlib.sha256(f"{self._model_id}\0{prompt}".encode('utf-8')).hexdigest()[:32]
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._directory, f"{key}.npy")
+
+    def _load(self, key: str) -> Optional[np.ndarray]:
+        if not self._directory:
+            return None
+        try:
+            return np.load(self._path(key), allow_pickle=False)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, key: str, embedding: np.ndarray) -> None:
+        if not self._directory:
+            return
+        try:
+            os.makedirs(self._directory, exist_ok=True)
+            # Write then rename so concurrent workers never read a partial file
+            fd, tmp = tempfile.mkstemp(dir=self._directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, embedding, allow_pickle=False)
+            os.replace(tmp, self._path(key))
+        except OSError:
+            pass  # Disk cache is best effort; memory still holds the embedding
+
+    def get(self, prompts: Sequence[str]) -> np.ndarray:
+        """Returns (len(prompts), dim) normalized float32 embeddings."""
+        keys = [self._key(p) for p in prompts]
+        with self._lock:
+            found = {k: self._memory[k] for k in keys if k in self._memory}
+        for key in set(keys) - set(found):
+            embedding = self._load(key)
+            if embedding is not None:
+                found[key] = embedding
+        missing = [(k, p) for k, p in dict(zip(keys, prompts)).items() if k not in found]
+        if missing:
+            embeds = _normalized(np.asarray(self._embed_texts([p for _, p in missing]), dtype=np.float32))
+            for (key, _), embedding in zip(missing, embeds):
+                found[key] = embedding
+                self._save(key, embedding)
+        with self._lock:
+            self._memory.update(found)
+        return np.stack([found[k] for k in keys]).astype(np.float32, copy=False)
+
+
+def score(
+    image_embeddings: np.ndarray,
+    text_embeddings: np.ndarray,
+    logit_scale: float = 1.0,
+    logit_bias: float = 0.0,
+    include_scores: bool = False,
+) -> Dict[str, np.ndarray]:
+    """Scores every patch against every prompt.
+
+    Returns label_index (patches,) of the best prompt, score (patches,) its
+    sigmoid probability and, if include_scores, scores (patches, prompts).
+    """
+    image_embeddings = np.asarray(image_embeddings, dtype=np.float32)
+    text_t = np.ascontiguousarray(_normalized(np.asarray(text_embeddings, dtype=np.float32)).T)
+    n = image_embeddings.shape[0]
+    label_index = np.empty(n, dtype=np.int32)
+    best = np.empty(n, dtype=np.float32)
+    scores = np.empty((n, text_t.shape[1]), dtype=np.float32) if include_scores else None
+    with np.errstate(over='ignore'):  # exp overflow -> inf -> score 0
+        _score_rows(image_embeddings, text_t, logit_scale, logit_bias, label_index, best, scores)
+    result = {'label_index': label_index, 'score': best}
+    if scores is not None:
+        result['scores'] = scores
+    return result
+
+
+def _score_rows(image_embeddings, text_t, logit_scale, logit_bias, label_index, best, scores) -> None:
+    for start in range(0, image_embeddings.shape[0], _SCORE_ROWS):
+        rows = image_embeddings[start:start + _SCORE_ROWS]
+        logits = rows @ text_t
+        # Cosine via the (rows, prompts) product rather than a normalized copy of rows
+        norms = np.sqrt(np.einsum('ij,ij->i', rows, rows))
+        logits *= (logit_scale / np.maximum(norms, np.finfo(np.float32).tiny))[:, None]
+        logits += logit_bias
+        idx = logits.argmax(axis=1)
+        label_index[start:start + len(idx)] = idx
+        # Sigmoid is monotonic, so only the chosen logits need it for best
+        chosen = logits[np.arange(len(idx)), idx]
+        best[start:start + len(idx)] = 1.0 / (1.0 + np.exp(-chosen))
+        if scores is not None:
+            np.negative(logits, out=logits)
+            np.exp(logits, out=logits)
+            logits += 1.0
+            np.reciprocal(logits, out=scores[start:start + len(idx)])